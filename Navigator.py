@@ -1,13 +1,37 @@
 from RemoteMotorController import RemoteMotorController
+from steering import SteeringController
+from state_machine import StateMachine, Transition, ANY, TIMEOUT
+from metrics import registry
+from tracing import tracer
+from collections import deque
 import logging as log
 import sys
 import threading
 import asyncio
 import time
 
+# Navigator states
+IDLE = "idle"           # No plant in view, a random walk starts after search_delay
+SEARCH = "search"       # Random walk
+FOLLOW = "follow"       # Driving towards a plant
+TURN = "turn"           # Waiting for the EV3 to finish a turn towards a plant
+ESCAPE = "escape"       # Random walk away from a plant just approached or given up on, for escape_delay
+
+# Navigator events
+PLANT = "plant"
+NO_PLANT = "no_plant"
+TURN_COMPLETE = "turn_complete"
+START_SEARCH = "start_search"
+REAR_PLANT = "rear_plant"   # Plant seen by the rear camera
+
+
 class Navigator:
     """
     Navigation module for GrowBot robot.
+
+    Navigation is a StateMachine driven by frames, sensor readings and EV3 completions. Every delay is a timeout in
+    seconds rather than a number of frames, so the robot behaves the same whatever the frame rate. The transition
+    table is in __transitions, recent state changes are kept in transition_log().
     """
 
     def sender_action(self, rm, loop):
@@ -27,8 +51,13 @@ class Navigator:
                  escape_delay=15,
                  constant_delta=6,
                  verbose=False,
-                 approach_frame_timeout=8,
-                 random_search_frame_timeout=12):
+                 search_delay=1.0,
+                 follow_timeout=60,
+                 turn_timeout=5,
+                 steering_mode="discrete",
+                 steering_controller=None,
+                 remote_motor_controller=None,
+                 connect=True):
         """
         Constructor for Navigator class.
         :param robot_controller:        RobotController instance coordinating vision and motor control
@@ -37,6 +66,18 @@ class Navigator:
         :param escape_delay:            Amount of time in seconds to allow robot move away from a plant until following
                                         next one
         :param verbose:                 Verbosity flag
+        :param search_delay:            Time in seconds without a plant in view before starting a random walk
+        :param follow_timeout:          Time in seconds after which a plant not reached yet is given up on, e.g.
+                                        because the robot is stuck against something
+        :param turn_timeout:            Time in seconds to wait for the EV3 to report a turn as complete before
+                                        resuming anyway
+        :param steering_mode:           "discrete" to follow plants with separate turn and forward commands,
+                                        "continuous" to stream wheel speeds from steering_controller every frame
+        :param steering_controller:     SteeringController used in continuous mode, a default one if None
+        :param remote_motor_controller: Motor controller to use instead of a websocket backed RemoteMotorController,
+                                        e.g. for simulation
+        :param connect:                 Whether to connect the RemoteMotorController to the EV3 over websockets, False
+                                        if the caller links it up itself
         """
         # log.basicConfig(format="[ %(asctime)s ] [ %(levelname)s ] %(message)s", level=log.INFO, stream=sys.stdout)
 
@@ -47,19 +88,13 @@ class Navigator:
         self.constant_delta = constant_delta
         self.verbose = verbose
 
-        self.prediction_dict = {"plants": [], "obstacles": []}
-
-        # Navigator states.
-        self.random_search_mode = False
-        self.follow_mode = False
-        self.escape_mode = False
-        self.escape_mode_time = time.time()
-
-        self.random_search_frame_timeout = random_search_frame_timeout
-        self.approach_frame_timeout = approach_frame_timeout
+        # Latest predictions of every camera by name, the front camera's drive the navigator
+        self.camera_predictions = {"front": {"plants": [], "obstacles": []}}
+        self.prediction_dict = self.camera_predictions["front"]
 
-        self.random_search_timeout_counter = self.random_search_frame_timeout
-        self.approach_frame_counter = self.approach_frame_timeout
+        self.search_delay = search_delay
+        self.follow_timeout = follow_timeout
+        self.turn_timeout = turn_timeout
 
         # Frame details.
         self.frame_width = 640
@@ -70,10 +105,26 @@ class Navigator:
         # Single-frame buffer.
         self.previous_plant_prediction = None
 
-        self.frame_count = None
+        self.steering_mode = steering_mode
+        self.steering_controller = steering_controller if steering_controller is not None else SteeringController()
+
+        # Navigator states.
+        self.machine = StateMachine(IDLE, self.__transitions(),
+                                    timeouts={IDLE: search_delay, TURN: turn_timeout, ESCAPE: escape_delay},
+                                    clock=time.monotonic, on_transition=self.__on_transition, name="navigator")
+        self.escape_until = self.machine.clock()
+        self.ignore_until = self.machine.clock()    # Every plant is ignored until then after giving up on one
+        self.follow_until = None        # Deadline for reaching the plant followed, set when it is first seen
+        self.__events = deque()         # Events posted by other threads
+        self.__lock = threading.Lock()  # Held while the machine handles events
+
+        if remote_motor_controller is not None:
+            self.remote_motor_controller = remote_motor_controller
+            return
 
         self.remote_motor_controller = RemoteMotorController(self.robot_controller)
-        self.backing = False
+        if not connect:
+            return
 
         # Establish two websocket connections to new background threads
         ws_sender_loop = asyncio.new_event_loop()
@@ -86,29 +137,46 @@ class Navigator:
         ws_receiver_thread.setDaemon(True)
         ws_receiver_thread.start()
 
-    def on_new_frame(self, predictions):
+    @tracer.traced("navigator")
+    def on_new_frame(self, predictions, camera="front"):
         """
         Acts as an entry point to the class. Each new prediction is transformed here and then processed by the class.
         :param predictions:     Class predictions produced by the VPU
+        :param camera:          Name of the camera they come from. Plants seen by the "rear" one turn the robot around
+                                while it's not following one, other cameras' predictions are only kept
         :return:
         """
+        prediction_dict = self.camera_predictions.setdefault(camera, {"plants": [], "obstacles": []})
+
         # Separate class labels and transform inputs.
-        self.prediction_dict["plants"] = [self.process_bb_coordinates(x) for x in predictions if x[0] == "Plant"]
-        self.prediction_dict["obstacles"] = [self.process_bb_coordinates(x) for x in predictions if x[0] == "Obstacle"]
+        prediction_dict["plants"] = [self.process_bb_coordinates(x) for x in predictions if x[0] == "Plant"]
+        prediction_dict["obstacles"] = [self.process_bb_coordinates(x) for x in predictions if x[0] == "Obstacle"]
 
         # Sort predictions in descending order based on bounding box to frame midpoint distance.
-        self.prediction_dict["plants"].sort(key=lambda tup: abs(self.frame_midpoint - tup[0]))
-        self.prediction_dict["obstacles"].sort(key=lambda tup: abs(self.frame_midpoint - tup[0]))
+        prediction_dict["plants"].sort(key=lambda tup: abs(self.frame_midpoint - tup[0]))
+        prediction_dict["obstacles"].sort(key=lambda tup: abs(self.frame_midpoint - tup[0]))
+
+        if camera != "front":
+            if camera == "rear" and prediction_dict["plants"]:
+                self.__post(REAR_PLANT, prediction_dict["plants"][0])
+            return
 
-        # Change state given new frame.
-        self.change_state_on_new_frame()
+        # Change state given new frame. Another thread may be running a transition whose motor command takes a
+        # while, the frame is stale by the time it finishes.
+        if not self.__lock.acquire(blocking=False):
+            log.debug("[navigator] Busy, dropping frame")
+            return
+        try:
+            self.__drain()
+            self.change_state_on_new_frame()
+        finally:
+            self.__lock.release()
 
     def change_state_on_new_frame(self):
         """
         Changes state of the class after new predictions are received.
         :return:
         """
-
         if not self.robot_controller.approach_complete:
             log.info("\033[0;32m[change_state_on_new_frame] Plant approached, skipping this frame\033[0m")
             return
@@ -122,72 +190,197 @@ class Navigator:
             return
             # Send stop?
 
-        # Wait n frames until turn is complete
-        if self.frame_count is not None:
-            if self.frame_count is not 0:
-                self.frame_count = self.frame_count - 1
-                return
-
-        if self.escape_mode:
-            if (time.time() - self.escape_mode_time) >= self.escape_delay:
-                self.escape_mode = False
-                log.info("[change_state_on_new_frame] Escape mode disabled.")
-
         if self.prediction_dict["plants"]:
-            # Plant detected.
-
-            #if self.plant_discovery_frame_count is not 0:
-            #    self.plant_discovery_frame_count = self.plant_discovery_frame_count - 1
-            #    return
-            #else:
-            #    self.plant_discovery_frame_count = 5
-
-            if self.prediction_dict["plants"]:
-                plant = next(iter(self.prediction_dict["plants"]))
-            else:
-                # Shouldn't really be here but might happen.
-                return
-
-            if self.escape_mode:
-                # Operating in escape mode. Ignore detection with bb_area greater than threshold.
-                if not self.is_plant_approached(plant):
-                    self.follow_plant_aux(plant)
-            else:
-                # Operating in normal mode.
-                self.robot_controller.on_plant_seen()
-                self.robot_controller.read_qr_code()
-                self.follow_plant_aux(plant)
+            # Plant detected, follow the one closest to the centre.
+            self.machine.handle(PLANT, self.prediction_dict["plants"][0])
         else:
-            # Plant not detected. Perform random search if not searching already.
-            if not self.random_search_mode:
-                # TODO: get rid of hardcoded values.
+            self.machine.handle(NO_PLANT)
 
-                if self.random_search_timeout_counter is not 0:
-                    self.random_search_timeout_counter = self.random_search_timeout_counter - 1
-                else:
-                    self.random_search_timeout_counter = 8
+    def on_sensor_data(self):
+        """
+        Called with every sensor reading from the EV3, so timeouts fire even while frames are slow to come.
+        :return:
+        """
+        self.__post()
 
-                    log.info("\033[0;35m[change_state_on_new_frame] Performing random walk...\033[0m")
-                    self.random_search_mode = True
-                    self.remote_motor_controller.random_walk()
+    def on_turn_complete(self, status):
+        """
+        Called once the EV3 finished the last turn, so following resumes with the next frame.
+        :param status:  Completion status reported by the EV3
+        :return:
+        """
+        log.info("[on_turn_complete] Turn %s.", status)
+        self.__post(TURN_COMPLETE)
 
-    def follow_plant_aux(self, plant):
+    def start_search(self):
         """
-        Helper function for plant following.
-        :param plant:   Plant to be followed.
+        Starts a random walk, whatever the navigator was doing.
         :return:
         """
-        if self.random_search_mode:
+        self.__post(START_SEARCH)
+
+    def __post(self, event=None, *args):
+        # Events from other threads are queued. They are handled right away unless another event is being handled, in
+        # which case the next frame handles them, so callers never wait for motor commands to return.
+        if event is not None:
+            self.__events.append((event, args))
+        if self.__lock.acquire(blocking=False):
+            try:
+                self.__drain()
+                if self.__ready():
+                    self.machine.poll()
+            finally:
+                self.__lock.release()
+
+    def __drain(self):
+        while self.__events:
+            event, args = self.__events.popleft()
+            if event == REAR_PLANT and not self.__ready():
+                # Stale by the time the robot is ready again
+                continue
+            self.machine.handle(event, *args)
+
+    def __ready(self):
+        return (self.robot_controller.approach_complete and not self.robot_controller.retrying_approach
+                and self.remote_motor_controller.front_sensor_value is not None
+                and self.remote_motor_controller.back_sensor_value is not None)
+
+    def __transitions(self):
+        """
+        :return:    Transition table of the navigator, see the class docstring
+        """
+        seeing = (IDLE, SEARCH, FOLLOW, ESCAPE)
+        continuous = lambda *_: self.steering_mode == "continuous"
+        return [
+            # A plant that can't be reached, e.g. because of an obstacle, is given up on and plants are ignored for a
+            # while to get away from it. Plants right in front are ignored for a while after one was approached
+            Transition(FOLLOW, PLANT, ESCAPE, lambda plant: self.follow_until is not None
+                       and self.machine.clock() >= self.follow_until, self.__give_up),
+            Transition(seeing, PLANT, None, lambda plant: self.machine.clock() < self.ignore_until),
+            Transition(seeing, PLANT, None, lambda plant: self.escape_mode and self.is_plant_approached(plant)),
+            Transition(seeing, PLANT, ESCAPE, lambda plant: self.is_plant_approached(plant) and self.is_centered_plant(plant),
+                       self.__approached),
+            Transition(seeing, PLANT, FOLLOW, self.is_plant_approached, self.__retry_approach),
+            Transition(seeing, PLANT, FOLLOW, continuous, self.__steer),
+            Transition(seeing, PLANT, FOLLOW, self.is_centered_plant, self.__go_forward),
+            Transition(seeing, PLANT, TURN, None, self.__turn),
+            # Plants behind the robot are turned to while there is none in front
+            Transition((IDLE, SEARCH), REAR_PLANT, TURN, lambda plant: self.machine.clock() >= self.ignore_until
+                       and not self.escape_mode, self.__turn_around),
+            Transition(TURN, TURN_COMPLETE, FOLLOW),
+            Transition(TURN, TIMEOUT, FOLLOW, None, self.__turn_timed_out),
+            # Lost the plant, don't keep driving on the last set point in continuous mode
+            Transition(FOLLOW, NO_PLANT, IDLE, continuous, self.stop_steering),
+            Transition(FOLLOW, NO_PLANT, IDLE),
+            # Plant not seen for search_delay, perform random search
+            Transition(IDLE, TIMEOUT, SEARCH, None, self.__random_walk),
+            Transition(ESCAPE, TIMEOUT, SEARCH, None, lambda: log.info("[navigator] Escape mode disabled.")),
+            Transition(ANY, START_SEARCH, SEARCH, None, self.__random_walk),
+        ]
+
+    def __on_transition(self, record):
+        registry.counter("growbot_navigator_transitions_total", "Navigator state changes",
+                         **{"from": record.source, "to": record.target}).inc()
+
+    def __engage(self):
+        """
+        Common part of every reaction to a plant coming into view.
+        :return:
+        """
+        if not self.escape_mode:
+            self.robot_controller.on_plant_seen()
+        self.robot_controller.read_qr_code()
+        if self.machine.previous in (SEARCH, ESCAPE):
             # Stop random search.
-            self.random_search_mode = False
             self.remote_motor_controller.stop()
-            self.approach_frame_counter = 8
+        if self.machine.previous in (SEARCH, ESCAPE) or self.follow_until is None:
+            # Losing sight of the plant for less than search_delay doesn't start over
+            self.follow_until = self.machine.clock() + self.follow_timeout
+
+    def __approached(self, plant):
+        self.__engage()
+        log.info("\033[0;32m[follow_plant] Plant found in the centre.\033[0m")
+
+        # Plant is in front of the robot. Stop the robot and switch to escape mode.
+        log.info("\033[1;37;42m[follow_plant] Plant approached.\033[0m")
+        registry.counter("growbot_navigator_approaches_total", "Plants approached", result="centred").inc()
+        self.escape_until = self.machine.clock() + self.escape_delay
+        self.steering_controller.reset()
+        self.remote_motor_controller.stop()
+
+        # Report to robot controller.
+        self.robot_controller.on_plant_found()
+
+        # Start another random walk, escape mode ends after escape_delay seconds.
+        self.remote_motor_controller.random_walk()
+
+    def __retry_approach(self, plant):
+        self.__engage()
+        log.info("\033[0;33m[follow_plant] Plant not in the centre.\033[0m")
+        registry.counter("growbot_navigator_approaches_total", "Plants approached", result="retry").inc()
+        self.remote_motor_controller.retry_approach()
+
+    def __steer(self, plant):
+        self.__engage()
+        self.steer(plant)
+
+    def __go_forward(self, plant):
+        self.__engage()
+        log.info("\033[0;32m[follow_plant] Plant found in the centre.\033[0m")
+        log.debug("[follow_plant] Front sensor: %s", self.remote_motor_controller.front_sensor_value)
+        log.info("\033[0;32m[follow_plant] Moving forward...\033[0m")
+        # Plant is not in front of the robot.
+        self.remote_motor_controller.go_forward()
+
+    def __turn(self, plant):
+        self.__engage()
+        log.info("\033[0;33m[follow_plant] Plant not in the centre.\033[0m")
+        mdelta = self.get_midpoint_delta(plant)
+
+        # angle = self.angle_model.predict([[area, mdelta]])[0][0] *.65
+        angle = 62.2 / 640 * mdelta
+
+        # Frames are ignored until the EV3 reports the turn complete or turn_timeout passes
+        if self.get_bb_midpoint(plant) > self.frame_midpoint:
+            # Turn right
+            log.info("\033[0;33m[follow_plant] Turning right by %s degrees...\033[0m", angle)
+            registry.counter("growbot_navigator_turns_total", "Turns issued", direction="right").inc()
+            self.remote_motor_controller.turn_right(angle)
+        else:
+            # Turn left.
+            log.info("\033[0;33m[follow_plant] Turning left by %s degrees...\033[0m", angle)
+            registry.counter("growbot_navigator_turns_total", "Turns issued", direction="left").inc()
+            self.remote_motor_controller.turn_left(angle)
 
-        if not self.follow_mode:
-            # Switch state
-            self.follow_mode = True
+    def __turn_around(self, plant):
+        if self.machine.previous == SEARCH:
+            # Stop random search.
+            self.remote_motor_controller.stop()
+        # The rear camera looks backwards, a plant right of its centre is behind the robot's left
+        angle = 180 - 62.2 / 640 * self.get_midpoint_delta(plant)
+        registry.counter("growbot_navigator_turns_total", "Turns issued", direction="around").inc()
+        if self.get_bb_midpoint(plant) > self.frame_midpoint:
+            log.info("\033[0;33m[navigator] Plant behind, turning left by %s degrees...\033[0m", angle)
+            self.remote_motor_controller.turn_left(angle)
+        else:
+            log.info("\033[0;33m[navigator] Plant behind, turning right by %s degrees...\033[0m", angle)
+            self.remote_motor_controller.turn_right(angle)
+
+    def __give_up(self, plant):
+        log.warning("[navigator] Plant not reached within %ss, giving up on it.", self.follow_timeout)
+        registry.counter("growbot_navigator_approaches_total", "Plants approached", result="given_up").inc()
+        self.follow_until = None
+        self.escape_until = self.ignore_until = self.machine.clock() + self.escape_delay
+        self.steering_controller.reset()
+        self.__random_walk()
 
-        self.follow_plant(plant)
+    def __turn_timed_out(self):
+        log.warning("[navigator] No turn completion within %ss, resuming.", self.turn_timeout)
+        registry.counter("growbot_navigator_turn_timeouts_total", "Turns never reported complete").inc()
+
+    def __random_walk(self):
+        log.info("\033[0;35m[navigator] Performing random walk...\033[0m")
+        self.remote_motor_controller.random_walk()
 
     @staticmethod
     def process_bb_coordinates(prediction):
@@ -200,91 +393,43 @@ class Navigator:
 
         return xmin + (xmax - xmin) / 2, ((xmin, ymin), (xmax, ymax))
 
-    def follow_plant(self, plant):
+    def steer(self, plant):
         """
-        Application logic for plant following procedure.
+        Continuous following: turns the plant's offset and size into wheel speeds for this frame.
         :param plant:   Plant to be followed.
         :return:
         """
-        log.info("\033[0;33m[follow_plant] Following a plant...\033[0m")
-        self.robot_controller.read_qr_code()
+        error = (self.get_bb_midpoint(plant) - self.frame_midpoint) / self.frame_midpoint
+        area_ratio = self.get_bb_area(plant) / self.frame_area
 
-        if self.is_plant_approached(plant):
-            # Count frames to skip.
-            # if self.approach_frame_counter is not 0:
-            #     self.remote_motor_controller.stop()
-            #     log.info("Potential approach, skipping this frame")
-            #     self.approach_frame_counter = self.approach_frame_counter - 1
-            #     return
-            # else:
-            #     self.approach_frame_counter = self.approach_frame_timeout
-
-            if self.is_centered_plant(plant):
-                self.backing = False
-                log.info("\033[0;32m[follow_plant] Plant found in the centre.\033[0m")
-
-                # Plant is in front of the robot. Stop the robot and switch to escape mode.
-                log.info("\033[1;37;42m[follow_plant] Plant approached.\033[0m")
-                self.enable_escape_mode()
-                self.follow_mode = False
-                self.remote_motor_controller.stop()
-
-                # Read the QR code and make a decision here
-                # self.robot_controller.read_qr_code()
-                # If this QR code is the same as the last QR code read, skip this plant to another plant
-                # if self.robot_controller.last_qr_approached != self.robot_controller.current_qr_approached and self.robot_controller.current_qr_approached is not None:
-                    # log.info("Plant is found and QR is read, continue")
-                    # Report to robot controller.
-                self.robot_controller.on_plant_found()
-
-                # Start another random walk.
-                self.random_search_mode = True
-                self.remote_motor_controller.random_walk()
-
-                # Disable escape mode after escape_delay seconds.
-                threading.Thread(target=self.disable_escape_mode_threaded, daemon=True).start()
-            else:
-                log.info("\033[0;33m[follow_plant] Plant not in the centre.\033[0m")
-                self.remote_motor_controller.retry_approach()
-        else:
-            if self.is_centered_plant(plant):
-                self.backing = False
-                log.info("\033[0;32m[follow_plant] Plant found in the centre.\033[0m")
-
-                print(self.remote_motor_controller.front_sensor_value)
-                log.info("\033[0;32m[follow_plant] Moving forward...\033[0m")
-                # Plant is not in front of the robot.
-                self.remote_motor_controller.go_forward()
-            else:
-                log.info("\033[0;33m[follow_plant] Plant not in the centre.\033[0m")
-                area = self.get_bb_area(plant)
-                mdelta = self.get_midpoint_delta(plant)
-
-                #log.info("Area: {0}, MDelta: {1}".format(area,mdelta))
-
-                # angle = self.angle_model.predict([[area, mdelta]])[0][0] *.65
-                angle = 62.2 / 640 * mdelta
-
-                if self.get_bb_midpoint(plant) > self.frame_midpoint:
-                    # Turn right
-                    log.info("\033[0;33m[follow_plant] Turning right by {} degrees...\033[0m".format(angle))
-                    self.remote_motor_controller.turn_right(angle)
-                else:
-                    # Turn left.
-                    log.info("\033[0;33m[follow_plant] Turning left by {} degrees...\033[0m".format(angle))
-                    self.remote_motor_controller.turn_left(angle)
-
-                self.frame_count = 10
-
-    def disable_escape_mode_threaded(self):
-        time.sleep(self.escape_delay)
-        self.escape_mode = False
-        log.info("Escape mode disabled.")
-
-    def enable_escape_mode(self):
-        self.escape_mode_time = time.time()
-        self.escape_mode = True
-        log.info("Escape mode enabled.")
+        left, right = self.steering_controller.update(error, area_ratio, time.time())
+        self.remote_motor_controller.set_speed(left, right)
+
+    def stop_steering(self):
+        log.info("[stop_steering] Plant lost, stopping.")
+        self.steering_controller.reset()
+        self.remote_motor_controller.set_speed(0, 0)
+
+    @property
+    def random_search_mode(self):
+        return self.machine.state in (SEARCH, ESCAPE)
+
+    @property
+    def follow_mode(self):
+        return self.machine.state in (FOLLOW, TURN)
+
+    @property
+    def escape_mode(self):
+        """
+        True while plants right in front are ignored after an approach, which lasts escape_delay seconds.
+        """
+        return self.machine.clock() < self.escape_until
+
+    def transition_log(self):
+        """
+        :return:    Recent state changes as TransitionRecords, oldest first
+        """
+        return list(self.machine.log)
 
     def is_plant_approached(self, plant):
         """
@@ -323,7 +468,7 @@ class Navigator:
         :return:
         """
         delta = min(self.get_dynamic_delta(plant), 120)
-        log.info("Acceptance interval: {}".format(delta))
+        log.info("Acceptance interval: %s", delta)
 
         left = self.frame_midpoint - delta
         right = self.frame_midpoint + delta
@@ -332,7 +477,7 @@ class Navigator:
 
         flag = left <= bb_midpoint <= right
 
-        log.info("Left: {0}, Right: {1}, object_midpoint: {2}, Flag: {3}".format(left, right, bb_midpoint, flag))
+        log.info("Left: %s, Right: %s, object_midpoint: %s, Flag: %s", left, right, bb_midpoint, flag)
 
         return flag
 
@@ -363,6 +508,12 @@ class Navigator:
         """
         return self.constant_delta / (self.get_bb_area(plant) / self.frame_area)
 
+    def get_state(self):
+        """
+        :return:    Current state of the navigator, one of IDLE, SEARCH, FOLLOW, TURN and ESCAPE
+        """
+        return self.machine.state
+
     def get_random_search_mode(self):
         return self.random_search_mode
 
@@ -1,20 +1,26 @@
 #!/usr/bin/env python3
-from picamera import PiCamera
-from pyzbar.pyzbar import decode
 from time import sleep
 import cv2
-import imutils
 import logging as log
 import sys
 
+from offload import offload, PoolFull, PHOTO
+
 class QRReader:
     def __init__(self):
         self.found_id = None
 
     def identify(self, frame):
+        # Imported here, the simulation reads QR codes without zbar
+        from pyzbar.pyzbar import decode
         try:
-            # Read the saved picture into PIL frame
-            decoded = decode(frame)
+            # Read the saved picture into PIL frame, zbar runs without the GIL on the offload pool
+            try:
+                decoded = offload.submit(PHOTO, decode, frame).result()
+            except PoolFull:
+                # The vision thread waits for the codes anyway, it decodes them itself rather than going without
+                log.warning("[QR] Photo lane full, decoding inline")
+                decoded = decode(frame)
             qr_codes = set()
             for qr in decoded:
                 qr_string = qr.data.decode("utf-8")
@@ -7,6 +7,9 @@ import asyncio
 import json
 import config
 from remote import Remote, LogSeverity, LogType
+from metrics import registry
+from tracing import tracer
+from recording import recorder
 
 
 class RemoteMotorController:
@@ -17,10 +20,18 @@ class RemoteMotorController:
         self.ws_receiver = None
         self.ws_sender = None
         self.message = None
+        self.posted = None          # Trace ID and time of the pending message
+        self.last_action = None     # Action of the last command posted
         self.front_sensor_value = None
         self.back_sensor_value = None
         self.remote = self.robot_controller.remote
         self.ev3_turning_constant = None
+        self.sensor_updated = None
+        self.commands_sent = registry.counter("growbot_ev3_commands_sent_total", "Commands handed to the EV3 link")
+        self.commands_dropped = registry.counter("growbot_ev3_commands_dropped_total",
+                                                 "Commands replaced by a newer one before being sent")
+        registry.gauge("growbot_ev3_sensor_age_seconds", "Time since the last ultrasonic reading from the EV3",
+                       fn=self.sensor_age)
 
     def connect(self, port_nr=8866, sender=True):
         if sender:
@@ -38,12 +49,47 @@ class RemoteMotorController:
         log.info("Web socket connection established on {}:{}".format(websocket.host, websocket.port))
         self.ws_receiver = websocket
         while True:
-            if self.message is not None:
-                log.info("[Pi > EV3] Sending message \"{}\"".format(self.message))
-                yield from self.ws_receiver.send(self.message)
-                self.message = None
+            message = self.take_message()
+            if message is not None:
+                log.info("[Pi > EV3] Sending message \"%s\"", message)
+                yield from self.ws_receiver.send(message)
             pass
 
+    def take_message(self):
+        """
+        Hands out the pending command for the EV3, at most once.
+        :return:    JSON encoded command, None if there is none
+        """
+        message, self.message = self.message, None
+        if message is not None:
+            self.commands_sent.inc()
+        if message is not None and self.posted is not None:
+            trace_id, posted = self.posted
+            tracer.record("rmc_queue", posted, time.time(), trace_id)
+        return message
+
+    def __post(self, package):
+        # Commands carry the trace ID of the frame causing them over to the EV3
+        trace_id = tracer.current()
+        if trace_id is not None:
+            package["trace_id"] = trace_id
+            self.posted = (trace_id, time.time())
+        else:
+            self.posted = None
+        if self.message is not None:
+            self.commands_dropped.inc()
+        recorder.command(package)
+        self.last_action = package["action"]
+        self.message = json.dumps(package)
+
+    def sensor_age(self):
+        """
+        :return:    Seconds since the last sensor reading, None before the first one
+        """
+        if self.sensor_updated is None:
+            return None
+        return time.time() - self.sensor_updated
+
     @asyncio.coroutine
     def setup_receiver(self, websocket, path):
         log.info("Web socket connection established on {}:{}".format(websocket.host, websocket.port))
@@ -54,10 +100,11 @@ class RemoteMotorController:
 
 
     def process_message(self, msg):
+        recorder.message(msg)
         package = json.loads(msg)
         valid_message = True
         if package["type"] == "sensor":
-            log.info("[Pi < EV3] front_sensor: {}, back_sensor: {}".format(package["front_sensor"], package["back_sensor"]))
+            log.info("[Pi < EV3] front_sensor: %s, back_sensor: %s", package["front_sensor"], package["back_sensor"])
 
             if self.front_sensor_value is None:
                 self.front_sensor_value = [2550, 2550, 2550, 2550]
@@ -69,6 +116,8 @@ class RemoteMotorController:
 
             self.front_sensor_value.append(int(package["front_sensor"]))
             self.back_sensor_value.append((package["back_sensor"]))
+            self.sensor_updated = time.time()
+            self.robot_controller.on_sensor_data()
         elif package["type"] == "init":
             log.info("[Pi < EV3] Received init messages: {}".format(str(package)))
             self.ev3_turning_constant = package["turning_constant"]
@@ -88,6 +137,9 @@ class RemoteMotorController:
         elif package["type"] == "retry_complete":
             log.error("[Pi < EV3] Retry completed.")
             self.robot_controller.on_retry_complete()
+        elif package["type"] == "turn_complete":
+            log.info("[Pi < EV3] Turn completed, status: {}.".format(package["status"]))
+            self.robot_controller.on_turn_complete(package["status"])
         elif package["type"] == "approach_escape_complete":
             log.error("[Pi < EV3] Retry completed.")
             self.robot_controller.on_approach_escape_complete()
@@ -98,7 +150,7 @@ class RemoteMotorController:
             msg_send = ""
             if "message" in package:
                 msg_send = package["message"]
-            if package["type"] != "sensor":
+            if package["type"] not in ("sensor", "turn_complete"):
                 current_plant_id = None
                 if self.robot_controller.current_qr_approached is not None:
                     try:
@@ -115,7 +167,7 @@ class RemoteMotorController:
 
     def retry_approach(self):
         package = self.generate_action_package("retry_approach")
-        self.message = json.dumps(package)
+        self.__post(package)
         self.robot_controller.retrying_approach = True
         time.sleep(1)
 
@@ -124,7 +176,7 @@ class RemoteMotorController:
         package = self.generate_action_package("right")
         package["angle"] = deg
         package["turn_timed"] = False
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def turn_right_timed(self, time):
@@ -132,7 +184,7 @@ class RemoteMotorController:
         package = self.generate_action_package("right")
         package["turn_timed"] = True
         package["turn_turnTime"] = time
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def turn_left(self, deg):
@@ -140,7 +192,7 @@ class RemoteMotorController:
         package = self.generate_action_package("left")
         package["angle"] = deg
         package["turn_timed"] = False
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def turn_left_timed(self, time):
@@ -148,59 +200,66 @@ class RemoteMotorController:
         package = self.generate_action_package("left")
         package["turn_timed"] = True
         package["turn_turnTime"] = time
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def go_forward(self, forward_time=-1):
         # log.info("Going forward.")
         package = self.generate_action_package("forward")
         package["time"] = forward_time
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def go_backward(self, backup_time=-1):
         # log.info("Going backward.")
         package = self.generate_action_package("backward")
         package["time"] = backup_time
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
+    def set_speed(self, left, right):
+        # Streamed once per frame while steering, so unlike the other commands this doesn't wait afterwards
+        package = self.generate_action_package("speed")
+        package["left"] = left
+        package["right"] = right
+        self.__post(package)
+
     def random_walk(self):
         # log.info("Performing random walk.")
         package = self.generate_action_package("random")
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def stop(self):
         # log.info("Stopping.")
         package = self.generate_action_package("stop")
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def approached(self, raise_arm=True):
         # log.info("Plant approached.")
         package = self.generate_action_package("approached")
         package["raise_arm"] = raise_arm
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def approach_escape(self):
         package = self.generate_action_package("approach_escape")
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def random(self):
         # log.info("Triggering random walk.")
         package = self.generate_action_package("random")
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def arm_up(self):
         package = self.generate_action_package("arm_up")
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
 
     def arm_down(self):
         package = self.generate_action_package("arm_down")
-        self.message = json.dumps(package)
+        self.__post(package)
         time.sleep(1)
\ No newline at end of file
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 from Vision_SSD300 import Vision
+from frame_source import FrameSource
+from motion_gate import MotionGate
 from Navigator import Navigator
 from QRReader import QRReader
 import threading
@@ -7,66 +9,175 @@ import logging as log
 import sys
 from scheduler import Scheduler, Event
 from remote import Remote, RPCType
+from rpc_dispatch import HandlerMode
 import config
+import log_setup
 import asyncio
 import os
-import time
-import base64
-import cv2
 from serial_io import SerialIO
+from photo_upload import encode_photo
+from metrics import registry
+from tracing import tracer, install_dump_signal
+from recording import recorder
+from offload import offload, PHOTO, PoolFull
+from startup import Startup
 import json
+import functools
 
 class RobotController:
     model_xml = '/home/student/ssd300.xml'
     model_bin = '/home/student/ssd300.bin'
 
-    def __init__(self):
-        self.vision = Vision(
-                        RobotController.model_xml,
-                        RobotController.model_bin,
-                        self,
-                        is_headless=True,
-                        live_stream=True,
-                        confidence_interval=0.5)
-
+    def __init__(self, vision=None, qr_reader=None, serial_io=None, remote=None, scheduler=None, connect_ev3=True):
+        """
+        Constructor for RobotController class. Every subsystem talking to hardware or the API is built here unless
+        one is passed in, which is how the simulator runs this class.
+        :param vision:                  Frame source calling process_visual_data from its start(), Vision if None
+        :param qr_reader:               Object with identify(frame), QRReader if None
+        :param serial_io:               Soil moisture reader with start(), SerialIO on /dev/ttyACM0 if None
+        :param remote:                  Already connected API client, a Remote connected on its own thread if None and
+                                        config.RESPOND_TO_API is set
+        :param scheduler:               Scheduler used with a given remote, a default one if None
+        :param connect_ev3:             Whether to wait for the EV3 on the usual websocket ports, False if the caller
+                                        links navigator.remote_motor_controller up itself
+        """
         self.received_frame = None
-        self.qr_reader = QRReader()
         self.last_qr_approached = None
         self.current_qr_approached = None
         self.approach_complete = True
         self.retrying_approach = False
         self.standby_mode = True
         self.standby_invoked = True
-        self.serial_io = SerialIO('/dev/ttyACM0', 115200, self)
         self.actions = {}
         self.watered = False
 
-        if config.RESPOND_TO_API:
+        # Subsystems that don't depend on each other start concurrently, the model loading onto the VPU takes longest
+        self.startup = Startup()
+        self.startup.add("vision", lambda: self.__start_vision(vision))
+        self.startup.add("qr_reader", lambda: self.__start_qr_reader(qr_reader))
+        self.startup.add("serial_io", lambda: self.__start_serial_io(serial_io))
+        self.startup.add("remote", lambda: self.__start_remote(remote, scheduler))
+        self.startup.add("navigator", lambda: self.__start_navigator(connect_ev3))
+        # Frames are processed from now on, which takes the navigator and the QR reader
+        self.startup.add("vision_loop", self.__start_vision_loop, depends=("vision", "qr_reader", "navigator"))
+        self.startup.start()
+        self.startup.join()
+        for name in self.startup.subsystems:
+            self.startup.wait(name)
+
+    def __start_vision(self, vision):
+        if vision is None:
+            if getattr(config, "INFERENCE_PROCESS", False):
+                # Imported only here, multiprocessing.shared_memory is new in Python 3.8
+                try:
+                    from inference_process import InferenceProcess
+                except ImportError as e:
+                    raise RuntimeError("INFERENCE_PROCESS needs Python 3.8 or later, set it to False on Python {}.{}: "
+                                       "{}".format(sys.version_info[0], sys.version_info[1], e))
+                vision = InferenceProcess(inference_process_vision, self,
+                                          max_frame=getattr(config, "CAMERA_RESOLUTION", (640, 480)))
+            else:
+                vision = self.build_vision(self)
+        self.vision = vision
+
+    @staticmethod
+    def build_vision(robot_controller):
+        """
+        :param robot_controller:    RobotController handed the detections, or what stands in for it in the inference
+                                    process
+        :return:                    Vision set up from config, not started
+        """
+        refresh = getattr(config, "INFERENCE_REFRESH", 1.0)
+        motion_gate = MotionGate(refresh_interval=refresh) if refresh is not None else None
+        sources = {"front": RobotController.camera(0)}
+        rear = getattr(config, "REAR_CAMERA", None)
+        if rear is not None:
+            sources["rear"] = RobotController.camera(rear)
+        return Vision(
+                    RobotController.model_xml,
+                    RobotController.model_bin,
+                    robot_controller,
+                    is_headless=True,
+                    live_stream=True,
+                    confidence_interval=0.5,
+                    frame_source=sources,
+                    motion_gate=motion_gate,
+                    crop_count=getattr(config, "VISION_CROPS", 0),
+                    camera_weights=getattr(config, "CAMERA_WEIGHTS", None),
+                    network_cache=getattr(config, "NETWORK_CACHE", "~/.cache/growbot/networks"))
+
+    def __start_qr_reader(self, qr_reader):
+        self.qr_reader = qr_reader if qr_reader is not None else QRReader()
+
+    def __start_serial_io(self, serial_io):
+        self.serial_io = serial_io if serial_io is not None else SerialIO('/dev/ttyACM0', 115200, self)
+        # Soil moisture is read and reported in the background from now on
+        self.serial_io.start()
+
+    def __start_remote(self, remote, scheduler):
+        connect = False
+        if remote is None and config.RESPOND_TO_API:
             host = config.API_HOST
             if config.API_SECURE:
                 host = "wss://"+host
             else:
                 host = "ws://"+host
 
-            self.remote = Remote(config.UUID, host)
+            remote = Remote(config.UUID, host)
+            connect = True
+
+        if remote is not None:
+            self.remote = remote
+            # All of these end up waiting on the motor controller or the disk. Each runs its calls in order, moves
+            # piling up while driving by hand give way to newer ones, but a brake is never dropped for a move
             self.remote.add_callback(
-                RPCType.MOVE_IN_DIRECTION, self.remote_move)
+                RPCType.MOVE_IN_DIRECTION, self.__recorded(self.remote_move), HandlerMode.POOL,
+                coalesce=lambda direction: direction != "brake", max_pending=2)
             self.remote.add_callback(
-                RPCType.EVENTS, self.on_events_received)
+                RPCType.EVENTS, self.__recorded(self.on_events_received), HandlerMode.POOL)
             self.remote.add_callback(
-                RPCType.SET_STANDBY, self.set_standby)
+                RPCType.SET_STANDBY, self.__recorded(self.set_standby), HandlerMode.POOL)
 
-            rm_thread = threading.Thread(target=self.thread_remote,
-                                         name="remote", daemon=True)
-            rm_thread.start()
-            # rm_thread.join()
+            if connect:
+                rm_thread = threading.Thread(target=self.thread_remote,
+                                             name="remote", daemon=True)
+                rm_thread.start()
+                # rm_thread.join()
+            else:
+                self.sched = scheduler if scheduler is not None else Scheduler()
+                self.sched.run_event_cb = self.run_event
 
+    def __start_navigator(self, connect_ev3):
         # Create the navigation system
-        self.navigator = Navigator(self, verbose=True)
+        self.navigator = Navigator(self, verbose=True, connect=connect_ev3)
 
+    def __start_vision_loop(self):
         threading.Thread(target=self.vision.start, name="vision").start()
 
+    @staticmethod
+    def camera(device):
+        """
+        :param device:  Camera index or video file
+        :return:        FrameSource for it set up from config
+        """
+        return FrameSource(device,
+                           resolution=getattr(config, "CAMERA_RESOLUTION", (640, 480)),
+                           pixel_format=getattr(config, "CAMERA_FORMAT", "MJPG"),
+                           buffer_size=getattr(config, "CAMERA_BUFFERS", 1))
+
+    @staticmethod
+    def __recorded(method):
+        """
+        :param method:  Method called by the API
+        :return:        Function recording the call before making it, so sim.replay can make it again
+        """
+        def call(*args):
+            recorder.call(method.__name__, *args)
+            return method(*args)
+        return call
+
     def remote_move(self, direction):
+        self.startup.wait("navigator")
         self.navigator.remote_move(direction)
 
     def run_event(self, event):
@@ -97,25 +208,39 @@ class RobotController:
 
         self.actions = new_actions
 
-    def process_visual_data(self, predictions, frame):
+    def cancel_actions(self, plant_id):
+        """
+        Drops whatever is left to do for a plant, as an operator cancelling its task would.
+        :param plant_id:    Plant whose actions are dropped
+        :return:
+        """
+        recorder.call("cancel_actions", plant_id)
+        self.actions.pop(plant_id, None)
+
+    @tracer.traced("process_visual_data")
+    def process_visual_data(self, predictions, frame, camera="front"):
         """
         Forwards messages to navigator instance.
         :param predictions:     List of predictions produced by the VPU
+        :param frame:           Frame they were detected in
+        :param camera:          Name of the camera the frame comes from, QR codes are only read from the front one's
         :return:
         """
+        if camera != "front":
+            recorder.camera_detections(camera, predictions)
+            if self.enabled():
+                self.navigator.on_new_frame(predictions, camera)
+            return
+
+        recorder.detections(predictions)
+
         # If the standby is currently undergoing, but standby mode is False, stop standby mode here
         if self.standby_invoked and not self.standby_mode:
             self.standby_invoked = False
-            self.random_search_mode = True
-            self.navigator.remote_motor_controller.random()
-            self.standby_invoked = False
-
-        # If the sensor's last read time is long enough (1 hour), attempt to read the sensor
-        if time.time() - self.serial_io.sensor_last_read > 3600 and not self.serial_io.value_reading:
-            threading.Thread(name="serial_read", target=self.serial_io.read_value).start()
+            self.navigator.start_search()
 
         if self.enabled():
-            log.info("self.actions: {}, standby_mode: {}".format(self.actions, self.standby_mode))
+            log.info("self.actions: %s, standby_mode: %s", dict(self.actions), self.standby_mode)
             self.clean_actions()
             self.received_frame = frame
             self.navigator.on_new_frame(predictions)
@@ -141,10 +266,24 @@ class RobotController:
             # Stop immediately? Wait until the jobs to finish to stop?
 
 
+    def detections_needed(self):
+        """
+        :return:    False while process_visual_data ignores predictions, in standby, approaching a plant or retrying
+        """
+        return self.enabled() and self.approach_complete and not self.retrying_approach
+
+    def is_still(self):
+        """
+        :return:    True if the last command sent to the EV3 stopped the robot
+        """
+        return (self.startup.is_ready("navigator")
+                and getattr(self.navigator.remote_motor_controller, "last_action", None) == "stop")
+
     def read_qr_code(self):
         # Read the QR code
         tries = 3
         qr_codes = self.qr_reader.identify(self.received_frame)
+        recorder.qr(qr_codes)
         while tries > 0:
             if len(qr_codes) == 0:
                 log.warning("No plant QR found.")
@@ -152,7 +291,7 @@ class RobotController:
             else:
                 for qr in qr_codes:
                     self.current_qr_approached = qr
-                    log.info("Plant QR found: {}".format(qr))
+                    log.info("Plant QR found: %s", qr)
                 break
 
     def on_plant_found(self):
@@ -200,7 +339,11 @@ class RobotController:
             if self.current_qr_approached.startswith("gbpl:"):
                 plant_id = int(self.current_qr_approached[5:])
                 if "PLANT_CAPTURE_PHOTO" in self.actions.get(plant_id, []) or not self.standby_invoked:
-                    self.remote.plant_capture_photo(int(self.current_qr_approached[5:]), base64.b64encode(cv2.imencode(".jpg", self.received_frame)[1]).decode("utf-8"))
+                    # Encoded on the offload pool, the robot escapes meanwhile
+                    preset = getattr(config, "PHOTO_PRESET", "standard")
+                    photo = offload.submit(PHOTO, encode_photo, self.received_frame, preset)
+                    photo.add_done_callback(functools.partial(self.__upload_photo, plant_id, self.received_frame,
+                                                              preset))
         else:
             log.warning("[Pi] No QR code found during this approach, photo will not be sent.")
 
@@ -219,15 +362,40 @@ class RobotController:
         finally:
             self.navigator.remote_motor_controller.approach_escape()
 
+    def __upload_photo(self, plant_id, frame, preset, photo):
+        """
+        :param plant_id:    Plant the photo was taken of
+        :param frame:       Frame of the photo
+        :param preset:      Photo preset it is encoded with
+        :param photo:       Future of the JPEG encoded photo
+        :return:
+        """
+        try:
+            try:
+                image = photo.result()
+            except PoolFull:
+                # The photo is the point of the approach, it is encoded here rather than lost
+                log.warning("[Pi] Photo lane full, encoding the photo of plant %s inline", plant_id)
+                image = encode_photo(frame, preset)
+            self.remote.plant_capture_photo(plant_id, image)
+        except Exception as e:
+            log.error("[Pi] Could not send the photo of plant %s: %s", plant_id, e)
+
     def on_approach_escape_complete(self):
-        self.navigator.random_search_mode = True # Flip on the random search
-        self.navigator.remote_motor_controller.random_walk()
+        self.navigator.start_search()
         self.clean_actions()
         self.approach_complete = True
 
     def on_retry_complete(self):
         self.retrying_approach = False
-        self.navigator.approach_frame_counter = 8
+
+    def on_turn_complete(self, status):
+        self.navigator.on_turn_complete(status)
+
+    def on_sensor_data(self):
+        # Readings start arriving while the Navigator is still being built
+        if self.startup.is_ready("navigator"):
+            self.navigator.on_sensor_data()
 
     def on_plant_seen(self):
         pass
@@ -248,17 +416,14 @@ class RobotController:
     def set_standby(self, mode, justMove=False):
         if mode:
             self.standby_mode = True
-            while not hasattr(self, "navigator"):
-                pass
+            self.startup.wait("navigator")
             self.navigator.remote_motor_controller.stop()
             return
 
-        while not hasattr(self, "navigator"):
-            pass
+        self.startup.wait("navigator")
 
         # Start random search
-        self.navigator.random_search_mode = True
-        self.navigator.remote_motor_controller.random_walk()
+        self.navigator.start_search()
 
         if not justMove:
             # Turn off standby mode
@@ -276,13 +441,50 @@ class RobotController:
         elif self.navigator.get_escape_mode():
             return "Escape Mode"
 
+def configure(process="pi", metrics_port_offset=0):
+    """
+    Sets logging, tracing, metrics and the offload pool of a process up from config.
+    :param process:             Name of the process in traces
+    :param metrics_port_offset: Added to config.METRICS_PORT, every process serves its own metrics
+    :return:
+    """
+    json_path = getattr(config, "LOG_JSON", None)
+    # Processes appending to the same file would interleave their lines
+    if json_path is not None and process != "pi":
+        json_path += "." + process
+    log_setup.configure(level=getattr(config, "LOG_LEVEL", "INFO"),
+                        colour=getattr(config, "LOG_COLOUR", True),
+                        rate=getattr(config, "LOG_RATE", None),
+                        sample=getattr(config, "LOG_SAMPLE", 4),
+                        json_path=json_path)
+    if getattr(config, "TRACE", False):
+        tracer.enable(process)
+        install_dump_signal(tracer)
+    if getattr(config, "METRICS_PORT", None):
+        registry.serve(config.METRICS_PORT + metrics_port_offset)
+    offload.configure(workers=getattr(config, "OFFLOAD_WORKERS", None))
+
+
+def inference_process_vision(robot_controller):
+    """
+    Builds the Vision of the inference process, see inference_process.py. Its metrics are served on the port after
+    config.METRICS_PORT.
+    :param robot_controller:    Stand-in for the RobotController
+    :return:                    Vision
+    """
+    configure("vision", metrics_port_offset=1)
+    return RobotController.build_vision(robot_controller)
+
+
 def main():
     if os.getenv("http_proxy") is not None:
         print("You are a monster.")
         print("Use start.sh. Do not run this Python file yourself.")
         return
 
-    log.basicConfig(format="[ %(asctime)s ] [ %(levelname)s ] %(message)s\033[0m", level=log.DEBUG, stream=sys.stdout)
+    configure()
+    if getattr(config, "RECORD", None):
+        recorder.open(config.RECORD, frames_every=getattr(config, "RECORD_FRAMES", 0))
     RobotController()
 
 
@@ -3,3 +3,23 @@ API_SECURE=False
 RESPOND_TO_API=True
 UUID="35ae6830-d961-4a9c-937f-8aa5bc61d6a3" # This is the dev-only key
 MOCK=True
+PHOTO_PRESET="standard" # One of "full", "standard" or "thumbnail", see photo_upload.PHOTO_PRESETS
+TRACE=False # Record latency spans and dump them on SIGUSR1, see tracing.py. The EV3 client reads TRACE from its environment
+METRICS_PORT=9108 # Serve Prometheus metrics on localhost, None to disable, see metrics.py
+LOG_LEVEL="INFO" # DEBUG logs every frame's decisions at a cost per frame, WARNING saves the most, see sim/log_bench.py
+LOG_COLOUR=True # False strips ANSI colour codes from the console log
+LOG_RATE=None # Records per second allowed from each INFO or DEBUG call site, e.g. 2, None for no limit
+LOG_SAMPLE=4 # Keep one in this many INFO or DEBUG records from each call site, None to keep all
+LOG_JSON=None # File to also write JSON lines log records to, e.g. "robot.log.jsonl"
+RECORD=None # File to record detections, EV3 messages and commands to for sim.replay, e.g. "run.rec", see recording.py
+RECORD_FRAMES=0 # Also record a thumbnail of every this many frames, 0 for none
+CAMERA_RESOLUTION=(640, 480) # Navigator assumes 640x480 frames
+CAMERA_FORMAT="MJPG" # "MJPG" or "YUYV", see frame_source.py
+CAMERA_BUFFERS=1 # Frames the camera driver may queue, more adds latency
+REAR_CAMERA=None # Index of a camera facing backwards, e.g. 1, None without one
+CAMERA_WEIGHTS=None # Inference turns per camera, e.g. {"front": 3, "rear": 1}, None for taking turns equally
+INFERENCE_REFRESH=1.0 # Seconds between inferences at least while the scene is static, None to infer on every frame
+VISION_CROPS=0 # Crops around distant plants or tiles inferred with each frame, e.g. 2, see crops.py. Costs VPU time
+NETWORK_CACHE="~/.cache/growbot/networks" # Compiled networks are kept here to skip compiling on start, None to disable
+INFERENCE_PROCESS=False # Capture and inference in a process of their own, off the GIL of the rest, see inference_process.py
+OFFLOAD_WORKERS=None # Threads JPEG encoding and QR decoding run on, None for one per core, see offload.py
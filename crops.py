@@ -0,0 +1,150 @@
+"""
+Crops of a frame run through the detector in the same batch as the whole frame, so distant plants are seen larger.
+
+SSD300 squashes a 640x480 frame to 300x300, so a plant a few metres away is only a handful of input pixels tall and
+goes undetected. A 240x240 crop around it reaches the network at 1.25 times its frame size instead of 0.6 times.
+Crops are planned around regions of interest first, the plants detected and the candidates detected with too low a
+confidence in the previous frame, and the remaining batch slots are filled from a fixed grid of tiles so plants not
+seen at all get a closer look too.
+
+Detections are SSD output rows [image_id, label, confidence, xmin, ymin, xmax, ymax] with coordinates normalised to
+the image they were detected in. to_frame maps rows of a crop into frame coordinates, merge removes the duplicates of
+objects seen both in the frame and in crops.
+"""
+from collections import namedtuple
+
+Crop = namedtuple("Crop", ["xmin", "ymin", "xmax", "ymax"])
+Crop.__doc__ = "Region of a frame in pixels, max exclusive."
+
+# Detections closer than this to a crop edge inside the frame are cut off by the crop, in normalised crop coordinates
+EDGE_MARGIN = 0.01
+
+
+def tile_grid(width, height, columns=2, rows=2, overlap=0.2):
+    """
+    :param width:       Frame width in pixels
+    :param height:      Frame height in pixels
+    :param columns:     Tiles across
+    :param rows:        Tiles down
+    :param overlap:     Fraction of a tile shared with each neighbour, so objects on a border are whole in one tile
+    :return:            List of Crop covering the frame, row by row
+    """
+    tile_w = width / (columns - (columns - 1) * overlap)
+    tile_h = height / (rows - (rows - 1) * overlap)
+    tiles = []
+    for row in range(rows):
+        for column in range(columns):
+            xmin = int(round(column * tile_w * (1 - overlap)))
+            ymin = int(round(row * tile_h * (1 - overlap)))
+            xmax = min(width, int(round(xmin + tile_w)))
+            ymax = min(height, int(round(ymin + tile_h)))
+            tiles.append(Crop(xmin, ymin, xmax, ymax))
+    return tiles
+
+
+def region_around(box, width, height, size=240, margin=1.5):
+    """
+    :param box:     ((xmin, ymin), (xmax, ymax)) of an object in pixels
+    :param width:   Frame width in pixels
+    :param height:  Frame height in pixels
+    :param size:    Smallest side of the square crop in pixels
+    :param margin:  Crop side relative to the object's longer side, for objects large enough
+    :return:        Square Crop centred on the object as far as the frame allows
+    """
+    ((xmin, ymin), (xmax, ymax)) = box
+    side = int(min(width, height, max(size, margin * max(xmax - xmin, ymax - ymin))))
+    x = int(min(max(0, (xmin + xmax) / 2 - side / 2), width - side))
+    y = int(min(max(0, (ymin + ymax) / 2 - side / 2), height - side))
+    return Crop(x, y, x + side, y + side)
+
+
+def plan(width, height, regions, count, tiles=()):
+    """
+    :param width:   Frame width in pixels
+    :param height:  Frame height in pixels
+    :param regions: Boxes ((xmin, ymin), (xmax, ymax)) worth a closer look, most important first
+    :param count:   Number of crops wanted
+    :param tiles:   Crops to fill up with, in order, once every region is covered
+    :return:        List of at most count Crop
+    """
+    crops = []
+    for box in regions:
+        if len(crops) == count:
+            return crops
+        ((xmin, ymin), (xmax, ymax)) = box
+        x, y = (xmin + xmax) / 2, (ymin + ymax) / 2
+        # Objects close together share a crop
+        if not any(crop.xmin <= x < crop.xmax and crop.ymin <= y < crop.ymax for crop in crops):
+            crops.append(region_around(box, width, height))
+    for tile in tiles:
+        if len(crops) == count:
+            break
+        crops.append(tile)
+    return crops
+
+
+def to_frame(row, crop, width, height):
+    """
+    :param row:     Detection of the crop
+    :param crop:    Crop it was detected in
+    :param width:   Frame width in pixels
+    :param height:  Frame height in pixels
+    :return:        Detection with coordinates normalised to the frame, None if the crop cut the object off
+    """
+    xmin, ymin, xmax, ymax = row[3], row[4], row[5], row[6]
+    if ((xmin < EDGE_MARGIN and crop.xmin > 0) or (ymin < EDGE_MARGIN and crop.ymin > 0)
+            or (xmax > 1 - EDGE_MARGIN and crop.xmax < width) or (ymax > 1 - EDGE_MARGIN and crop.ymax < height)):
+        return None
+    crop_w, crop_h = crop.xmax - crop.xmin, crop.ymax - crop.ymin
+    return [row[0], row[1], row[2],
+            (crop.xmin + xmin * crop_w) / width, (crop.ymin + ymin * crop_h) / height,
+            (crop.xmin + xmax * crop_w) / width, (crop.ymin + ymax * crop_h) / height]
+
+
+def iou(a, b):
+    """
+    :return:    Intersection over union of two detections
+    """
+    w = min(a[5], b[5]) - max(a[3], b[3])
+    h = min(a[6], b[6]) - max(a[4], b[4])
+    if w <= 0 or h <= 0:
+        return 0.0
+    overlap = w * h
+    return overlap / ((a[5] - a[3]) * (a[6] - a[4]) + (b[5] - b[3]) * (b[6] - b[4]) - overlap)
+
+
+def merge(rows, iou_threshold=0.5):
+    """
+    Non-maximum suppression across the detections of the frame and its crops.
+    :param rows:            Detections in frame coordinates
+    :param iou_threshold:   Overlap above which two detections of the same label are the same object
+    :return:                Detections kept, most confident first
+    """
+    kept = []
+    for row in sorted(rows, key=lambda r: -r[2]):
+        if all(int(row[1]) != int(other[1]) or iou(row, other) <= iou_threshold for other in kept):
+            kept.append(row)
+    return kept
+
+
+def collect(rows, planned, width, height, min_confidence):
+    """
+    :param rows:            Detections of a batch of a frame followed by its crops, as the SSD outputs them
+    :param planned:         Crops in the batch after the frame
+    :param width:           Frame width in pixels
+    :param height:          Frame height in pixels
+    :param min_confidence:  Confidence detections need to be kept
+    :return:                Detections in frame coordinates, duplicates merged, most confident first
+    """
+    collected = []
+    for row in rows:
+        image = int(row[0])
+        if image < 0:
+            # End of the detections
+            break
+        if row[2] <= min_confidence or image > len(planned):
+            continue
+        row = row if image == 0 else to_frame(row, planned[image - 1], width, height)
+        if row is not None:
+            collected.append(row)
+    return merge(collected)
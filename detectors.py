@@ -0,0 +1,221 @@
+"""
+Model adapters turning the output blobs of a detector network into detections.
+
+Everything an adapter needs to know about a network, the blob names, the anchors and grid offsets of every YOLO output
+layer and the label of every class, is read from the network once when it is loaded into a DecodePlan. Decoding a
+frame then only does arithmetic on the output blobs. vision.Vision drives any adapter, adding a model takes a class
+with plan(net) and decode(plan, outputs, min_confidence):
+
+    adapter = SSDAdapter()
+    plan = adapter.plan(net)                                    # IENetwork, once the batch size is set
+    rows = adapter.decode(plan, request.outputs, 0.5)
+
+Detections are N x 7 arrays of SSD output rows [image_id, class_id, confidence, xmin, ymin, xmax, ymax] with
+coordinates normalised to the image of the batch they were detected in, whichever model produced them, so crops.py
+applies to every model. to_predictions turns them into the predictions RobotController takes.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+import crops
+
+
+class DecodePlan(namedtuple("DecodePlan", ["input_blob", "input_shape", "outputs", "labels", "plants", "layers"])):
+    """
+    What decoding the output of a network takes, built once when the network is loaded.
+    :param input_blob:  Name of the input blob
+    :param input_shape: (n, c, h, w) of the input blob
+    :param outputs:     Names of the output blobs decoded
+    :param labels:      Label Vision reports for each class ID, "Plant" or "Obstacle"
+    :param plants:      Class IDs labelled "Plant"
+    :param layers:      Model specific decoding parameters of each output blob, YoloLayer for YOLO
+    """
+    __slots__ = ()
+
+    def label(self, class_id):
+        """
+        :param class_id:    Class ID of a detection
+        :return:            Label reported for it, "Obstacle" for classes the network doesn't declare
+        """
+        return self.labels[class_id] if 0 <= class_id < len(self.labels) else "Obstacle"
+
+    def is_plant(self, rows):
+        """
+        :param rows:    Detections
+        :return:        Boolean array, True for the rows detecting plants
+        """
+        return np.isin(rows[:, 1].astype(int), self.plants)
+
+
+YoloLayer = namedtuple("YoloLayer", ["blob", "side", "num", "coords", "classes", "anchors", "cols", "rows"])
+YoloLayer.__doc__ = """
+Decoding parameters of a YOLO region output layer.
+:param blob:        Name of its output blob
+:param side:        Cells of its grid across and down
+:param num:         Anchors per cell
+:param coords:      Box coordinates per anchor
+:param classes:     Class probabilities per anchor
+:param anchors:     Anchor (width, height) normalised to the network input, num x 2 array
+:param cols:        Column of every cell, side x side array
+:param rows:        Row of every cell, side x side array
+"""
+
+
+def label_map(classes, plant_class):
+    """
+    :param classes:     Number of classes the network detects
+    :param plant_class: Class ID of plants
+    :return:            Tuple of the label reported for each class ID
+    """
+    return tuple("Plant" if class_id == plant_class else "Obstacle" for class_id in range(classes))
+
+
+def to_predictions(plan, rows, width, height):
+    """
+    :param plan:    DecodePlan of the network that detected them
+    :param rows:    Detections in frame coordinates
+    :param width:   Frame width in pixels
+    :param height:  Frame height in pixels
+    :return:        List of (label, confidence, ((xmin, ymin), (xmax, ymax))) with the box in pixels
+    """
+    boxes = (rows[:, 3:7] * (width, height, width, height)).astype(int).tolist()
+    return [(plan.label(int(class_id)), confidence, ((box[0], box[1]), (box[2], box[3])))
+            for class_id, confidence, box in zip(rows[:, 1].tolist(), rows[:, 2].tolist(), boxes)]
+
+
+class SSDAdapter:
+    """
+    Adapter for SSD networks ending in a DetectionOutput layer, such as MobileNet-SSD trained on Pascal VOC.
+    """
+
+    def __init__(self, plant_class=16):
+        """
+        Constructor for SSDAdapter class.
+        :param plant_class: Class ID of plants, 16 is "pottedplant" in Pascal VOC
+        """
+        self.plant_class = plant_class
+
+    def plan(self, net):
+        """
+        :param net: IENetwork with its batch size set
+        :return:    DecodePlan of the network
+        """
+        input_blob = next(iter(net.inputs))
+        out_blob = next(iter(net.outputs))
+        classes = int(net.layers[out_blob].params.get("num_classes", 21))
+        return DecodePlan(input_blob, tuple(net.inputs[input_blob].shape), (out_blob,),
+                          label_map(classes, self.plant_class), (self.plant_class,), ())
+
+    def decode(self, plan, outputs, min_confidence):
+        """
+        :param plan:            DecodePlan of the network
+        :param outputs:         Output blobs of an inference request by name
+        :param min_confidence:  Confidence detections need to be kept
+        :return:                Detections of the batch, in the order of the network
+        """
+        rows = outputs[plan.outputs[0]].reshape(-1, 7)
+        # The detections end at the first row with a negative image ID
+        end = np.flatnonzero(rows[:, 0] < 0)
+        if len(end):
+            rows = rows[:end[0]]
+        # NaN confidences fail both comparisons
+        confidence = rows[:, 2]
+        return rows[(confidence > min_confidence) & (confidence <= 1)]
+
+
+class YoloV3Adapter:
+    """
+    Adapter for YOLOv3 networks converted with their RegionYolo output layers.
+    """
+
+    # Anchors of the COCO model, used by layers not declaring theirs
+    ANCHORS = (10.0, 13.0, 16.0, 30.0, 33.0, 23.0, 30.0, 61.0, 62.0, 45.0, 59.0, 119.0, 116.0, 90.0, 156.0, 198.0,
+               373.0, 326.0)
+    # Index of the first anchor of the layers of each grid size
+    ANCHOR_OFFSETS = {13: 6, 26: 3, 52: 0}
+
+    def __init__(self, plant_class=59, iou_threshold=0.4):
+        """
+        Constructor for YoloV3Adapter class.
+        :param plant_class:     Class ID of plants
+        :param iou_threshold:   Overlap above which the less confident of two detections is dropped, whatever their
+                                classes
+        """
+        self.plant_class = plant_class
+        self.iou_threshold = iou_threshold
+
+    def plan(self, net):
+        """
+        :param net: IENetwork with its batch size set
+        :return:    DecodePlan of the network
+        """
+        input_blob = next(iter(net.inputs))
+        input_shape = tuple(net.inputs[input_blob].shape)
+        input_size = np.array([input_shape[3], input_shape[2]], dtype=np.float32)
+
+        layers = []
+        for blob, data in net.outputs.items():
+            param = net.layers[blob].params
+            side = data.shape[2]
+            if side not in self.ANCHOR_OFFSETS:
+                raise ValueError("Output {} is {}x{}, only 13, 26 and 52 are supported".format(blob, side, side))
+
+            num = len(param["mask"].split(",")) if "mask" in param else int(param.get("num", 3))
+            anchors = ([float(a) for a in param["anchors"].split(",")] if "anchors" in param
+                       else list(self.ANCHORS))
+            offset = self.ANCHOR_OFFSETS[side]
+            anchors = np.array(anchors[2 * offset:2 * (offset + num)], dtype=np.float32).reshape(num, 2) / input_size
+
+            rows, cols = np.mgrid[0:side, 0:side].astype(np.float32)
+            layers.append(YoloLayer(blob, side, num, int(param.get("coords", 4)), int(param.get("classes", 80)),
+                                    anchors, cols, rows))
+
+        classes = layers[0].classes if layers else 0
+        return DecodePlan(input_blob, input_shape, tuple(layer.blob for layer in layers),
+                          label_map(classes, self.plant_class), (self.plant_class,), tuple(layers))
+
+    def decode(self, plan, outputs, min_confidence):
+        """
+        :param plan:            DecodePlan of the network
+        :param outputs:         Output blobs of an inference request by name
+        :param min_confidence:  Confidence detections need to be kept
+        :return:                Detections of the batch, most confident first per image
+        """
+        rows = []
+        for image_id in range(plan.input_shape[0]):
+            image_rows = []
+            for layer in plan.layers:
+                image_rows += self.__decode_layer(layer, outputs[layer.blob][image_id], image_id, min_confidence)
+            rows += self.__suppress(image_rows)
+        return np.array(rows, dtype=np.float32).reshape(-1, 7)
+
+    @staticmethod
+    def __decode_layer(layer, blob, image_id, min_confidence):
+        # Entries of each anchor are planes of the grid: x, y, w, h, objectness, then the class probabilities
+        blob = blob.reshape(layer.num, layer.coords + 1 + layer.classes, layer.side, layer.side)
+        objectness = blob[:, layer.coords]
+        scores = objectness[:, np.newaxis] * blob[:, layer.coords + 1:]
+        anchor, class_id, row, col = np.nonzero(scores >= min_confidence)
+        if not len(anchor):
+            return []
+
+        x = (layer.cols[row, col] + blob[anchor, 0, row, col]) / layer.side
+        y = (layer.rows[row, col] + blob[anchor, 1, row, col]) / layer.side
+        with np.errstate(over="ignore"):
+            w = np.exp(blob[anchor, 2, row, col]) * layer.anchors[anchor, 0]
+            h = np.exp(blob[anchor, 3, row, col]) * layer.anchors[anchor, 1]
+
+        boxes = np.stack([np.full(len(anchor), image_id, dtype=np.float32), class_id.astype(np.float32),
+                          scores[anchor, class_id, row, col], x - w / 2, y - h / 2, x + w / 2, y + h / 2], axis=1)
+        # Boxes reaching out of the frame are where exp overflowed or are cut off by the frame edge
+        inside = (np.all(np.isfinite(boxes), axis=1)
+                  & np.all(boxes[:, 3:5] >= 0, axis=1) & np.all(boxes[:, 5:7] <= 1, axis=1))
+        return boxes[inside].tolist()
+
+    def __suppress(self, rows):
+        kept = []
+        for row in sorted(rows, key=lambda r: -r[2]):
+            if all(crops.iou(row, other) <= self.iou_threshold for other in kept):
+                kept.append(row)
+        return kept
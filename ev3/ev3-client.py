@@ -8,6 +8,7 @@ import random
 import time
 import json
 import SigFinish
+from ev3_tracing import tracer, enable_from_env
 from enum import Enum
 
 class LogColour(Enum):
@@ -46,6 +47,8 @@ class EV3_Client:
         self.watered = False
         self.arm_operated = False
         self.arm_up = False
+        self.turn_complete = None
+        self.send_now = threading.Event() # Set to wake the sender loop before its next tick
 
     def generate_log(self, msg, color=LogColour.RESET):
         return color.value + msg
@@ -110,72 +113,97 @@ class EV3_Client:
             # yield from self.ws_sender.send(json.dumps(init_package))
 
             while True:
-                try:
-                    self.front_sensor_value = self.firmware.front_sensor.value()
-                    self.back_sensor_value = self.firmware.back_sensor.value()
-                except ValueError as e:
-                    log.error("[EV3] Value error: {}".format(e))
-                if self.front_sensor_value >= 0 or self.back_sensor_value >= 0:
-                    package = {
-                        "type": "sensor",
-                        "front_sensor": str(self.front_sensor_value),
-                        "back_sensor": str(self.back_sensor_value),
-                        "severity": 0
-                    }
-                    log.info("[EV3 > Pi] Sending sensor data (\"front_sensor\": {}, \"back_sensor\": {})"
-                        .format(package["front_sensor"], package["back_sensor"]))
+                for package in self.pending_messages():
                     yield from self.ws_sender.send(json.dumps(package))
-                if self.distress_called is not None:
-                    if self.distress_called - self.last_distress_sent > 5:
-                        distress_package = {
-                            "type": "distress",
-                            "message": "sensor_stuck",
-                            "severity": 3
-                        }
-                        log.info("[EV3 > Pi] Sending distress signal, reason: {}".format(distress_package["message"]))
-                        yield from self.ws_sender.send(json.dumps(distress_package))
-                        self.last_distress_sent = time.time()
-                        self.distress_called = None
-
-                if self.approach_complete:
-                    package = {
-                            "type": "approach_complete",
-                            "severity": 1
-                    }
-                    if self.approach_problem:
-                        package["approach_problem"] = True
-                    else:
-                        package["approach_problem"] = False
-                    package["watered"] = self.watered
-                    log.info("[EV3 > Pi] Sending approach complete message, approach_problem={}.".format(str(self.approach_problem)))
-                    yield from self.ws_sender.send(json.dumps(package))
-                    self.approach_complete = False
-                    self.approach_problem = False
-                    self.watered = False
-                if self.retry_complete:
-                    package = {
-                            "type": "retry_complete",
-                            "severity": 1
-                    }
-                    log.info("[EV3 > Pi] Sending retry complete message.")
-                    yield from self.ws_sender.send(json.dumps(package))
-                    self.retry_complete = False
-                if self.approach_escape_complete:
-                    package = {
-                            "type": "approach_escape_complete",
-                            "severity": 1
-                    }
-                    log.info("[EV3 > Pi] Sending approach escape complete message.")
-                    yield from self.ws_sender.send(json.dumps(package))
-                    self.approach_escape_complete = False
 
-                time.sleep(0.5)
+                self.send_now.wait(0.5)
+                self.send_now.clear()
         finally:
             self.firmware.stop()
             self.ws_sender.close()
 
+    def pending_messages(self):
+        """
+        Reads the sensors and collects everything due for the Pi since the last call, flags are reset as their
+        messages are collected. Called once per tick of the sender loop.
+        :return:    List of packages to send in order
+        """
+        packages = []
+        try:
+            self.front_sensor_value = self.firmware.front_sensor.value()
+            self.back_sensor_value = self.firmware.back_sensor.value()
+        except ValueError as e:
+            log.error("[EV3] Value error: {}".format(e))
+        if self.front_sensor_value >= 0 or self.back_sensor_value >= 0:
+            package = {
+                "type": "sensor",
+                "front_sensor": str(self.front_sensor_value),
+                "back_sensor": str(self.back_sensor_value),
+                "severity": 0
+            }
+            log.info("[EV3 > Pi] Sending sensor data (\"front_sensor\": {}, \"back_sensor\": {})"
+                .format(package["front_sensor"], package["back_sensor"]))
+            packages.append(package)
+        if self.distress_called is not None:
+            if self.distress_called - self.last_distress_sent > 5:
+                distress_package = {
+                    "type": "distress",
+                    "message": "sensor_stuck",
+                    "severity": 3
+                }
+                log.info("[EV3 > Pi] Sending distress signal, reason: {}".format(distress_package["message"]))
+                packages.append(distress_package)
+                self.last_distress_sent = time.time()
+                self.distress_called = None
+
+        if self.approach_complete:
+            package = {
+                    "type": "approach_complete",
+                    "severity": 1
+            }
+            if self.approach_problem:
+                package["approach_problem"] = True
+            else:
+                package["approach_problem"] = False
+            package["watered"] = self.watered
+            log.info("[EV3 > Pi] Sending approach complete message, approach_problem={}.".format(str(self.approach_problem)))
+            packages.append(package)
+            self.approach_complete = False
+            self.approach_problem = False
+            self.watered = False
+        if self.retry_complete:
+            package = {
+                    "type": "retry_complete",
+                    "severity": 1
+            }
+            log.info("[EV3 > Pi] Sending retry complete message.")
+            packages.append(package)
+            self.retry_complete = False
+        if self.turn_complete is not None:
+            package = {
+                    "type": "turn_complete",
+                    "status": self.turn_complete,
+                    "severity": 0
+            }
+            log.info("[EV3 > Pi] Sending turn complete message, status={}.".format(self.turn_complete))
+            packages.append(package)
+            self.turn_complete = None
+        if self.approach_escape_complete:
+            package = {
+                    "type": "approach_escape_complete",
+                    "severity": 1
+            }
+            log.info("[EV3 > Pi] Sending approach escape complete message.")
+            packages.append(package)
+            self.approach_escape_complete = False
+        return packages
+
     def message_process(self, msg):
         package = json.loads(msg)
+        with tracer.context(package.get("trace_id")), tracer.span("message_process:" + package["action"]):
+            self.process_action(package)
+
+    def process_action(self, package):
         action = package["action"]
         log.info("[EV3 < Pi] Received action \"{}\"".format(action))
 
@@ -236,11 +264,14 @@ class EV3_Client:
                 if angle < 0:
                     self.firmware.left_side_turn(running_speed=75, twin_turn=True)
                 elif angle == 0:
-                    pass
+                    # Nothing to do, but the Pi is waiting for the turn to finish
+                    self.turn_complete = "done"
+                    self.send_now.set()
                 else:
+                    # Don't block this thread on the turn, a stop preempts it straight away
                     self.turn_issued = True
-                    self.firmware.left_side_turn(running_speed=75, run_forever=False, run_by_deg=True, twin_turn=True, turn_degree=angle)
-                    self.turn_issued = False
+                    handle = self.firmware.left_side_turn(running_speed=75, run_forever=False, run_by_deg=True, twin_turn=True, turn_degree=angle, wait=False)
+                    handle.add_done_callback(self.on_turn_done)
             self.random_issued = False
             self.stop_now = False
         elif action == "right":
@@ -256,11 +287,18 @@ class EV3_Client:
                 if angle < 0:
                     self.firmware.right_side_turn(running_speed=75, twin_turn=True)
                 elif angle == 0:
-                    pass
+                    # Nothing to do, but the Pi is waiting for the turn to finish
+                    self.turn_complete = "done"
+                    self.send_now.set()
                 else:
+                    # Don't block this thread on the turn, a stop preempts it straight away
                     self.turn_issued = True
-                    self.firmware.right_side_turn(running_speed=75, run_forever=False, run_by_deg=True, twin_turn=True, turn_degree=angle)
-                    self.turn_issued = False
+                    handle = self.firmware.right_side_turn(running_speed=75, run_forever=False, run_by_deg=True, twin_turn=True, turn_degree=angle, wait=False)
+                    handle.add_done_callback(self.on_turn_done)
+            self.random_issued = False
+            self.stop_now = False
+        elif action == "speed":
+            self.firmware.set_wheel_speeds(package["left"], package["right"])
             self.random_issued = False
             self.stop_now = False
         elif action == "forward":
@@ -294,9 +332,8 @@ class EV3_Client:
                 log.warn("Arm already in up position, skipping")
                 return
             self.arm_operated = True
-            self.firmware.raise_arm()
-            self.arm_operated = False
             self.arm_up = True
+            self.firmware.raise_arm(wait=False).add_done_callback(self.on_arm_done)
         elif action == "arm_down":
             if self.arm_operated:
                 log.info("Skipping {} as arm is already in operation".format(action))
@@ -305,13 +342,30 @@ class EV3_Client:
                 log.warn("Arm already in down position, skipping")
                 return
             self.arm_operated = True
-            self.firmware.lower_arm()
-            self.arm_operated = False
             self.arm_up = False
+            self.firmware.lower_arm(wait=False).add_done_callback(self.on_arm_done)
+        elif action == "calibrate_turning":
+            log.info("Calibrating turning constant.")
+            self.turn_issued = True
+            try:
+                log.info("Turning constant set to {:.2f}.".format(self.firmware.calibrate_turning_constant()))
+            except ValueError as e:
+                log.error("Calibration failed: {}".format(e))
+            self.turn_issued = False
         else:
             log.info("Invalid command.")
             self.firmware.stop()
 
+    def on_turn_done(self, handle):
+        log.info("Turn {}.".format(handle.status))
+        self.turn_issued = False
+        self.turn_complete = handle.status
+        self.send_now.set()
+
+    def on_arm_done(self, handle):
+        log.info("Arm movement {}.".format(handle.status))
+        self.arm_operated = False
+
     def random_movement(self):
         currently_turning = True
         while True:
@@ -545,6 +599,7 @@ def socket_error_message_loop(msg):
 
 def main():
     log.basicConfig(format="[ %(asctime)s ] [ %(levelname)s ] %(message)s" + LogColour.RESET.value, level=log.INFO, stream=sys.stdout)
+    enable_from_env("ev3")
     try:
         ev3 = EV3_Client()
 
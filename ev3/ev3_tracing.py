@@ -0,0 +1,67 @@
+"""
+Tracing on the EV3, see tracing.py of the Pi.
+
+The EV3 records spans with the Pi's tracing.py when it is deployed next to the client, along with rpc_dispatch.py
+which it imports. Without them every span is a no-op, so the client runs from ev3/ on its own. Its dumps only merge
+with the Pi's while the two clocks are in sync, e.g. through NTP, see tracing.py.
+
+    TRACE=1 python3 ev3-client.py   # Records spans, kill -USR1 dumps them to trace-ev3-<time>.json
+"""
+import logging as log
+import os
+
+try:
+    from tracing import tracer, install_dump_signal
+    available = True
+except ImportError:
+    available = False
+
+    class _NoSpan:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    class _NoTracer:
+        """
+        Stands in for tracing.Tracer, recording nothing.
+        """
+        enabled = False
+
+        def enable(self, process=None):
+            pass
+
+        def new_id(self):
+            return None
+
+        def current(self):
+            return None
+
+        def context(self, trace_id):
+            return _NoSpan()
+
+        def span(self, stage, trace_id=None):
+            return _NoSpan()
+
+    def install_dump_signal(tracer, signum=None):
+        pass
+
+    tracer = _NoTracer()
+
+
+def enable_from_env(process="ev3"):
+    """
+    Enables the tracer and its dump signal if TRACE is set in the environment, the EV3 has no copy of the Pi's config.
+    Call from the main thread.
+    :param process: Name of this process in exported traces
+    :return:        Whether spans are recorded
+    """
+    if os.getenv("TRACE", "") in ("", "0", "false", "False"):
+        return False
+    if not available:
+        log.warning("[TRACE] TRACE is set but tracing.py and rpc_dispatch.py are not deployed next to the client")
+        return False
+    tracer.enable(process)
+    install_dump_signal(tracer)
+    return True
@@ -11,6 +11,7 @@ import random
 import time
 import asyncio
 from math import pi
+from motion import MotionController, TurnController
 print("[IMPORT] everything else imported")
 
 
@@ -39,6 +40,9 @@ class GrowBot:
         self.enable_obstacle_detection = False
         self.stop_on_obstacle = True
 
+        ## Tracks running commands, every motion method returns a MotionHandle from it
+        self.motion = MotionController()
+
         ## Detect all ports are connected
         ## Expansion: detect types of each port?
         if not self.left_motor.connected:
@@ -52,7 +56,7 @@ class GrowBot:
         if not self.back_sensor.connected:
             raise IOError("Plug the back sensor into Port In2.`")
 
-    def raise_arm(self, running_speed=None, running_time=None, running_rotations=None):
+    def raise_arm(self, running_speed=None, running_time=None, running_rotations=None, wait=True):
         # Using default params
         if running_speed is None:
             running_speed = self.motor_running_speed
@@ -62,11 +66,14 @@ class GrowBot:
             running_rotations = self.arm_rotation_count
 
         running_count = -self.arm_motor.count_per_rot * self.arm_rotation_count # Tacho counts for the requested rotations
-        # Run to targeted position, and sleep for the duration of the manouvure to avoid command overlap
-        self.arm_motor.run_to_rel_pos(position_sp=running_count, speed_sp=running_speed, stop_action="hold")
-        time.sleep(abs(running_count / running_speed))
-
-    def lower_arm(self, running_speed=None, running_time=None, running_rotations=None):
+        # Run to targeted position, the handle completes once the motor holds its position
+        handle = self.motion.start("raise_arm", [self.arm_motor], lambda: self.arm_motor.run_to_rel_pos(
+            position_sp=running_count, speed_sp=running_speed, stop_action="hold"))
+        if wait:
+            handle.wait()
+        return handle
+
+    def lower_arm(self, running_speed=None, running_time=None, running_rotations=None, wait=True):
         # Using default params
         if running_speed is None:
             running_speed = self.motor_running_speed
@@ -76,75 +83,65 @@ class GrowBot:
             running_rotations = self.arm_rotation_count
 
         running_count = self.arm_motor.count_per_rot * self.arm_rotation_count # Tacho counts for the requested rotations
-        # Run to targeted position, and sleep for the duration of the manouvure to avoid command overlap
-        self.arm_motor.run_to_rel_pos(position_sp=running_count, speed_sp=running_speed, stop_action="hold")
-        time.sleep(abs(running_count / running_speed))
+        # Run to targeted position, the handle completes once the motor holds its position
+        handle = self.motion.start("lower_arm", [self.arm_motor], lambda: self.arm_motor.run_to_rel_pos(
+            position_sp=running_count, speed_sp=running_speed, stop_action="hold"))
+        if wait:
+            handle.wait()
+        return handle
 
     # Note: time in seconds
-    def drive_forward(self, run_forever=True, running_time=None, running_speed=None):
+    # Every motion method returns a MotionHandle. Finite motions block until done unless wait=False, run_forever
+    # motions never block and their handle completes when another command takes over the motors.
+    def drive_forward(self, run_forever=True, running_time=None, running_speed=None, wait=True):
         if not run_forever and running_time is None:
             running_time = self.motor_running_time
         if running_speed is None:
             running_speed = self.motor_running_speed
 
-        if run_forever:
-            self.left_motor.run_forever(speed_sp=-int(running_speed))
-            self.right_motor.run_forever(speed_sp=-int(running_speed))
-        else:
-            self.left_motor.run_timed(speed_sp=-int(running_speed), time_sp=running_time * 1000)
-            self.right_motor.run_forever(speed_sp=-int(running_speed), time_sp=running_time * 1000)
-            time.sleep(running_time)
+        return self.__drive("drive_forward", -int(running_speed), run_forever, running_time, wait)
 
-    def drive_backward(self, run_forever=True, running_time=None, running_speed=None):
+    def drive_backward(self, run_forever=True, running_time=None, running_speed=None, wait=True):
         if not run_forever and running_time is None:
             running_time = self.motor_running_time
         if running_speed is None:
             running_speed = self.motor_running_speed
 
-        if run_forever:
-            self.left_motor.run_forever(speed_sp=int(running_speed))
-            self.right_motor.run_forever(speed_sp=int(running_speed))
-        else:
-            self.left_motor.run_timed(speed_sp=int(running_speed), time_sp=running_time * 1000)
-            self.right_motor.run_timed(speed_sp=int(running_speed), time_sp=running_time * 1000)
-            for _ in range(100):
-                time.sleep(running_time / 100)
+        return self.__drive("drive_backward", int(running_speed), run_forever, running_time, wait)
 
-    def left_side_turn(self, run_forever=True, run_by_deg=False, run_by_time=False, running_time=None, running_speed=None, turn_degree=None, twin_turn=False):
-        # Default parameters
-        if running_speed is None:
-            running_speed = self.motor_running_speed
-        if not run_forever:
-            if run_by_deg is True:
-                if turn_degree is None:
-                    turn_degree = self.turning_def_degree
-            elif running_time is None:
-                running_time = self.motor_running_time
+    def __drive(self, name, speed, run_forever, running_time, wait):
+        motors = [self.left_motor, self.right_motor]
 
-        if run_forever:
-            self.right_motor.run_forever(speed_sp=-int(running_speed))
-            if (twin_turn):
-                self.left_motor.run_forever(speed_sp=int(running_speed))
-            else:
-                self.left_motor.stop(stop_action="hold")
-        elif run_by_time:
-            self.right_motor.run_timed(speed_sp=-int(running_speed), time_sp=int(running_time) * 1000)
-            if (twin_turn):
-                self.left_motor.run_forever(speed_sp=int(running_speed), time_sp=int(running_time) * 1000)
-            else:
-                self.left_motor.stop(stop_action="hold")
-            time.sleep(running_time)
+        def action():
+            for motor in motors:
+                if run_forever:
+                    motor.run_forever(speed_sp=speed)
+                else:
+                    motor.run_timed(speed_sp=speed, time_sp=running_time * 1000)
 
-        else:
-            running_dist = -self.turning_constant * int(turn_degree) / 2 / pi
-            self.left_motor.stop(stop_action="hold")
-            if (turn_degree < 0):
-                self.right_motor.run_to_rel_pos(position_sp= -running_dist, speed_sp=running_speed, stop_action="hold")
-            else:
-                self.right_motor.run_to_rel_pos(position_sp= running_dist, speed_sp=running_speed, stop_action="hold")
-            time.sleep(abs(running_dist / running_speed))
-
-    def right_side_turn(self, run_forever=True, run_by_deg=False, run_by_time=False, running_time=None, running_speed=None, turn_degree=None, twin_turn=False):
+        handle = self.motion.start(name, motors, action)
+        if wait and not run_forever:
+            handle.wait()
+        return handle
+
+    def set_wheel_speeds(self, left_speed, right_speed):
+        # Continuous steering set point, positive speeds drive forwards
+        def action():
+            self.left_motor.run_forever(speed_sp=-int(left_speed))
+            self.right_motor.run_forever(speed_sp=-int(right_speed))
+
+        return self.motion.start("set_wheel_speeds", [self.left_motor, self.right_motor], action)
+
+    def left_side_turn(self, run_forever=True, run_by_deg=False, run_by_time=False, running_time=None, running_speed=None, turn_degree=None, twin_turn=False, wait=True):
+        return self.__side_turn("left_side_turn", self.right_motor, self.left_motor, run_forever, run_by_deg,
+                                run_by_time, running_time, running_speed, turn_degree, twin_turn, wait)
+
+    def right_side_turn(self, run_forever=True, run_by_deg=False, run_by_time=False, running_time=None, running_speed=None, turn_degree=None, twin_turn=False, wait=True):
+        return self.__side_turn("right_side_turn", self.left_motor, self.right_motor, run_forever, run_by_deg,
+                                run_by_time, running_time, running_speed, turn_degree, twin_turn, wait)
+
+    def __side_turn(self, name, outer, inner, run_forever, run_by_deg, run_by_time, running_time, running_speed, turn_degree, twin_turn, wait):
+        # Turns by driving the outer wheel backwards, the inner wheel either holds or drives forwards with twin_turn
         # Default parameters
         if running_speed is None:
             running_speed = self.motor_running_speed
@@ -156,30 +153,84 @@ class GrowBot:
                 running_time = self.motor_running_time
 
         if run_forever:
-            self.left_motor.run_forever(speed_sp=-int(running_speed))
-            if (twin_turn):
-                self.right_motor.run_forever(speed_sp=int(running_speed))
-            else:
-                self.right_motor.stop(stop_action="hold")
+            def action():
+                outer.run_forever(speed_sp=-int(running_speed))
+                if (twin_turn):
+                    inner.run_forever(speed_sp=int(running_speed))
+                else:
+                    inner.stop(stop_action="hold")
         elif run_by_time:
-            self.left_motor.run_timed(speed_sp=-int(running_speed), time_sp=int(running_time) * 1000)
-            if (twin_turn):
-                self.right_motor.run_forever(speed_sp=int(running_speed), time_sp=int(running_time) * 1000)
-            else:
-                self.right_motor.stop(stop_action="hold")
-            time.sleep(running_time)
-
+            def action():
+                outer.run_timed(speed_sp=-int(running_speed), time_sp=int(running_time) * 1000)
+                if (twin_turn):
+                    inner.run_timed(speed_sp=int(running_speed), time_sp=int(running_time) * 1000)
+                else:
+                    inner.stop(stop_action="hold")
         else:
-            running_dist = -self.turning_constant * int(turn_degree) / 2 / pi
-            self.right_motor.stop(stop_action="hold")
-            if (turn_degree < 0):
-                self.left_motor.run_to_rel_pos(position_sp= -running_dist, speed_sp=running_speed, stop_action="hold")
-            else:
-                self.left_motor.run_to_rel_pos(position_sp= running_dist, speed_sp=running_speed, stop_action="hold")
-            time.sleep(abs(running_dist / running_speed))
+            # Closed loop on the outer wheel's tacho count, a spin in place needs half the travel per wheel
+            running_dist = -abs(self.turning_constant * int(turn_degree) / 2 / pi)
+            if twin_turn:
+                running_dist = running_dist / 2
+
+            controller = TurnController(outer, inner, running_dist, running_speed, twin_turn=twin_turn)
+            handle = self.motion.start(name, [outer, inner], controller.begin, controller=controller)
+            if wait:
+                handle.wait()
+            return handle
+
+        handle = self.motion.start(name, [outer, inner], action)
+        if wait and not run_forever:
+            handle.wait()
+        return handle
+
+    def calibrate_turning_constant(self, running_speed=100, revolutions=2, samples=720):
+        """
+        Fits turning_constant by pivoting on the spot while watching the front sensor. After one full revolution the
+        sensor sees the same surroundings again, so the tacho distance at which the distance profile best repeats
+        itself is the count for 360 degrees. Needs static, uneven surroundings within sensor range.
+        :param running_speed:   Speed of the outer wheel in tacho counts per second
+        :param revolutions:     Approximate number of revolutions to record, at least 2
+        :param samples:         Number of points the recording is resampled to per expected revolution
+        :return:                Fitted turning constant, which is also applied
+        """
+        expected = self.turning_constant * 2 * pi  # Counts per revolution with the current constant
+        recording = []
+
+        start = self.right_motor.position
+        self.left_motor.stop(stop_action="hold")
+        self.right_motor.run_forever(speed_sp=-int(running_speed))
+        try:
+            while abs(self.right_motor.position - start) < expected * revolutions * 1.2:
+                recording.append((abs(self.right_motor.position - start), self.front_sensor.value()))
+                time.sleep(0.01)
+        finally:
+            self.stop(sta="hold")
+
+        # Resample the distance profile on an even tacho grid
+        step = expected / samples
+        profile = []
+        j = 0
+        for i in range(int(recording[-1][0] / step)):
+            while recording[j + 1][0] < i * step:
+                j += 1
+            profile.append(recording[j][1])
+
+        # The period is the shift with the smallest mean difference between the profile and itself
+        best_shift, best_error = None, None
+        for shift in range(int(samples * 0.7), min(int(samples * 1.3), len(profile) - samples)):
+            error = sum(abs(profile[i] - profile[i + shift]) for i in range(len(profile) - shift)) / (len(profile) - shift)
+            if best_error is None or error < best_error:
+                best_shift, best_error = shift, error
+
+        if best_shift is None:
+            raise ValueError("Not enough data recorded to calibrate, turn for more revolutions.")
+
+        self.turning_constant = best_shift * step / 2 / pi
+        return self.turning_constant
 
     def stop(self, sta="brake"):
-        # Stop all the motors
+        # Stop all the motors, completing whatever was running
+        self.motion.preempt()
         self.left_motor.stop(stop_action=sta)
         self.right_motor.stop(stop_action=sta)
         self.arm_motor.stop(stop_action=sta)
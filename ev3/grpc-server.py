@@ -3,6 +3,9 @@ from concurrent import futures
 import logging
 import grpc
 import firmware
+import queue
+import random
+import threading
 import time
 import google.protobuf
 
@@ -10,48 +13,149 @@ import control_pb2
 import control_pb2_grpc
 
 _ONE_DAY_IN_SECONDS = 60 * 60 * 24
+_VERSION = "1.1.0"
 
 
 class EV3Servicer(control_pb2_grpc.EV3Servicer):
     """Provides methods that implement functionality of EV3 server."""
 
-    def __init__(self):
+    def __init__(self, telemetry_period=0.1):
         self.gb = firmware.GrowBot(-1, -1)
+        self.telemetry_period = telemetry_period
+
+    def SayHello(self, request, context):
+        logging.info("Client version %s connected", request.version)
+        return control_pb2.HelloVersion(version=_VERSION)
 
     def Move(self, request, context):
+        self.move(request.direction)
+        return google.protobuf.empty_pb2.Empty()
+
+    def MoveRandomly(self, request, context):
+        self.move_randomly()
+        return google.protobuf.empty_pb2.Empty()
+
+    def MoveArm(self, request, context):
         direction = request.direction
+
+        if direction == control_pb2.MoveArmRequest.STOP:
+            context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+            context.set_details('Method not implemented!')
+            raise NotImplementedError('Method not implemented!')
+
+        self.move_arm(direction)
+        return google.protobuf.empty_pb2.Empty()
+
+    def Control(self, request_iterator, context):
+        """
+        Bidirectional control stream. Commands are executed in the order they arrive on a worker thread, so reading
+        the stream never waits on the firmware. The response stream interleaves a Completion for every command with
+        a SensorReading every telemetry_period seconds.
+        """
+        commands = queue.Queue()
+        telemetry = queue.Queue()
+
+        def read_commands():
+            try:
+                for command in request_iterator:
+                    commands.put((time.monotonic(), command))
+            finally:
+                commands.put(None)
+
+        def run_commands():
+            while True:
+                item = commands.get()
+                if item is None:
+                    break
+                received, command = item
+                telemetry.put(control_pb2.Telemetry(completion=self.execute(received, command)))
+            telemetry.put(None)
+
+        threading.Thread(target=read_commands, name="grpc_reader", daemon=True).start()
+        threading.Thread(target=run_commands, name="grpc_runner", daemon=True).start()
+
+        next_reading = time.monotonic()
+        while context.is_active():
+            try:
+                message = telemetry.get(timeout=max(0, next_reading - time.monotonic()))
+            except queue.Empty:
+                next_reading = time.monotonic() + self.telemetry_period
+                yield control_pb2.Telemetry(sensor=control_pb2.SensorReading(
+                    front=int(self.gb.front_sensor.value()),
+                    back=int(self.gb.back_sensor.value()),
+                ))
+                continue
+
+            if message is None:
+                # Client closed its side and every command has completed
+                return
+            yield message
+
+    def execute(self, received, command):
+        """
+        Executes a single streamed command.
+        :param received:    Monotonic time the command was read from the stream
+        :param command:     Command message
+        :return:            Completion message for the command
+        """
+        if command.deadline_ms and (time.monotonic() - received) * 1000 > command.deadline_ms:
+            return control_pb2.Completion(seq=command.seq, status=control_pb2.Completion.EXPIRED)
+
+        kind = command.WhichOneof("command")
+        try:
+            if kind == "move":
+                self.move(command.move.direction)
+            elif kind == "move_arm":
+                self.move_arm(command.move_arm.direction)
+            elif kind == "move_randomly":
+                self.move_randomly()
+            else:
+                raise ValueError("empty command")
+        except Exception as e:
+            return control_pb2.Completion(seq=command.seq, status=control_pb2.Completion.FAILED, detail=str(e))
+
+        return control_pb2.Completion(seq=command.seq, status=control_pb2.Completion.OK)
+
+    def move(self, direction):
         if direction == control_pb2.MoveRequest.FORWARD:
             self.gb.drive_forward()
         elif direction == control_pb2.MoveRequest.BACKWARD:
             self.gb.drive_backward()
         elif direction == control_pb2.MoveRequest.LEFT:
             self.gb.left_side_turn()
-        elif direction == control_pb2.MoveArmRequest.RIGHT:
+        elif direction == control_pb2.MoveRequest.RIGHT:
             self.gb.right_side_turn()
+        elif direction == control_pb2.MoveRequest.BRAKE:
+            self.gb.stop()
 
-        return google.protobuf.empty_pb2.Empty()
-
-    def MoveArm(self, request, context):
-        direction = request.direction
-
+    def move_arm(self, direction):
         if direction == control_pb2.MoveArmRequest.UP:
             self.gb.raise_arm()
         elif direction == control_pb2.MoveArmRequest.DOWN:
             self.gb.lower_arm()
         elif direction == control_pb2.MoveArmRequest.STOP:
-            context.set_code(grpc.StatusCode.UNIMPLEMENTED)
-            context.set_details('Method not implemented!')
-            raise NotImplementedError('Method not implemented!')
+            self.gb.arm_motor.stop(stop_action="hold")
 
-        return google.protobuf.empty_pb2.Empty()
+    def move_randomly(self):
+        # Turn in a random direction, then keep driving forward
+        if random.random() < 0.5:
+            self.gb.left_side_turn(run_forever=False, run_by_deg=True, turn_degree=random.randint(30, 180))
+        else:
+            self.gb.right_side_turn(run_forever=False, run_by_deg=True, turn_degree=random.randint(30, 180))
+        self.gb.drive_forward()
 
 
-def serve():
+def serve(port=50051):
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
     control_pb2_grpc.add_EV3Servicer_to_server(
         EV3Servicer(), server)
-    server.add_insecure_port('[::]:50051')
+    server.add_insecure_port('[::]:{}'.format(port))
     server.start()
+    return server
+
+
+def main():
+    server = serve()
 
     try:
         while True:
@@ -62,4 +166,4 @@ def serve():
 
 if __name__ == "__main__":
     logging.basicConfig()
-    serve()
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Compares the streaming gRPC control surface with the websocket link used by ev3-client.
+
+Both links run in this process against the mock firmware (set MOCK=True in config.py) and execute stop commands.
+The websocket link is the real one: the Pi's RemoteMotorController, imported from the parent directory, serves its
+single-slot message to EV3_Client's receiver loop, which runs every message on a thread of its own.
+
+Latency is measured one command at a time from sending it to the EV3 having executed it. For gRPC throughput is
+measured by pipelining every command. RemoteMotorController waits a second after every command it posts, so its
+throughput is that of posting commands one after another, and a burst of commands posted without waiting shows how
+many reach the EV3 rather than being overwritten in the slot.
+"""
+import asyncio
+import contextlib
+import importlib
+import io
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+
+import grpc
+
+import control_pb2
+import control_pb2_grpc
+
+# RemoteMotorController is the Pi's, the EV3's own modules such as config come first
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COMMANDS = 1000
+WS_COMMANDS = 20    # One after another, RemoteMotorController waits a second after each
+GRPC_PORT = 50151
+WS_PORT = 18866
+
+
+def report(name, latencies, throughput):
+    latencies = sorted(latencies)
+    return "{:9} latency p50={:.2f}ms p99={:.2f}ms, throughput {}".format(
+        name,
+        statistics.median(latencies) * 1000,
+        latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000,
+        throughput)
+
+
+def brake(seq):
+    return control_pb2.Command(seq=seq, move=control_pb2.MoveRequest(direction=control_pb2.MoveRequest.BRAKE))
+
+
+def bench_grpc():
+    server = importlib.import_module("grpc-server").serve(GRPC_PORT)
+
+    with grpc.insecure_channel("localhost:{}".format(GRPC_PORT)) as channel:
+        stub = control_pb2_grpc.EV3Stub(channel)
+        outgoing = queue.Queue()
+        responses = stub.Control(iter(outgoing.get, None))
+
+        def completions():
+            for telemetry in responses:
+                if telemetry.HasField("completion"):
+                    yield telemetry.completion
+
+        completed = completions()
+
+        latencies = []
+        for seq in range(COMMANDS):
+            start = time.perf_counter()
+            outgoing.put(brake(seq))
+            next(completed)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for seq in range(COMMANDS):
+            outgoing.put(brake(seq))
+        for _ in range(COMMANDS):
+            next(completed)
+        elapsed = time.perf_counter() - start
+
+        outgoing.put(None)
+
+    server.stop(0)
+    return report("gRPC", latencies, "{:.0f} commands/s".format(COMMANDS / elapsed))
+
+
+class _RobotController:
+    """
+    The RobotController as far as RemoteMotorController needs one to send commands.
+    """
+    remote = None
+
+
+def bench_websocket():
+    from RemoteMotorController import RemoteMotorController
+    ev3_client = importlib.import_module("ev3-client")
+
+    executed = queue.Queue()
+
+    class Client(ev3_client.EV3_Client):
+        def message_process(self, msg):
+            super().message_process(msg)
+            executed.put(time.perf_counter())
+
+    # The Pi serves the commands, the EV3 connects to it
+    motor_controller = RemoteMotorController(_RobotController())
+    serving = threading.Event()
+
+    def serve():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        motor_controller.connect(WS_PORT, sender=True)
+        serving.set()
+        asyncio.get_event_loop().run_forever()
+
+    def receive():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        asyncio.get_event_loop().run_until_complete(client.setup_receiver(WS_PORT))
+
+    threading.Thread(target=serve, daemon=True).start()
+    serving.wait()
+    client = Client(host="localhost")
+    threading.Thread(target=receive, daemon=True).start()
+    while motor_controller.ws_receiver is None:
+        time.sleep(0.01)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(WS_COMMANDS):
+        posted = time.perf_counter()
+        motor_controller.stop()
+        latencies.append(executed.get(timeout=5) - posted)
+    elapsed = time.perf_counter() - start
+
+    # Commands posted by several threads at once, e.g. the Navigator and the API, share the single slot
+    for _ in range(COMMANDS):
+        motor_controller._RemoteMotorController__post(motor_controller.generate_action_package("stop"))
+    delivered = 0
+    with contextlib.suppress(queue.Empty):
+        while True:
+            executed.get(timeout=1)
+            delivered += 1
+
+    return report("websocket", latencies, "{:.2f} commands/s one after another, {} of a burst of {} executed".format(
+        WS_COMMANDS / elapsed, delivered, COMMANDS))
+
+
+def main():
+    # The mock motors print every call, keep that out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [bench_grpc(), bench_websocket()]
+
+    for line in results:
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from random import random
+import time
 
 class MockSensor:
     connected = True
@@ -9,19 +10,52 @@ class MockSensor:
 
 class MockMotor:
     connected = True
-    is_running = True
+    count_per_rot = 360
 
     def __init__(self, name):
         self.name = name
+        self._start_position = 0
+        self._start_time = time.time()
+        self._speed = 0
+        self._duration = 0  # Seconds until the command ends, None for forever
+
+    @property
+    def position(self):
+        elapsed = time.time() - self._start_time
+        if self._duration is not None:
+            elapsed = min(elapsed, self._duration)
+        return int(self._start_position + self._speed * elapsed)
+
+    @property
+    def is_running(self):
+        return self._duration is None or time.time() - self._start_time < self._duration
+
+    @property
+    def state(self):
+        return ["running"] if self.is_running else []
+
+    def _command(self, speed_sp, duration):
+        self._start_position = self.position
+        self._start_time = time.time()
+        self._speed = speed_sp
+        self._duration = duration
 
     def run_forever(self, speed_sp=0):
         print("Running at speed {} forever".format(speed_sp))
+        self._command(speed_sp, None)
 
     def run_timed(self, speed_sp=0, time_sp=0):
         print("Running at speed {} for {}".format(speed_sp, time_sp))
+        self._command(speed_sp, time_sp / 1000)
+
+    def run_to_rel_pos(self, position_sp=0, speed_sp=0, stop_action="hold"):
+        print("Running at speed {} to relative position {}".format(speed_sp, position_sp))
+        speed = abs(speed_sp) if position_sp >= 0 else -abs(speed_sp)
+        self._command(speed, abs(position_sp / speed_sp) if speed_sp else 0)
 
     def stop(self, stop_action):
         print("Stopping with action {}".format(stop_action))
+        self._command(0, 0)
 
 class LargeMotor(MockMotor):
     pass
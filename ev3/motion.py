@@ -0,0 +1,228 @@
+import math
+import threading
+import time
+
+from ev3_tracing import tracer
+
+
+class MotionHandle:
+    """
+    Handle of a motion command issued to one or more motors.
+
+    The handle completes once every motor it owns reports that it stopped running, or as soon as another command
+    takes over one of its motors.
+    """
+    RUNNING = "running"
+    DONE = "done"
+    PREEMPTED = "preempted"
+
+    def __init__(self, name, motors, controller=None):
+        self.name = name
+        self.motors = motors
+        self.controller = controller
+        self.result = None
+        self.status = MotionHandle.RUNNING
+        self.started = time.time()
+        self.finished = None
+        self.seen_running = False
+        self.__event = threading.Event()
+        self.__callbacks = []
+        self.__lock = threading.Lock()
+
+    def done(self):
+        return self.__event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the motion completes.
+        :param timeout: Maximum time to wait in seconds, None to wait forever
+        :return:        True if the motion completed
+        """
+        return self.__event.wait(timeout)
+
+    def add_done_callback(self, fn):
+        """
+        Calls fn(handle) once the motion completes, immediately if it already has.
+        :param fn:  Callback
+        :return:
+        """
+        with self.__lock:
+            if not self.done():
+                self.__callbacks.append(fn)
+                return
+        fn(self)
+
+    def _finish(self, status):
+        with self.__lock:
+            if self.done():
+                return
+            self.status = status
+            self.finished = time.time()
+            self.__event.set()
+            callbacks, self.__callbacks = self.__callbacks, []
+
+        for fn in callbacks:
+            fn(self)
+
+    def __repr__(self):
+        return "MotionHandle({}, {})".format(self.name, self.status)
+
+
+class MotionController:
+    """
+    Motion state machine shared by all motors of the robot.
+
+    Each motor is owned by at most one running handle. Issuing a new command preempts the handles owning any of its
+    motors, and a background thread polls the motors every update_period seconds to complete handles whose motors
+    stopped.
+    """
+
+    def __init__(self, update_period=0.02, grace_period=0.1):
+        """
+        Constructor for MotionController class.
+        :param update_period:   Seconds between two polls of the motor state
+        :param grace_period:    Seconds a motor may take to report running after a command before it is considered
+                                done anyway
+        """
+        self.update_period = update_period
+        self.grace_period = grace_period
+        self.__active = []
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, name="motion", daemon=True)
+        self.__thread.start()
+
+    def start(self, name, motors, action, controller=None):
+        """
+        Issues a motion command.
+        :param name:        Human readable name of the command
+        :param motors:      Motors the command drives
+        :param action:      Function sending the command to the motors
+        :param controller:  Optional closed-loop controller, its step(dt) is called every update and the handle
+                            completes once it returns True
+        :return:            MotionHandle of the command
+        """
+        handle = MotionHandle(name, motors, controller)
+        self.preempt(motors)
+        with tracer.span("firmware:" + name):
+            action()
+
+        with self.__lock:
+            self.__active.append(handle)
+        self.__wakeup.set()
+
+        return handle
+
+    def preempt(self, motors=None):
+        """
+        Completes the running handles owning any of the given motors as preempted.
+        :param motors:  Motors to take over, None for all
+        :return:
+        """
+        with self.__lock:
+            preempted = [h for h in self.__active if motors is None or any(m in h.motors for m in motors)]
+            self.__active = [h for h in self.__active if h not in preempted]
+
+        for handle in preempted:
+            handle._finish(MotionHandle.PREEMPTED)
+
+    def __run(self):
+        last = time.time()
+        while True:
+            self.__wakeup.wait()
+            time.sleep(self.update_period)
+            now = time.time()
+            dt, last = now - last, now
+
+            with self.__lock:
+                active = list(self.__active)
+
+            finished = []
+            for handle in active:
+                if handle.controller is not None:
+                    if handle.controller.step(min(dt, 5 * self.update_period)):
+                        handle.result = handle.controller.result()
+                        finished.append(handle)
+                    continue
+
+                running = any(motor.is_running for motor in handle.motors)
+                if running:
+                    handle.seen_running = True
+                elif handle.seen_running or time.time() - handle.started > self.grace_period:
+                    finished.append(handle)
+
+            with self.__lock:
+                self.__active = [h for h in self.__active if h not in finished]
+                if not self.__active:
+                    self.__wakeup.clear()
+
+            for handle in finished:
+                handle._finish(MotionHandle.DONE)
+
+
+class TurnController:
+    """
+    Closed-loop turn using tacho feedback.
+
+    The outer wheel is driven towards a target position with a trapezoidal speed profile: it accelerates up to
+    max_speed and slows down early enough to stop on the target, then both wheels hold. With twin_turn the inner wheel
+    mirrors the outer one so the robot spins in place.
+    """
+
+    def __init__(self, outer, inner, counts, max_speed, twin_turn=False, acceleration=3000, min_speed=40,
+                 tolerance=3):
+        """
+        Constructor for TurnController class.
+        :param outer:           Motor driven forwards
+        :param inner:           Motor holding, or driven backwards with twin_turn
+        :param counts:          Signed tacho counts for the outer wheel to travel
+        :param max_speed:       Maximum speed in tacho counts per second
+        :param twin_turn:       Drive the inner wheel in the opposite direction
+        :param acceleration:    Ramp in tacho counts per second squared
+        :param min_speed:       Speed below which the motors would stall
+        :param tolerance:       Remaining counts at which the turn is considered complete
+        """
+        self.outer = outer
+        self.inner = inner
+        self.counts = counts
+        self.max_speed = abs(max_speed)
+        self.twin_turn = twin_turn
+        self.acceleration = acceleration
+        self.min_speed = min_speed
+        self.tolerance = tolerance
+        self.direction = 1 if counts >= 0 else -1
+        self.speed = 0
+        self.start_position = None
+
+    def begin(self):
+        self.start_position = self.outer.position
+        if not self.twin_turn:
+            self.inner.stop(stop_action="hold")
+        self.step(0)
+
+    def travelled(self):
+        return (self.outer.position - self.start_position) * self.direction
+
+    def step(self, dt):
+        remaining = abs(self.counts) - self.travelled()
+        if remaining <= self.tolerance:
+            self.outer.stop(stop_action="hold")
+            self.inner.stop(stop_action="hold")
+            return True
+
+        # Accelerate, but never faster than what still allows braking before the target
+        self.speed = min(self.max_speed,
+                         self.speed + self.acceleration * dt,
+                         math.sqrt(2 * self.acceleration * remaining))
+        speed = int(max(self.speed, self.min_speed)) * self.direction
+
+        self.outer.run_forever(speed_sp=speed)
+        if self.twin_turn:
+            self.inner.run_forever(speed_sp=-speed)
+        return False
+
+    def result(self):
+        """
+        :return:    Tacho counts the outer wheel actually travelled
+        """
+        return self.travelled() * self.direction
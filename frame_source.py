@@ -0,0 +1,141 @@
+"""
+Camera frames without the latency of the driver's buffer queue.
+
+cv2.VideoCapture hands out frames in the order V4L2 queued them, so a consumer slower than the camera gets frames
+that waited in the queue for several hundred milliseconds. FrameSource grabs on a thread of its own as fast as the
+camera delivers and keeps only the newest frame, so whoever reads gets the freshest one there is. Frames carry the
+monotonic time they were grabbed at and a sequence number, which tells a reader how many it skipped.
+
+    source = FrameSource(resolution=(640, 480), pixel_format="MJPG").start()
+    frame = source.read()       # Frame(image, timestamp, sequence)
+    source.stop()
+"""
+import logging as log
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+from metrics import registry
+
+Frame = namedtuple("Frame", ["image", "timestamp", "sequence"])
+Frame.__doc__ = """
+Frame grabbed by a FrameSource.
+:param image:       BGR image
+:param timestamp:   time.monotonic() when the camera handed it over
+:param sequence:    Number of the frame since the source started, counting from 1
+"""
+
+# Frame ages in milliseconds, from the next frame being due at 30 fps to a stalled camera
+AGE_BUCKETS = (5, 10, 20, 35, 50, 75, 100, 150, 250, 500, 1000, float("inf"))
+
+
+class FrameSource:
+    """
+    Grabs frames from a camera on a background thread, keeping only the newest one.
+    """
+
+    def __init__(self, device=0, resolution=(640, 480), pixel_format="MJPG", buffer_size=1, fps=None):
+        """
+        Constructor for FrameSource class.
+        :param device:          Camera index or video file, as for cv2.VideoCapture
+        :param resolution:      (width, height) asked of the camera, None for its default
+        :param pixel_format:    FourCC asked of the camera, "MJPG" or "YUYV". MJPEG keeps USB bandwidth low enough
+                                for 30 fps at 640x480, YUYV spares decoding it. None for the camera's default
+        :param buffer_size:     Buffers the driver queues, fewer means less latency before frames are grabbed
+        :param fps:             Frame rate asked of the camera, None for its default
+        """
+        self.device = device
+        self.resolution = resolution
+        self.pixel_format = pixel_format
+        self.buffer_size = buffer_size
+        self.fps = fps
+        self.width = None
+        self.height = None
+        self.running = False
+        self.__cap = None
+        self.__thread = None
+        self.__condition = threading.Condition()
+        self.__latest = None
+        self.__consumed = 0         # Sequence number of the last frame read
+
+        self.__age_ms = registry.histogram("growbot_camera_frame_age_ms",
+                                           "Time from a frame being grabbed to it being read in ms", AGE_BUCKETS)
+        self.__skipped = registry.counter("growbot_camera_frames_skipped_total",
+                                          "Frames replaced by a newer one before being read")
+
+    def start(self):
+        """
+        Opens the camera and starts grabbing.
+        :return:    self
+        """
+        self.__cap = cv2.VideoCapture(self.device)
+        if not self.__cap.isOpened():
+            raise IOError("Could not open camera {}".format(self.device))
+
+        # The format has to be set before the resolution for some UVC drivers to accept both
+        if self.pixel_format is not None:
+            self.__cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.pixel_format))
+        if self.resolution is not None:
+            self.__cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+            self.__cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+        if self.fps is not None:
+            self.__cap.set(cv2.CAP_PROP_FPS, self.fps)
+        self.__cap.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+
+        self.width = self.__cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+        self.height = self.__cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        log.info("[CAMERA] Capturing {:.0f}x{:.0f} from {}".format(self.width, self.height, self.device))
+
+        self.running = True
+        self.__thread = threading.Thread(target=self.__grab, name="camera", daemon=True)
+        self.__thread.start()
+        return self
+
+    def __grab(self):
+        sequence = 0
+        try:
+            while self.running:
+                ret, image = self.__cap.read()
+                if not ret:
+                    log.error("[CAMERA] Failed to grab a frame from {}".format(self.device))
+                    break
+                sequence += 1
+                with self.__condition:
+                    self.__latest = Frame(image, time.monotonic(), sequence)
+                    self.__condition.notify_all()
+        finally:
+            self.running = False
+            self.__cap.release()
+            with self.__condition:
+                self.__condition.notify_all()
+
+    def read(self, timeout=None):
+        """
+        Returns the newest frame, waiting for one newer than the last frame read. There's no need to wait for the
+        camera to warm up before the first call.
+        :param timeout: Seconds to wait at most, None to wait until a frame comes or the source stops
+        :return:        Frame, None if the source stopped or timed out
+        """
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: not self.running or self.__newer(), timeout) or not self.__newer():
+                return None
+            frame = self.__latest
+
+        self.__skipped.inc(frame.sequence - self.__consumed - 1)
+        self.__consumed = frame.sequence
+        self.__age_ms.observe((time.monotonic() - frame.timestamp) * 1000)
+        return frame
+
+    def __newer(self):
+        return self.__latest is not None and self.__latest.sequence > self.__consumed
+
+    def stop(self):
+        """
+        Stops grabbing and releases the camera.
+        :return:
+        """
+        self.running = False
+        if self.__thread is not None and self.__thread is not threading.current_thread():
+            self.__thread.join()
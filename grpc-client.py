@@ -10,6 +10,41 @@ import control_pb2
 import control_pb2_grpc
 
 
+def run_unary(stub):
+    while True:
+        print("Waiting 1s")
+        time.sleep(1)
+        print("Sending move")
+        move = control_pb2.MoveRequest(
+            direction=control_pb2.MoveRequest.FORWARD
+        )
+
+        stub.Move(move)
+
+
+def commands():
+    seq = 0
+    while True:
+        print("Streaming move {}".format(seq))
+        yield control_pb2.Command(
+            seq=seq,
+            deadline_ms=500,
+            move=control_pb2.MoveRequest(direction=control_pb2.MoveRequest.FORWARD),
+        )
+        seq += 1
+        time.sleep(1)
+
+
+def run_stream(stub):
+    for telemetry in stub.Control(commands()):
+        if telemetry.HasField("completion"):
+            completion = telemetry.completion
+            print("Command {} completed: {}".format(
+                completion.seq, control_pb2.Completion.Status.Name(completion.status)))
+        else:
+            print("Sensors: front={} back={}".format(telemetry.sensor.front, telemetry.sensor.back))
+
+
 def run():
     # NOTE(gRPC Python Team): .close() is possible on a channel and should be
     # used in circumstances in which the with statement does not fit the needs
@@ -17,16 +52,12 @@ def run():
     host = os.getenv("HOST", "robot:50051") # HOST=localhost:50051 when you want to test
     with grpc.insecure_channel(host) as channel:
         stub = control_pb2_grpc.EV3Stub(channel)
-        
-        while True:
-            print("Waiting 1s")
-            time.sleep(1)
-            print("Sending move")
-            move = control_pb2.MoveRequest(
-                direction=control_pb2.MoveRequest.FORWARD
-            )
-
-            stub.Move(move)
+        print("Server version {}".format(stub.SayHello(control_pb2.HelloVersion(version="1.1.0")).version))
+
+        if os.getenv("MODE", "stream") == "unary":
+            run_unary(stub)
+        else:
+            run_stream(stub)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,281 @@
+"""
+Capture and inference in a process of their own, so they don't take turns on the GIL with the rest of the robot.
+
+Vision spends much of every frame holding the GIL: resizing the frame for the network, decoding the output blob,
+drawing, and JPEG encoding the frames it streams. In one process this competes with the Navigator, QR decoding, the
+websocket loops, the scheduler and the serial reads, and a 4-core Pi ends up running little more than one core's
+worth of Python. InferenceProcess builds the Vision in a spawned worker process. RobotController still gets every
+frame through process_visual_data, from InferenceProcess.start() on a thread of its own, just as if Vision called it.
+
+Frames and detections are not pickled. They go through a ring of slots in shared memory, which the worker copies
+each frame into and the parent copies it out of. Only slot numbers and a few numbers go through a pipe: which slot
+holds which camera's frame, and back from the parent, which slot is free again along with what MotionGate and
+draw_info ask of the RobotController.
+
+    def build_vision(robot_controller):         # Called in the worker, must be picklable, i.e. module level
+        return Vision(model_xml, model_bin, robot_controller, ...)
+
+    vision = InferenceProcess(build_vision, robot_controller)  # Returns once the network is loaded
+    vision.start()                              # Hands frames to robot_controller.process_visual_data until stopped
+    vision.stop()
+
+Logging, metrics and tracing of the worker are its own, build sets them up. Recording is left to the parent, which
+records the main camera's frames as Vision would.
+"""
+import collections
+import logging as log
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from metrics import registry
+from recording import recorder
+
+# Labels Vision reports, detections carry their index
+LABELS = ("Obstacle", "Plant")
+# Columns of a detection in a slot: label index, confidence, xmin, ymin, xmax, ymax
+DETECTION_COLUMNS = 6
+
+
+class FrameRing:
+    """
+    Slots in shared memory, each holding a frame and its detections.
+    """
+
+    def __init__(self, slots, frame_bytes, max_detections, name=None):
+        """
+        Constructor for FrameRing class.
+        :param slots:           Number of slots
+        :param frame_bytes:     Size of the largest frame a slot holds
+        :param max_detections:  Detections a slot holds at most
+        :param name:            Name of the shared memory to attach to, None to create it
+        """
+        self.slots = slots
+        # Detections are float64, which want to be aligned
+        self.frame_bytes = -(-frame_bytes // 64) * 64
+        self.max_detections = max_detections
+        size = slots * (self.frame_bytes + max_detections * DETECTION_COLUMNS * 8)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size if name is None else 0)
+        self.name = self.shm.name
+        self.__frames = np.ndarray((slots, self.frame_bytes), dtype=np.uint8, buffer=self.shm.buf)
+        self.__detections = np.ndarray((slots, max_detections, DETECTION_COLUMNS), dtype=np.float64,
+                                       buffer=self.shm.buf, offset=slots * self.frame_bytes)
+
+    def write(self, slot, frame, predictions):
+        """
+        :param slot:        Slot to write to
+        :param frame:       Frame, uint8 array
+        :param predictions: Predictions detected in it, as Vision hands them over
+        :return:            Number of predictions written, those beyond max_detections are dropped
+        """
+        if frame.nbytes > self.frame_bytes:
+            raise ValueError("{} frame of {} bytes doesn't fit in a slot of {}".format(frame.shape, frame.nbytes,
+                                                                                         self.frame_bytes))
+        self.__frames[slot, :frame.nbytes].reshape(frame.shape)[...] = frame
+        count = min(len(predictions), self.max_detections)
+        detections = self.__detections[slot]
+        for i, (label, confidence, ((xmin, ymin), (xmax, ymax))) in enumerate(predictions[:count]):
+            detections[i] = (LABELS.index(label), confidence, xmin, ymin, xmax, ymax)
+        return count
+
+    def read(self, slot, shape, count):
+        """
+        :param slot:    Slot to read from
+        :param shape:   Shape of the frame in it
+        :param count:   Number of predictions in it
+        :return:        Tuple of a copy of the frame and its predictions, as Vision hands them over
+        """
+        frame = np.array(self.__frames[slot, :int(np.prod(shape))].reshape(shape))
+        rows = self.__detections[slot, :count].tolist()
+        predictions = [(LABELS[int(row[0])], row[1], ((int(row[2]), int(row[3])), (int(row[4]), int(row[5]))))
+                       for row in rows]
+        return frame, predictions
+
+    def close(self, unlink=False):
+        """
+        :param unlink:  Whether to free the shared memory too, done by whoever created it
+        :return:
+        """
+        # Views into the buffer have to go before it can be closed
+        self.__frames = self.__detections = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class _WorkerController:
+    """
+    Stands in for the RobotController in the worker process, writing frames to the ring.
+    """
+
+    def __init__(self, conn, ring):
+        self.conn = conn
+        self.ring = ring
+        self.vision = None
+        self.still = False
+        self.needed = True
+        self.state = ""
+        self.stopping = False
+        self.__free = collections.deque(range(ring.slots))
+        self.__condition = threading.Condition()
+
+    def listen(self):
+        threading.Thread(target=self.__receive, name="inference-control", daemon=True).start()
+
+    def __receive(self):
+        try:
+            while True:
+                message = self.conn.recv()
+                if message[0] == "release":
+                    _, slot, self.still, self.needed, self.state = message
+                    with self.__condition:
+                        self.__free.append(slot)
+                        self.__condition.notify()
+                elif message[0] == "stop":
+                    break
+        except (EOFError, OSError):
+            log.warning("[INFERENCE_PROCESS] Parent went away, stopping")
+        with self.__condition:
+            self.stopping = True
+            self.__condition.notify()
+        # Stopping the cameras ends the Vision loop
+        self.vision.cleanup()
+
+    def is_still(self):
+        return self.still
+
+    def detections_needed(self):
+        return self.needed
+
+    def get_state(self):
+        return self.state
+
+    def process_visual_data(self, predictions, frame, camera="front"):
+        # Waits while the parent is behind by every slot
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__free or self.stopping)
+            if self.stopping:
+                return
+            slot = self.__free.popleft()
+        count = self.ring.write(slot, frame, predictions)
+        self.conn.send(("frame", slot, camera, frame.shape, count, time.monotonic()))
+
+
+def _run(build, conn, name, slots, frame_bytes, max_detections):
+    """
+    Entry point of the worker process.
+    """
+    ring = FrameRing(slots, frame_bytes, max_detections, name=name)
+    controller = _WorkerController(conn, ring)
+    try:
+        try:
+            controller.vision = build(controller)
+        except Exception as e:
+            log.exception("[INFERENCE_PROCESS] Failed to build Vision")
+            conn.send(("error", repr(e)))
+            return
+        conn.send(("ready",))
+        controller.listen()
+        try:
+            controller.vision.start()
+        finally:
+            conn.send(("stopped",))
+    finally:
+        ring.close()
+
+
+class InferenceProcess:
+    """
+    Runs a Vision in a worker process, handing its frames to a RobotController in this one.
+    """
+
+    def __init__(self, build, robot_controller, slots=3, max_frame=(640, 480), max_detections=100, main="front"):
+        """
+        Constructor for InferenceProcess class. Starts the worker and waits for it to build the Vision.
+        :param build:               Function taking a stand-in for the RobotController and returning the Vision to
+                                    run, called in the worker. Has to be picklable
+        :param robot_controller:    RobotController handed every frame
+        :param slots:               Frames in flight between the processes at most. Two keep the worker from waiting
+                                    for the parent to take a frame, one more absorbs a hiccup
+        :param max_frame:           (width, height) of the largest colour frame of any camera
+        :param max_detections:      Predictions per frame handed over at most
+        :param main:                Name of the camera whose frames are recorded
+        """
+        self.robot_controller = robot_controller
+        self.main = main
+        self.ring = FrameRing(slots, max_frame[0] * max_frame[1] * 3, max_detections)
+        self.__send_lock = threading.Lock()
+
+        self.__handover_ms = registry.histogram("growbot_inference_process_handover_ms",
+                                                "From a frame written to shared memory to it being handed to "
+                                                "RobotController in ms")
+
+        # A fresh interpreter rather than a fork of this one and its threads
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_run, name="inference",
+                                       args=(build, child, self.ring.name, slots, self.ring.frame_bytes,
+                                             max_detections),
+                                       daemon=True)
+        started = time.monotonic()
+        self.process.start()
+        child.close()
+
+        try:
+            message = self.conn.recv()
+        except EOFError:
+            self.process.join()
+            message = ("error", "exit code {}".format(self.process.exitcode))
+        if message[0] != "ready":
+            self.process.join()
+            self.ring.close(unlink=True)
+            raise RuntimeError("Inference process failed to start: {}".format(message[1]))
+        log.info("[INFERENCE_PROCESS] Worker %s ready after %.2fs", self.process.pid, time.monotonic() - started)
+
+    def start(self):
+        """
+        Hands the worker's frames to the RobotController until the worker stops.
+        :return:
+        """
+        try:
+            while True:
+                message = self.conn.recv()
+                if message[0] != "frame":
+                    break
+                _, slot, camera, shape, count, written = message
+                frame, predictions = self.ring.read(slot, shape, count)
+                # The slot is free for the worker again as soon as the frame is copied out
+                try:
+                    self.__send(("release", slot, self.robot_controller.is_still(),
+                                 self.robot_controller.detections_needed(), self.robot_controller.get_state()))
+                except OSError:
+                    # A worker stopping may exit before taking its last slots back, what it sent is still read
+                    pass
+                self.__handover_ms.observe((time.monotonic() - written) * 1000)
+
+                if camera == self.main:
+                    recorder.frame(frame)
+                self.robot_controller.process_visual_data(predictions, frame, camera)
+        except (EOFError, OSError):
+            log.error("[INFERENCE_PROCESS] Worker %s went away", self.process.pid)
+        finally:
+            self.process.join(5)
+            self.ring.close(unlink=True)
+            log.info("[INFERENCE_PROCESS] Worker stopped with exit code %s", self.process.exitcode)
+
+    def stop(self):
+        """
+        Asks the worker to stop its cameras, start() returns once it has.
+        :return:
+        """
+        try:
+            self.__send(("stop",))
+        except OSError:
+            pass
+
+    def __send(self, message):
+        with self.__send_lock:
+            self.conn.send(message)
@@ -0,0 +1,200 @@
+"""
+Logging set up for the per-frame hot path.
+
+configure() replaces the root handlers with a QueueHandler, so threads logging from the vision loop only build a
+record and queue it. Formatting the message and writing it happen on a background QueueListener. Call sites logging
+once per frame or sensor sample can be rate limited or sampled, and records can additionally go to a JSON lines file for later
+analysis.
+
+Log calls should pass their arguments instead of formatting them, log.info("Turning by %s degrees", angle), so
+nothing is formatted for records that are filtered out. The arguments are formatted later on the listener thread, so
+they must not be changed after the call.
+"""
+import atexit
+import json
+import logging
+import queue
+import re
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+DEFAULT_FORMAT = "[ %(asctime)s ] [ %(levelname)s ] %(message)s\033[0m"
+
+_ANSI = re.compile(r"\033\[[0-9;]*m")
+_listener = None
+
+
+def strip_colour(text):
+    """
+    :param text:    Text possibly containing ANSI colour codes
+    :return:        Text without them
+    """
+    return _ANSI.sub("", text)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most rate records per second from each call site, with bursts of up to burst records. The next
+    record let through from a site carries the number of records dropped since in its suppressed attribute.
+    """
+
+    def __init__(self, rate=1.0, burst=5, max_level=logging.INFO):
+        """
+        Constructor for RateLimitFilter class.
+        :param rate:        Records per second per call site
+        :param burst:       Records a call site may log at once after being quiet
+        :param max_level:   Highest level limited, warnings and errors always pass by default
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_level = max_level
+        # Call site to (tokens, time of last record, records suppressed). Updates from concurrent threads may race,
+        # which at worst lets an extra record through or loses a count
+        self.__sites = {}
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = record.created
+        tokens, last, suppressed = self.__sites.get(key, (self.burst, now, 0))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+        if tokens < 1:
+            self.__sites[key] = (tokens, now, suppressed + 1)
+            return False
+
+        self.__sites[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """
+    Lets through one in every "every" records from each call site, starting with the first. Unlike RateLimitFilter this
+    scales with the frame rate. Suppressed counts are reported the same way.
+    """
+
+    def __init__(self, every=4, max_level=logging.INFO):
+        """
+        Constructor for SampleFilter class.
+        :param every:       Keep one record per this many from a call site
+        :param max_level:   Highest level sampled, warnings and errors always pass by default
+        """
+        super().__init__()
+        self.every = every
+        self.max_level = max_level
+        self.__sites = {}   # Call site to records seen since the last one let through
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+
+        key = (record.pathname, record.lineno)
+        seen = self.__sites.get(key, 0)
+        if seen % self.every:
+            self.__sites[key] = seen + 1
+            return False
+
+        self.__sites[key] = 1
+        if seen > 1:
+            record.suppressed = seen - 1
+        return True
+
+
+class Formatter(logging.Formatter):
+    """
+    Text formatter noting suppressed records, optionally without colours.
+    """
+
+    def __init__(self, fmt=DEFAULT_FORMAT, colour=True):
+        super().__init__(fmt)
+        self.colour = colour
+
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += " ({} similar suppressed)".format(suppressed)
+        return text if self.colour else strip_colour(text)
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """
+    One JSON object per record with time, level, thread, call site and message, colours removed.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "thread": record.threadName,
+            "where": "{}:{}".format(record.module, record.lineno),
+            "message": strip_colour(record.getMessage()),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # QueueHandler formats the message here, on the logging thread. Leave that to the listener
+        return record
+
+
+def configure(level=logging.DEBUG, fmt=DEFAULT_FORMAT, stream=None, colour=True, rate=None, burst=5, sample=None,
+              json_path=None):
+    """
+    Sets up the root logger to log through a background thread. Replaces any handlers set up before, including by an
+    earlier call.
+    :param level:       Root log level, a name or number
+    :param fmt:         Format of text records
+    :param stream:      Stream text records are written to, stdout if None
+    :param colour:      Whether to keep ANSI colour codes in text records
+    :param rate:        Records per second allowed from each call site at INFO and below, unlimited if None
+    :param burst:       Records a call site may log at once, see RateLimitFilter
+    :param sample:      Keep one in this many records from each call site at INFO and below, all if None
+    :param json_path:   File to append JSON lines records to as well, None for none
+    :return:            QueueListener, stop() flushes and stops it. It is stopped at exit
+    """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+
+    console = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    console.setFormatter(Formatter(fmt, colour))
+    handlers = [console]
+    if json_path is not None:
+        sink = logging.FileHandler(json_path)
+        sink.setFormatter(JSONLinesFormatter())
+        handlers.append(sink)
+
+    records = queue.Queue()
+    handler = _DeferredQueueHandler(records)
+    if rate is not None:
+        handler.addFilter(RateLimitFilter(rate, burst))
+    if sample is not None:
+        handler.addFilter(SampleFilter(sample))
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(records, *handlers)
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def _stop():
+    if _listener is not None:
+        _listener.stop()
@@ -0,0 +1,252 @@
+"""
+Runtime metrics of the robot, served in the Prometheus text format.
+
+Counters and histograms are updated from hot paths such as the vision loop, so every thread adds to a cell of its
+own and no lock is taken after a thread's first update. Cells are only summed when the metrics are scraped. Gauges
+either hold the last value set or call a function when scraped, which suits values the code already keeps, like
+queue lengths.
+
+    from metrics import registry
+    frames = registry.counter("growbot_vision_frames_total", "Frames processed")
+    frames.inc()
+    registry.serve(9108)    # curl localhost:9108/metrics
+"""
+import bisect
+import logging as log
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Milliseconds, covering a fast parse up to a stalled inference
+DEFAULT_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                     for key, value in sorted(labels.items()))
+    return "{" + pairs + "}"
+
+
+class _PerThread:
+    """
+    Base of metrics aggregated per thread. A cell is a list of numbers owned by one thread; the cells of threads that
+    ended are folded into one so threads started per message don't accumulate.
+    """
+
+    def __init__(self, size):
+        self.__size = size
+        self.__local = threading.local()
+        self.__cells = []
+        self.__retired = [0] * size
+        self.__lock = threading.Lock()
+
+    def _cell(self):
+        try:
+            return self.__local.cell
+        except AttributeError:
+            cell = self.__local.cell = [0] * self.__size
+            with self.__lock:
+                live = []
+                for owner, other in self.__cells:
+                    if owner.is_alive():
+                        live.append((owner, other))
+                    else:
+                        # A thread that ended can't update its cell any more
+                        self.__retired = [a + b for a, b in zip(self.__retired, other)]
+                live.append((threading.current_thread(), cell))
+                self.__cells = live
+            return cell
+
+    def _total(self):
+        with self.__lock:
+            total = list(self.__retired)
+            for _, cell in self.__cells:
+                total = [a + b for a, b in zip(total, cell)]
+        return total
+
+
+class Counter(_PerThread):
+    type = "counter"
+
+    def __init__(self, name, help, labels):
+        super().__init__(1)
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+    def inc(self, amount=1):
+        self._cell()[0] += amount
+
+    def value(self):
+        return self._total()[0]
+
+    def samples(self):
+        return [(self.name, self.labels, self.value())]
+
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, name, help, labels, fn=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.fn = fn
+        self.__value = 0
+
+    def set(self, value):
+        self.__value = value
+
+    def value(self):
+        if self.fn is not None:
+            return self.fn()
+        return self.__value
+
+    def samples(self):
+        value = self.value()
+        if value is None:
+            return []
+        return [(self.name, self.labels, value)]
+
+
+class Histogram(_PerThread):
+    type = "histogram"
+
+    def __init__(self, name, help, labels, buckets=DEFAULT_BUCKETS):
+        # One count per bucket, then the sum of observed values
+        super().__init__(len(buckets) + 1)
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+
+    def observe(self, value):
+        cell = self._cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def samples(self):
+        total = self._total()
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, total):
+            cumulative += count
+            samples.append((self.name + "_bucket", dict(self.labels, le=_format_value(bound)), cumulative))
+        samples.append((self.name + "_sum", self.labels, total[-1]))
+        samples.append((self.name + "_count", self.labels, cumulative))
+        return samples
+
+
+class Registry:
+    """
+    Metrics of one process, each identified by name and labels. Asking for a metric that exists returns it, so
+    modules can look their metrics up wherever convenient.
+    """
+
+    def __init__(self):
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def __get(self, cls, name, help, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.__metrics.get(key)
+        if metric is None:
+            with self.__lock:
+                metric = self.__metrics.get(key)
+                if metric is None:
+                    metric = self.__metrics[key] = cls(name, help, labels, **kwargs)
+        elif not isinstance(metric, cls):
+            raise TypeError("Metric {} is a {}, not a {}".format(name, metric.type, cls.type))
+        return metric
+
+    def counter(self, name, help="", **labels):
+        """
+        :param name:    Metric name, ending in _total by convention
+        :param help:    Description shown with the metric
+        :param labels:  Label values telling this series apart from others of the same name
+        :return:        Counter
+        """
+        return self.__get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", fn=None, **labels):
+        """
+        :param fn:      Function returning the value when scraped, replacing any earlier one. None values are left
+                        out of the output
+        :return:        Gauge
+        """
+        gauge = self.__get(Gauge, name, help, labels)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS, **labels):
+        """
+        :param buckets: Ascending upper bounds, the last one should be infinity
+        :return:        Histogram
+        """
+        return self.__get(Histogram, name, help, labels, buckets=buckets)
+
+    def exposition(self):
+        """
+        :return:    Every metric in the Prometheus text format
+        """
+        with self.__lock:
+            metrics = sorted(self.__metrics.values(), key=lambda m: m.name)
+
+        lines = []
+        described = set()
+        for metric in metrics:
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append("# HELP {} {}".format(metric.name, metric.help))
+                lines.append("# TYPE {} {}".format(metric.name, metric.type))
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                log.warning("[METRICS] Failed to read {}: {}".format(metric.name, e))
+                continue
+            for name, labels, value in samples:
+                lines.append("{}{} {}".format(name, _format_labels(labels), _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9108, host="127.0.0.1"):
+        """
+        Serves the metrics on http://host:port/metrics from a daemon thread.
+        :return:    HTTPServer, shutdown() stops it
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug("[METRICS] " + format % args)
+
+        server = HTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        log.info("[METRICS] Serving on http://{}:{}/metrics".format(host, port))
+        return server
+
+
+# Shared by every module of a process
+registry = Registry()
@@ -0,0 +1,62 @@
+"""
+Skipping inference on frames that can't change what the robot does.
+
+While the robot stands still the camera sees the same scene frame after frame, and while it is in standby, approaching
+a plant or retrying an approach Navigator ignores detections altogether. MotionGate compares a small grayscale copy
+of each frame with the one last inferred on, which costs a fraction of a millisecond, and only lets frames through to
+the detector when the scene changed, the robot moves, or the last inference is older than the refresh interval. The
+detections of the last inference stand in for the frames skipped.
+"""
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Decides per frame whether to run inference on it.
+    """
+
+    def __init__(self, refresh_interval=1.0, threshold=6.0, size=(32, 24), clock=time.monotonic):
+        """
+        Constructor for MotionGate class.
+        :param refresh_interval:    Longest time in seconds between two inferences, however static the scene
+        :param threshold:           Mean absolute difference of the grayscale thumbnails, 0 to 255, above which the
+                                    scene counts as changed. Sensor noise of a still camera stays around 2
+        :param size:                (width, height) of the thumbnails compared
+        :param clock:               Function returning monotonic seconds
+        """
+        self.refresh_interval = refresh_interval
+        self.threshold = threshold
+        self.size = size
+        self.clock = clock
+        self.__reference = None     # Thumbnail of the last frame inferred on while still, None while moving
+        self.__inferred = None      # Time of the last inference
+
+    def should_infer(self, image, still=False, needed=True):
+        """
+        :param image:   BGR frame
+        :param still:   Whether the robot is known to stand still
+        :param needed:  Whether the detections are used at all, if not only the refresh interval applies
+        :return:        True if inference should run on the frame
+        """
+        now = self.clock()
+        due = self.__inferred is None or now - self.__inferred >= self.refresh_interval
+
+        if not needed:
+            self.__reference = None
+            infer = due
+        elif not still:
+            self.__reference = None
+            infer = True
+        else:
+            thumbnail = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), self.size, interpolation=cv2.INTER_AREA)
+            infer = (due or self.__reference is None
+                     or float(np.mean(cv2.absdiff(thumbnail, self.__reference))) > self.threshold)
+            if infer:
+                self.__reference = thumbnail
+
+        if infer:
+            self.__inferred = now
+        return infer
@@ -0,0 +1,117 @@
+"""
+Compiled networks kept on disk, so the VPU graph isn't compiled again on every start.
+
+Loading an Intermediate Representation onto the MYRIAD compiles it for the VPU, which takes several seconds on the Pi
+before the first frame can be inferred on. NetworkCache exports the compiled network the first time a model is loaded
+and imports it on later starts. Entries are named after the model and keyed by a hash of its XML and BIN files, the
+batch size, the device and the Inference Engine version, so a new model, batch size or OpenVINO release misses the
+cache and compiles afresh. The entries it replaces are deleted, as are entries failing to import.
+
+    cache = NetworkCache("~/.cache/growbot/networks")
+    exec_net = cache.load(IECore(), net, model_xml, model_bin, "MYRIAD", num_requests=2)
+    cache.source                # "cache" or "compiled"
+
+Importing needs the IECore API of OpenVINO 2019 R3 or later.
+"""
+import glob
+import hashlib
+import logging as log
+import os
+import time
+
+from metrics import registry
+
+
+class NetworkCache:
+    """
+    Loads networks onto a device through a directory of exported compiled networks.
+    """
+
+    def __init__(self, directory):
+        """
+        Constructor for NetworkCache class.
+        :param directory:   Directory the compiled networks are kept in, created if missing. "~" is expanded
+        """
+        self.directory = os.path.expanduser(directory)
+        self.source = None      # How the last network was loaded, "cache" or "compiled"
+
+    def path(self, ie, model_xml, model_bin, batch_size, device):
+        """
+        :param ie:          IECore the network is loaded with
+        :param model_xml:   Network topology file
+        :param model_bin:   Network weights file
+        :param batch_size:  Batch size the network is loaded with
+        :param device:      Device the network is compiled for
+        :return:            Path of the cache entry for the network
+        """
+        version = ie.get_versions(device)[device]
+        digest = hashlib.sha256()
+        for name in (model_xml, model_bin):
+            with open(name, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        digest.update("{}|{}|{}.{}.{}".format(batch_size, device, version.major, version.minor,
+                                              version.build_number).encode("utf-8"))
+        return os.path.join(self.directory, "{}-{}.blob".format(self.__model_name(model_xml), digest.hexdigest()[:16]))
+
+    def load(self, ie, net, model_xml, model_bin, device, num_requests=1):
+        """
+        Imports the network from the cache, or compiles it and adds it to the cache.
+        :param ie:              IECore to load the network with
+        :param net:             IENetwork read from model_xml and model_bin, its batch size set
+        :param model_xml:       Network topology file
+        :param model_bin:       Network weights file
+        :param device:          Device to load the network onto
+        :param num_requests:    Inference requests of the executable network
+        :return:                ExecutableNetwork
+        """
+        started = time.monotonic()
+        path = self.path(ie, model_xml, model_bin, net.batch_size, device)
+
+        exec_net = None
+        if os.path.exists(path):
+            try:
+                exec_net = ie.import_network(model_file=path, device_name=device, num_requests=num_requests)
+                self.source = "cache"
+            except Exception as e:
+                log.warning("[NETWORK_CACHE] Could not import %s, compiling again: %s", path, e)
+                self.__remove(path)
+
+        if exec_net is None:
+            exec_net = ie.load_network(network=net, device_name=device, num_requests=num_requests)
+            self.source = "compiled"
+            self.__store(exec_net, path, self.__model_name(model_xml))
+
+        seconds = time.monotonic() - started
+        log.info("[NETWORK_CACHE] Loaded %s onto %s from %s in %.2fs", os.path.basename(model_xml), device,
+                 self.source, seconds)
+        registry.gauge("growbot_vision_network_load_seconds", "Time the network took to load onto the device",
+                       source=self.source).set(seconds)
+        return exec_net
+
+    def __store(self, exec_net, path, model):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Written under another name first, so a start interrupted while exporting leaves no broken entry
+            partial = path + ".partial"
+            exec_net.export(partial)
+            os.replace(partial, path)
+        except Exception as e:
+            log.warning("[NETWORK_CACHE] Could not export the compiled network to %s: %s", path, e)
+            return
+
+        # Entries of the same model for other files, batch sizes or versions won't be used again
+        for stale in glob.glob(os.path.join(self.directory, model + "-*.blob")):
+            if stale != path and self.__model_name(stale).rsplit("-", 1)[0] == model:
+                self.__remove(stale)
+
+    @staticmethod
+    def __model_name(path):
+        return os.path.splitext(os.path.basename(path))[0]
+
+    @staticmethod
+    def __remove(path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            log.warning("[NETWORK_CACHE] Could not remove %s: %s", path, e)
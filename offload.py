@@ -0,0 +1,178 @@
+"""
+Shared pool for the CPU heavy work besides inference: JPEG encoding, base64 and QR decoding.
+
+Jobs are submitted to one of three lanes and handed back a concurrent.futures.Future. Idle workers always take the
+oldest job of the most important lane waiting: photos and QR codes of the plant being approached come before the live
+stream, which comes before debugging output such as saved frames. Each lane holds a bounded number of jobs waiting, a
+job submitted to a full lane fails with PoolFull, so a stalled consumer can't pile up frames. Callers waiting for a
+result anyway do the job themselves on PoolFull.
+
+Workers are threads, as cv2.imencode, cv2.resize and pyzbar's zbar calls release the GIL, so threads spread them over
+every core. Jobs that hold the GIL for long can be passed process=True to run in a worker process instead, if the pool
+was configured with any, paying for pickling their arguments.
+
+    from offload import offload, STREAM
+    future = offload.submit(STREAM, encode_stream, frame)
+    future.result()                 # Base64 JPEG, or raises what encode_stream raised
+
+The pool starts its workers on the first job, configure() sets it up beforehand.
+"""
+import base64
+import heapq
+import itertools
+import logging as log
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import cv2
+
+from metrics import registry
+
+# Lanes, most important first
+PHOTO = "photo"
+STREAM = "stream"
+DEBUG = "debug"
+LANES = (PHOTO, STREAM, DEBUG)
+
+# Jobs each lane holds waiting at most. The stream only ever needs the newest frame
+DEFAULT_BOUNDS = {PHOTO: 8, STREAM: 2, DEBUG: 4}
+
+
+class PoolFull(Exception):
+    """
+    Set on the future of a job submitted to a lane with no room left.
+    """
+
+
+def encode_stream(frame, quality=95):
+    """
+    :param frame:   Frame to be streamed
+    :param quality: JPEG quality, OpenCV's default
+    :return:        Base64 encoded JPEG bytes, as the live stream sends them
+    """
+    return base64.b64encode(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1])
+
+
+class OffloadPool:
+    """
+    Worker threads taking jobs from priority lanes.
+    """
+
+    def __init__(self, workers=None, processes=0, bounds=None):
+        """
+        Constructor for OffloadPool class.
+        :param workers:     Worker threads, one per core if None. 0 runs jobs on the thread submitting them, as the
+                            simulation does
+        :param processes:   Worker processes for jobs submitted with process=True, 0 runs them on the threads
+        :param bounds:      Dict of the jobs each lane holds waiting at most by lane, DEFAULT_BOUNDS for lanes missing
+        """
+        self.workers = None
+        self.processes = 0
+        self.bounds = dict(DEFAULT_BOUNDS)
+        self.__queue = []                   # Heap of (lane priority, sequence, job)
+        self.__waiting = {lane: 0 for lane in LANES}
+        self.__sequence = itertools.count()
+        self.__condition = threading.Condition()
+        self.__threads = []
+        self.__executor = None
+        self.configure(workers, processes, bounds)
+
+        self.__wait_ms = {}
+        self.__run_ms = {}
+        self.__rejected = {}
+        for lane in LANES:
+            registry.gauge("growbot_offload_queue_depth", "Jobs waiting for an offload worker",
+                           fn=lambda lane=lane: self.__waiting[lane], lane=lane)
+            self.__wait_ms[lane] = registry.histogram("growbot_offload_wait_ms",
+                                                      "From a job submitted to a worker taking it in ms", lane=lane)
+            self.__run_ms[lane] = registry.histogram("growbot_offload_run_ms", "Time a job ran for in ms", lane=lane)
+            self.__rejected[lane] = registry.counter("growbot_offload_rejected_total",
+                                                     "Jobs submitted to a full lane", lane=lane)
+
+    def configure(self, workers=None, processes=0, bounds=None):
+        """
+        Sets the pool up before it starts, see the constructor.
+        :return:    self
+        """
+        with self.__condition:
+            if self.__threads:
+                raise RuntimeError("Offload pool already started")
+            self.workers = workers if workers is not None else os.cpu_count() or 1
+            self.processes = processes
+            self.bounds.update(bounds or {})
+        return self
+
+    def submit(self, lane, fn, *args, process=False):
+        """
+        :param lane:    PHOTO, STREAM or DEBUG
+        :param fn:      Function to run
+        :param args:    Its arguments
+        :param process: Whether to run it in a worker process, where fn and args have to be picklable
+        :return:        Future of its result
+        """
+        priority = LANES.index(lane)
+        future = Future()
+        if not self.workers:
+            future.set_running_or_notify_cancel()
+            self.__run(lane, fn, args, process, future, time.monotonic())
+            return future
+
+        with self.__condition:
+            if self.__waiting[lane] >= self.bounds[lane]:
+                self.__rejected[lane].inc()
+                future.set_exception(PoolFull("Offload lane {} has {} jobs waiting".format(lane, self.bounds[lane])))
+                return future
+            if not self.__threads:
+                self.__start()
+            self.__waiting[lane] += 1
+            heapq.heappush(self.__queue, (priority, next(self.__sequence),
+                                          (lane, fn, args, process, future, time.monotonic())))
+            self.__condition.notify()
+        return future
+
+    def __start(self):
+        if self.processes:
+            # A fresh interpreter rather than a fork of this one and its threads
+            self.__executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.__work, name="offload-{}".format(i), daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+        log.info("[OFFLOAD] Started %d worker threads and %d processes", self.workers, self.processes)
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__queue)
+                _, _, (lane, fn, args, process, future, submitted) = heapq.heappop(self.__queue)
+                self.__waiting[lane] -= 1
+
+            if future.set_running_or_notify_cancel():
+                self.__run(lane, fn, args, process, future, submitted)
+
+    def __run(self, lane, fn, args, process, future, submitted):
+        started = time.monotonic()
+        self.__wait_ms[lane].observe((started - submitted) * 1000)
+        try:
+            if process and self.__executor is not None:
+                result = self.__executor.submit(fn, *args).result()
+            else:
+                result = fn(*args)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        self.__run_ms[lane].observe((time.monotonic() - started) * 1000)
+
+    def pending(self, lane):
+        """
+        :param lane:    PHOTO, STREAM or DEBUG
+        :return:        Jobs of the lane waiting for a worker
+        """
+        return self.__waiting[lane]
+
+
+offload = OffloadPool()
@@ -0,0 +1,119 @@
+import json
+import logging as log
+import os
+import threading
+from collections import deque
+
+
+class OutboundBuffer:
+    """
+    Thread-safe FIFO of outbound API messages which can spill to disk.
+
+    Messages are kept in memory until either the memory limit is exceeded or spill() is called explicitly (e.g. on
+    disconnect), at which point every in-memory message is written to its own file in the buffer directory. Spilled
+    messages survive a restart of the robot and are always older than the ones still held in memory, so peek() drains
+    the disk first to preserve ordering.
+    """
+
+    def __init__(self, directory="remote_buffer", memory_limit=2**20):
+        """
+        Constructor for OutboundBuffer class.
+        :param directory:       Directory used to persist spilled messages
+        :param memory_limit:    Approximate number of bytes to keep in memory before spilling to disk
+        """
+        self.directory = directory
+        self.memory_limit = memory_limit
+
+        self.__lock = threading.Lock()
+        self.__memory = deque()
+        self.__memory_bytes = 0
+        self.__disk = deque()
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        # Pick up anything left over from a previous run
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".json"):
+                self.__disk.append(int(name[:-5]))
+
+        self.__seq = self.__disk[-1] + 1 if self.__disk else 0
+
+        if self.__disk:
+            log.info("[BUFFER] Recovered {} spilled messages from {}".format(len(self.__disk), self.directory))
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__disk) + len(self.__memory)
+
+    def __path(self, seq):
+        return os.path.join(self.directory, "{:012d}.json".format(seq))
+
+    def push(self, data):
+        """
+        Appends a message to the end of the buffer.
+        :param data:    JSON serialisable message
+        :return:        Sequence number assigned to the message
+        """
+        encoded = json.dumps(data)
+
+        with self.__lock:
+            seq = self.__seq
+            self.__seq += 1
+            self.__memory.append((seq, encoded))
+            self.__memory_bytes += len(encoded)
+
+            if self.__memory_bytes > self.memory_limit:
+                self.__spill()
+
+        return seq
+
+    def spill(self):
+        """
+        Writes every in-memory message to disk.
+        :return:
+        """
+        with self.__lock:
+            self.__spill()
+
+    def __spill(self):
+        if not self.__memory:
+            return
+
+        log.info("[BUFFER] Spilling {} messages ({} bytes) to disk".format(len(self.__memory), self.__memory_bytes))
+
+        while self.__memory:
+            seq, encoded = self.__memory.popleft()
+            with open(self.__path(seq), mode="w") as f:
+                f.write(encoded)
+            self.__disk.append(seq)
+
+        self.__memory_bytes = 0
+
+    def peek(self):
+        """
+        Returns the oldest message without removing it.
+        :return:    Tuple (seq, encoded_message), or None if the buffer is empty
+        """
+        with self.__lock:
+            if self.__disk:
+                seq = self.__disk[0]
+                with open(self.__path(seq), mode="r") as f:
+                    return seq, f.read()
+            if self.__memory:
+                return self.__memory[0]
+            return None
+
+    def pop(self, seq):
+        """
+        Removes a message once it has been delivered.
+        :param seq: Sequence number returned by peek()
+        :return:
+        """
+        with self.__lock:
+            if self.__disk and self.__disk[0] == seq:
+                self.__disk.popleft()
+                os.remove(self.__path(seq))
+            elif self.__memory and self.__memory[0][0] == seq:
+                _, encoded = self.__memory.popleft()
+                self.__memory_bytes -= len(encoded)
@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import json
+import logging as log
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+import cv2
+import websockets
+
+from metrics import registry
+
+PhotoPreset = namedtuple("PhotoPreset", ["width", "quality"])
+
+# Width of None keeps the capture resolution
+PHOTO_PRESETS = {
+    "full": PhotoPreset(None, 90),
+    "standard": PhotoPreset(480, 80),
+    "thumbnail": PhotoPreset(320, 60),
+}
+
+
+def encode_photo(frame, preset="standard"):
+    """
+    Encodes a frame as JPEG according to one of the photo presets.
+    :param frame:   Frame to be encoded
+    :param preset:  Name of the preset in PHOTO_PRESETS
+    :return:        Raw JPEG bytes
+    """
+    width, quality = PHOTO_PRESETS[preset]
+
+    h, w = frame.shape[:2]
+    if width is not None and w > width:
+        frame = cv2.resize(frame, (width, int(h * width / w)), interpolation=cv2.INTER_AREA)
+
+    return cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+class PhotoUploader:
+    """
+    Uploads plant photos as raw binary frames over a dedicated websocket, separate from the control stream.
+
+    Photos are spooled to disk before upload. For each photo the uploader announces it with PHOTO_BEGIN, the server
+    replies with PHOTO_RESUME carrying the number of bytes it already holds, the remainder is sent in binary chunks and
+    PHOTO_END is acknowledged with PHOTO_ACK. An interrupted upload therefore resumes where it stopped after a reconnect
+    instead of starting over. A photo the server rejects is sent again right away, up to max_attempts times, and then
+    moved to the rejected directory of the spool.
+    """
+
+    def __init__(self, url, spool_dir="photo_spool", chunk_size=2**15, backoff_initial=1, backoff_max=60,
+                 max_attempts=3):
+        """
+        Constructor for PhotoUploader class.
+        :param url:             Websocket endpoint of the photo channel
+        :param spool_dir:       Directory used to keep photos until they are acknowledged
+        :param chunk_size:      Size of a single binary frame in bytes
+        :param backoff_initial: Delay in seconds before the first reconnect attempt
+        :param backoff_max:     Upper bound for the reconnect delay in seconds
+        :param max_attempts:    Times a photo is sent before it is given up on if the server keeps rejecting it
+        """
+        self.url = url
+        self.spool_dir = spool_dir
+        self.chunk_size = chunk_size
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts
+        self.rejected_dir = os.path.join(spool_dir, "rejected")
+        self.loop = None
+        self.bytes_sent = 0
+        self.__chunk_bytes = registry.counter("growbot_remote_bytes_sent_total", "Bytes sent to the API",
+                                              channel="photo")
+        self.__rejected = registry.counter("growbot_photo_rejected_total", "Photos given up on after being rejected "
+                                           "max_attempts times")
+        self.__wakeup = None
+        self.__thread = None
+
+        if not os.path.isdir(self.spool_dir):
+            os.makedirs(self.spool_dir)
+
+    def start(self):
+        """
+        Starts the upload lane on its own thread and event loop. Calling it again has no effect.
+        :return:
+        """
+        if self.__thread is not None:
+            return
+
+        self.__thread = threading.Thread(target=self.__thread_main, name="photo_upload", daemon=True)
+        self.__thread.start()
+
+    def __thread_main(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self.run())
+
+    def enqueue(self, plant_id, jpeg):
+        """
+        Spools a photo for upload. Safe to call from any thread.
+        :param plant_id:    Plant the photo belongs to
+        :param jpeg:        Raw JPEG bytes
+        :return:            Upload identifier
+        """
+        upload_id = "{:013d}-{}".format(int(time.time() * 1000), uuid.uuid4().hex[:8])
+        path = os.path.join(self.spool_dir, upload_id)
+
+        with open(path + ".jpg", mode="wb") as f:
+            f.write(jpeg)
+        # Metadata last, a photo without it is not picked up
+        with open(path + ".json", mode="w") as f:
+            json.dump({"plant_id": plant_id, "size": len(jpeg)}, f)
+
+        log.info("[PHOTO] Spooled photo {} of plant {} ({} bytes)".format(upload_id, plant_id, len(jpeg)))
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.__wakeup.set)
+
+        return upload_id
+
+    def pending(self):
+        """
+        :return:    Identifiers of spooled photos, oldest first
+        """
+        return sorted(name[:-5] for name in os.listdir(self.spool_dir) if name.endswith(".json"))
+
+    @asyncio.coroutine
+    def run(self):
+        # Imported here to avoid a circular import, Remote owns the uploader
+        from remote import backoff_delay
+
+        self.__wakeup = asyncio.Event()
+        self.loop = asyncio.get_event_loop()
+        attempt = 0
+
+        while True:
+            try:
+                ws = yield from websockets.connect(self.url)
+            except Exception as e:
+                delay = backoff_delay(attempt, self.backoff_initial, self.backoff_max)
+                attempt += 1
+                log.warning("[PHOTO] Connection to {} failed ({}), retrying in {:.1f}s".format(self.url, e, delay))
+                yield from asyncio.sleep(delay)
+                continue
+
+            attempt = 0
+            log.info("[PHOTO] Connection established on {}, {} photos pending".format(self.url, len(self.pending())))
+
+            try:
+                while True:
+                    self.__wakeup.clear()
+                    for upload_id in self.pending():
+                        yield from self.__upload(ws, upload_id)
+                    yield from self.__wakeup.wait()
+            except Exception as e:
+                log.warning("[PHOTO] Upload channel failed ({}), reconnecting".format(e))
+            finally:
+                yield from ws.close()
+
+    @asyncio.coroutine
+    def __upload(self, ws, upload_id):
+        path = os.path.join(self.spool_dir, upload_id)
+        with open(path + ".json", mode="r") as f:
+            meta = json.load(f)
+        with open(path + ".jpg", mode="rb") as f:
+            jpeg = f.read()
+
+        for attempt in range(1, self.max_attempts + 1):
+            if (yield from self.__send(ws, upload_id, meta, jpeg)):
+                os.remove(path + ".json")
+                os.remove(path + ".jpg")
+                log.info("[PHOTO] Uploaded photo {} of plant {}".format(upload_id, meta["plant_id"]))
+                return
+            # The server discarded what it had, the next attempt starts from the beginning
+            log.warning("[PHOTO] Photo {} rejected by server (attempt {} of {})".format(upload_id, attempt,
+                                                                                       self.max_attempts))
+
+        # Kept for inspection rather than sent forever
+        if not os.path.isdir(self.rejected_dir):
+            os.makedirs(self.rejected_dir)
+        os.replace(path + ".jpg", os.path.join(self.rejected_dir, upload_id + ".jpg"))
+        os.replace(path + ".json", os.path.join(self.rejected_dir, upload_id + ".json"))
+        self.__rejected.inc()
+        log.error("[PHOTO] Gave up on photo {} of plant {}, moved to {}".format(upload_id, meta["plant_id"],
+                                                                                self.rejected_dir))
+
+    @asyncio.coroutine
+    def __send(self, ws, upload_id, meta, jpeg):
+        """
+        Sends a photo once, resuming where the server stopped.
+        :return:    Whether the server acknowledged it
+        """
+        yield from ws.send(json.dumps({
+            "type": "PHOTO_BEGIN",
+            "data": {
+                "upload_id": upload_id,
+                "plant_id": meta["plant_id"],
+                "size": len(jpeg),
+                "content_type": "image/jpeg",
+            }
+        }))
+        offset = (yield from self.__expect(ws, "PHOTO_RESUME", upload_id))["offset"]
+
+        if offset > 0:
+            log.info("[PHOTO] Resuming photo {} at byte {}".format(upload_id, offset))
+
+        for start in range(offset, len(jpeg), self.chunk_size):
+            chunk = jpeg[start:start + self.chunk_size]
+            yield from ws.send(chunk)
+            self.bytes_sent += len(chunk)
+            self.__chunk_bytes.inc(len(chunk))
+
+        yield from ws.send(json.dumps({
+            "type": "PHOTO_END",
+            "data": {
+                "upload_id": upload_id,
+                "sha1": hashlib.sha1(jpeg).hexdigest(),
+            }
+        }))
+        ack = yield from self.__expect(ws, "PHOTO_ACK", upload_id)
+        return ack.get("ok", True)
+
+    @staticmethod
+    @asyncio.coroutine
+    def __expect(ws, type, upload_id):
+        message = json.loads((yield from ws.recv()))
+        if message["type"] != type or message["data"]["upload_id"] != upload_id:
+            raise ValueError("expected {} for {}, got {}".format(type, upload_id, message))
+        return message["data"]
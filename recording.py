@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+"""
+Recording of what the robot sees, hears from the EV3 and commands, for replaying runs offline.
+
+A recording is a binary file of chunks, each holding the records of a few seconds compressed together, followed by
+an index of the chunks' offsets and time spans. Records are the detections of every frame, optionally a downsampled
+JPEG of every n-th frame, the QR codes read, every message from the EV3 and every command sent to it, and the calls
+from the API that change what the robot does, each stamped with the time it was recorded. Files are read through
+mmap, so looking up a time span only decompresses the chunks covering it. A file whose recording was cut short has
+no index and is scanned instead, losing at most the chunk that was being written.
+
+Recording is off unless a file is opened, and then every call returns right away. sim.replay plays a recording back
+through RobotController.
+
+Usage: python recording.py info run.rec
+       python recording.py diff run.rec replayed.rec
+    Prints the number of records of each kind, or the commands that differ between two recordings. diff exits with
+    status 1 if there are any.
+"""
+import atexit
+import bisect
+import difflib
+import json
+import logging as log
+import mmap
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, namedtuple
+
+MAGIC = b"GBREC\n"
+VERSION = 1
+INDEX_MAGIC = b"GBIX"
+
+_HEADER = struct.Struct("<6sHd")            # Magic, version, time recording started
+_CHUNK = struct.Struct("<4sIIdd")           # b"CHNK", compressed length, records, first and last record time
+_RECORD = struct.Struct("<dBI")             # Time, kind, length of the data following
+_INDEX_ENTRY = struct.Struct("<Qdd")        # Chunk offset, first and last record time
+_TRAILER = struct.Struct("<QI4s")           # Index offset, chunks, INDEX_MAGIC
+
+DETECTIONS = "detections"   # List of (label, probability, ((xmin, ymin), (xmax, ymax))) given to process_visual_data
+FRAME = "frame"             # JPEG bytes of a downsampled frame
+QR = "qr"                   # List of QR codes read from the current frame
+MESSAGE = "message"         # Message from the EV3 as given to process_message
+COMMAND = "command"         # Command package sent to the EV3
+CALL = "call"               # [name, arguments] of a RobotController method called by the API
+CAMERA_DETECTIONS = "camera_detections"     # [camera, detections] of a camera other than the front one
+
+_KIND_CODES = {DETECTIONS: 1, FRAME: 2, QR: 3, MESSAGE: 4, COMMAND: 5, CALL: 6, CAMERA_DETECTIONS: 7}
+_KINDS = {code: kind for kind, code in _KIND_CODES.items()}
+
+Record = namedtuple("Record", ["time", "kind", "value"])
+Chunk = namedtuple("Chunk", ["offset", "first", "last"])
+
+
+def _encode(kind, value):
+    if kind == FRAME:
+        return value
+    if kind == MESSAGE:
+        return value.encode("utf-8")
+    if kind == DETECTIONS:
+        value = _encode_predictions(value)
+    elif kind == CAMERA_DETECTIONS:
+        camera, predictions = value
+        value = [camera, _encode_predictions(predictions)]
+    return json.dumps(value).encode("utf-8")
+
+
+def _encode_predictions(value):
+    # Probabilities come out of the detector as numpy floats
+    return [(label, float(probability), box) for label, probability, box in value]
+
+
+def _decode(kind, data):
+    if kind == FRAME:
+        return bytes(data)
+    if kind == MESSAGE:
+        return bytes(data).decode("utf-8")
+    value = json.loads(bytes(data).decode("utf-8"))
+    if kind == DETECTIONS:
+        return _decode_predictions(value)
+    if kind == CAMERA_DETECTIONS:
+        camera, predictions = value
+        return [camera, _decode_predictions(predictions)]
+    return value
+
+
+def _decode_predictions(value):
+    # Boxes come back from JSON as lists
+    return [(label, probability, tuple(tuple(point) for point in box)) for label, probability, box in value]
+
+
+class Recorder:
+    """
+    Writes records to a recording file. Safe to call from any thread, records are buffered and written a chunk at a
+    time.
+    """
+
+    def __init__(self, chunk_bytes=2**18, chunk_seconds=5.0):
+        """
+        Constructor for Recorder class.
+        :param chunk_bytes:     Uncompressed size after which a chunk is written
+        :param chunk_seconds:   Time span after which a chunk is written, bounding what is lost if the robot dies
+        """
+        self.chunk_bytes = chunk_bytes
+        self.chunk_seconds = chunk_seconds
+        self.enabled = False
+        self.frames_every = 0
+        self.path = None
+        self.__file = None
+        self.__lock = threading.Lock()
+        self.__pending = []
+        self.__pending_bytes = 0
+        self.__index = []
+        self.__frames = 0
+
+    def open(self, path, frames_every=0):
+        """
+        Starts recording to a file, replacing it. A recording open before is closed.
+        :param path:            File to write
+        :param frames_every:    Record a downsampled JPEG of every this many frames, none if 0
+        :return:
+        """
+        self.close()
+        with self.__lock:
+            self.__file = open(path, mode="wb")
+            self.__file.write(_HEADER.pack(MAGIC, VERSION, time.time()))
+            self.__index = []
+            self.__frames = 0
+            self.path = path
+            self.frames_every = frames_every
+            self.enabled = True
+        log.info("[RECORD] Recording to {}".format(path))
+
+    def close(self):
+        """
+        Writes what is buffered and the index, then closes the file.
+        :return:
+        """
+        with self.__lock:
+            if self.__file is None:
+                return
+            self.enabled = False
+            self.__flush()
+            index_offset = self.__file.tell()
+            for chunk in self.__index:
+                self.__file.write(_INDEX_ENTRY.pack(*chunk))
+            self.__file.write(_TRAILER.pack(index_offset, len(self.__index), INDEX_MAGIC))
+            self.__file.close()
+            self.__file = None
+        log.info("[RECORD] Wrote {} chunks to {}".format(len(self.__index), self.path))
+
+    def record(self, kind, value):
+        """
+        :param kind:    One of DETECTIONS, FRAME, QR, MESSAGE, COMMAND, CALL or CAMERA_DETECTIONS
+        :param value:   Value as described next to the kind
+        :return:
+        """
+        if not self.enabled:
+            return
+        data = _encode(kind, value)
+        with self.__lock:
+            if self.__file is None:
+                return
+            # Stamped under the lock so records are in time order in the file
+            now = time.time()
+            if self.__pending and now - self.__pending[0][0] >= self.chunk_seconds:
+                self.__flush()
+            self.__pending.append((now, _RECORD.pack(now, _KIND_CODES[kind], len(data)) + data))
+            self.__pending_bytes += _RECORD.size + len(data)
+            if self.__pending_bytes >= self.chunk_bytes:
+                self.__flush()
+
+    def detections(self, predictions):
+        self.record(DETECTIONS, predictions)
+
+    def camera_detections(self, camera, predictions):
+        self.record(CAMERA_DETECTIONS, [camera, predictions])
+
+    def frame(self, frame):
+        """
+        Records every frames_every-th frame given, downsampled to the thumbnail photo preset.
+        :param frame:   Frame as captured
+        :return:
+        """
+        if not self.enabled or not self.frames_every:
+            return
+        self.__frames += 1
+        if self.__frames % self.frames_every:
+            return
+        from photo_upload import encode_photo
+        self.record(FRAME, encode_photo(frame, "thumbnail"))
+
+    def qr(self, codes):
+        self.record(QR, sorted(codes))
+
+    def message(self, message):
+        self.record(MESSAGE, message)
+
+    def command(self, package):
+        self.record(COMMAND, package)
+
+    def call(self, name, *args):
+        self.record(CALL, [name, args])
+
+    def __flush(self):
+        if not self.__pending:
+            return
+        payload = zlib.compress(b"".join(data for _, data in self.__pending))
+        offset = self.__file.tell()
+        first, last = self.__pending[0][0], self.__pending[-1][0]
+        self.__file.write(_CHUNK.pack(b"CHNK", len(payload), len(self.__pending), first, last))
+        self.__file.write(payload)
+        self.__file.flush()
+        self.__index.append(Chunk(offset, first, last))
+        self.__pending = []
+        self.__pending_bytes = 0
+
+
+class Recording:
+    """
+    Recording file opened for reading.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor for Recording class.
+        :param path:    Recording file
+        """
+        self.path = path
+        self.__file = open(path, mode="rb")
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.start = _HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a recording".format(path))
+        if version > VERSION:
+            raise ValueError("{} is a version {} recording, only up to {} is supported".format(path, version, VERSION))
+        self.chunks = self.__read_index()
+        if self.chunks is None:
+            log.warning("[RECORD] {} has no index, it was not closed properly".format(path))
+            self.chunks = self.__scan()
+        self.__lasts = [chunk.last for chunk in self.chunks]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.__map.close()
+        self.__file.close()
+
+    def __read_index(self):
+        if len(self.__map) < _HEADER.size + _TRAILER.size:
+            return None
+        index_offset, count, magic = _TRAILER.unpack_from(self.__map, len(self.__map) - _TRAILER.size)
+        if magic != INDEX_MAGIC:
+            return None
+        return [Chunk(*_INDEX_ENTRY.unpack_from(self.__map, index_offset + i * _INDEX_ENTRY.size))
+                for i in range(count)]
+
+    def __scan(self):
+        chunks = []
+        offset = _HEADER.size
+        while offset + _CHUNK.size <= len(self.__map):
+            magic, length, _, first, last = _CHUNK.unpack_from(self.__map, offset)
+            if magic != b"CHNK" or offset + _CHUNK.size + length > len(self.__map):
+                break
+            chunks.append(Chunk(offset, first, last))
+            offset += _CHUNK.size + length
+        return chunks
+
+    def __chunk_records(self, chunk):
+        _, length, count, _, _ = _CHUNK.unpack_from(self.__map, chunk.offset)
+        start = chunk.offset + _CHUNK.size
+        data = memoryview(zlib.decompress(self.__map[start:start + length]))
+        position = 0
+        for _ in range(count):
+            record_time, code, size = _RECORD.unpack_from(data, position)
+            position += _RECORD.size
+            yield record_time, _KINDS[code], data[position:position + size]
+            position += size
+
+    def records(self, start=None, end=None, kinds=None):
+        """
+        :param start:   Time of the first record returned, from the beginning if None
+        :param end:     Time after which records are left out, up to the end if None
+        :param kinds:   Kinds of records returned, all if None
+        :return:        Generator of Record in time order
+        """
+        first = 0 if start is None else bisect.bisect_left(self.__lasts, start)
+        for chunk in self.chunks[first:]:
+            if end is not None and chunk.first > end:
+                return
+            for record_time, kind, data in self.__chunk_records(chunk):
+                if start is not None and record_time < start:
+                    continue
+                if end is not None and record_time > end:
+                    return
+                if kinds is None or kind in kinds:
+                    yield Record(record_time, kind, _decode(kind, data))
+
+    def duration(self):
+        """
+        :return:    Seconds from the start of the recording to its last record
+        """
+        return self.chunks[-1].last - self.start if self.chunks else 0.0
+
+    def counts(self):
+        """
+        :return:    Counter of records per kind
+        """
+        counts = Counter()
+        for chunk in self.chunks:
+            for _, kind, _ in self.__chunk_records(chunk):
+                counts[kind] += 1
+        return counts
+
+
+def command_summary(package):
+    """
+    :param package: Command package as recorded
+    :return:        Text describing the command, without what differs between runs of the same commands
+    """
+    package = dict(package)
+    package.pop("trace_id", None)
+    action = package.pop("action", "?")
+    arguments = " ".join("{}={}".format(key, round(value, 2) if isinstance(value, float) else value)
+                         for key, value in sorted(package.items()))
+    return "{} {}".format(action, arguments).strip()
+
+
+def diff_commands(a, b):
+    """
+    Compares the commands of two recordings of the same run, e.g. the original and a replay of it.
+    :param a:   Recording
+    :param b:   Recording
+    :return:    List of lines, like a unified diff with each command's time since the start of its recording. Empty if
+                the same commands were sent in the same order
+    """
+    commands = []
+    for recording in (a, b):
+        commands.append([(record.time - recording.start, command_summary(record.value))
+                         for record in recording.records(kinds=(COMMAND,))])
+
+    matcher = difflib.SequenceMatcher(a=[summary for _, summary in commands[0]],
+                                      b=[summary for _, summary in commands[1]], autojunk=False)
+    lines = []
+    for tag, a_start, a_end, b_start, b_end in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        lines.append("@@ {} {}-{}, {} {}-{} @@".format(a.path, a_start + 1, a_end, b.path, b_start + 1, b_end))
+        lines.extend("- {:9.2f}s  {}".format(*command) for command in commands[0][a_start:a_end])
+        lines.extend("+ {:9.2f}s  {}".format(*command) for command in commands[1][b_start:b_end])
+    return lines
+
+
+# Shared by every module of a process, opened from config.RECORD
+recorder = Recorder()
+atexit.register(recorder.close)
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("info", "diff"):
+        print(__doc__.split("Usage:")[1])
+        sys.exit(2)
+
+    if sys.argv[1] == "info":
+        with Recording(sys.argv[2]) as recording:
+            print("{}: {:.1f}s in {} chunks".format(recording.path, recording.duration(), len(recording.chunks)))
+            for kind, count in sorted(recording.counts().items()):
+                print("{:>12} {:>8}".format(kind, count))
+        return
+
+    with Recording(sys.argv[2]) as a, Recording(sys.argv[3]) as b:
+        lines = diff_commands(a, b)
+    print("\n".join(lines) if lines else "Same commands")
+    sys.exit(1 if lines else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,12 @@ import websockets
 import json
 import asyncio
 import logging as log
+import random
 import threading
+from outbound_buffer import OutboundBuffer
+from photo_upload import PhotoUploader
+from metrics import registry
+from rpc_dispatch import RPCDispatcher, HandlerMode
 
 
 class UnhandledRPCTranslationException(Exception):
@@ -19,6 +24,16 @@ class RPCType(Enum):
     SET_STANDBY = "standby"
 
 
+# Turns the payload of each RPC into the arguments of its callback
+RPC_ARGUMENTS = {
+    RPCType.MOVE_IN_DIRECTION: lambda data: (data,),
+    RPCType.DEMO_START: lambda data: (data,),
+    RPCType.SETTINGS_PATCH: lambda data: (data["Key"], data["Value"]),
+    RPCType.EVENTS: lambda data: (data,),
+    RPCType.SET_STANDBY: lambda data: (data,),
+}
+
+
 @unique
 class LogType(Enum):
     UNKNOWN = 0
@@ -33,78 +48,159 @@ class LogSeverity(Enum):
     DANGER = 3
 
 
-@asyncio.coroutine
-def ws_send(ws, i, data):
-    print("start {}".format(i))
-    yield from ws.send(json.dumps(data))
-    print("end {}".format(i))
+def backoff_delay(attempt, initial=1, maximum=60):
+    """
+    Computes an exponential backoff delay with full jitter.
+    :param attempt: Number of consecutive failed attempts so far
+    :param initial: Delay in seconds before the first retry
+    :param maximum: Upper bound for the delay in seconds
+    :return:        Delay in seconds
+    """
+    return random.uniform(0, min(maximum, initial * 2 ** attempt))
 
 
 class Remote(object):
-    def __init__(self, id, host="wss://api.growbot.tardis.ed.ac.uk"):
+    def __init__(self, id, host="wss://api.growbot.tardis.ed.ac.uk",
+                 buffer_dir="remote_buffer", photo_spool_dir="photo_spool",
+                 heartbeat_interval=20, heartbeat_timeout=20,
+                 backoff_initial=1, backoff_max=60, rpc_max_pending=16):
         log.info("[REMOTE] Init {}".format(id))
         self.id = id
         self.host = host
-        self.callbacks = {}
+        self.dispatcher = RPCDispatcher(max_pending=rpc_max_pending)
         self.ws = None
-        self.ws_i = 0
-        self.__queue = []
+        self.loop = None
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.reconnects = 0
+        self.bytes_sent = 0
+        self.__buffer = OutboundBuffer(buffer_dir)
+        self.photos = PhotoUploader(self.host+"/stream-photo/"+self.id,
+                                    spool_dir=photo_spool_dir,
+                                    backoff_initial=backoff_initial,
+                                    backoff_max=backoff_max)
+        self.__wakeup = None
+        self.__closing = False
+
+        registry.gauge("growbot_remote_queue_depth", "Messages waiting to be sent to the API",
+                       fn=lambda: len(self.__buffer))
+        self.__reconnects = registry.counter("growbot_remote_reconnects_total", "Connections re-established")
+        self.__bytes_sent = registry.counter("growbot_remote_bytes_sent_total", "Bytes sent to the API",
+                                             channel="control")
+        self.__bytes_received = registry.counter("growbot_remote_bytes_received_total", "Bytes received from the API",
+                                                 channel="control")
 
     @asyncio.coroutine
     def connect(self):
-        log.info("[REMOTE] Connect {}".format(self.id))
-        self.ws = yield from websockets.connect(self.host+"/stream/"+self.id, write_limit=2**18)
-        log.info("[REMOTE] Connection established on {}, {} queued messages".format(self.host+"/stream/"+self.id, len(self.__queue)))
-
-        # Fire messages in the queue
-        for data in self.__queue:
-            log.info("[REMOTE] Firing queued message {}".format(data))
-            self.__send(data)
-
-        log.info("[REMOTE] Done queue stuff")
-
-        # Delete the queue
-        self.__queue = None
+        """
+        Supervises the API connection. The connection is re-established with exponential backoff whenever it drops,
+        and anything queued while offline is replayed once it comes back. Only returns after close() is called.
+        """
+        self.__wakeup = asyncio.Event()
+        self.loop = asyncio.get_event_loop()
+        url = self.host+"/stream/"+self.id
+        attempt = 0
+        established = False
+
+        # Photos travel on their own connection so they never hold up control messages
+        self.photos.start()
+
+        while not self.__closing:
+            log.info("[REMOTE] Connect {}".format(self.id))
+            try:
+                self.ws = yield from websockets.connect(url, write_limit=2**18,
+                                                        ping_interval=self.heartbeat_interval,
+                                                        ping_timeout=self.heartbeat_timeout)
+            except Exception as e:
+                delay = backoff_delay(attempt, self.backoff_initial, self.backoff_max)
+                attempt += 1
+                log.warning("[REMOTE] Connection to {} failed ({}), retrying in {:.1f}s".format(url, e, delay))
+                yield from asyncio.sleep(delay)
+                continue
+
+            if established:
+                self.reconnects += 1
+                self.__reconnects.inc()
+            established = True
+            attempt = 0
+            log.info("[REMOTE] Connection established on {}, {} queued messages".format(url, len(self.__buffer)))
+
+            sender = asyncio.ensure_future(self.__sender())
+            try:
+                yield from self.__receiver()
+            except websockets.exceptions.ConnectionClosed as e:
+                log.warning("[REMOTE] Connection closed ({}), reconnecting".format(e))
+            except Exception as e:
+                log.error("[REMOTE] Connection failed ({}), reconnecting".format(e))
+            finally:
+                sender.cancel()
+                self.ws = None
+                # Keep unsent messages safe in case we never come back
+                self.__buffer.spill()
 
+    @asyncio.coroutine
+    def __receiver(self):
         while True:
             message = yield from self.ws.recv()
+            self.__bytes_received.inc(len(message))
             log.debug("[REMOTE] message received {}".format(message))
-            result = json.loads(message)
+            try:
+                result = json.loads(message)
+
+                type = RPCType(result['type'])
+                data = result['data']
+                if type in self.dispatcher:
+                    self.dispatcher.dispatch(type, data)
+                else:
+                    log.error("[REMOTE] Uncaught message for type {} with data {}".format(type, data))
+            except Exception as e:
+                log.error("[REMOTE] Failed to handle message {}: {}".format(message, e))
 
-            type = RPCType(result['type'])
-            data = result['data']
-            if type in self.callbacks:
-                self._translate_call(type, data, self.callbacks[type])
-            else:
-                log.error("[REMOTE] Uncaught message for type {} with data {}".format(type, data))
+    @asyncio.coroutine
+    def __sender(self):
+        """
+        Drains the outbound buffer in order. A message is only removed once the websocket accepted it, so anything
+        in flight when the connection drops is sent again after reconnecting.
+        """
+        while True:
+            entry = self.__buffer.peek()
+            if entry is None:
+                self.__wakeup.clear()
+                yield from self.__wakeup.wait()
+                continue
+
+            seq, encoded = entry
+            yield from self.ws.send(encoded)
+            self.__buffer.pop(seq)
+            self.bytes_sent += len(encoded)
+            self.__bytes_sent.inc(len(encoded))
 
     def __send(self, data, friendly=True):
-        # The we haven't connected yet, queue messages
-        if self.ws is None:
-            log.info("[REMOTE] Queueing message {}".format(data))
-            self.__queue.append(data)
-            return
-
         friendly_data = {"type": data["type"]}
         if friendly:
             friendly_data["data"] = data["data"]
 
         thname = threading.current_thread().name
-        log.info("[REMOTE] [Thread:{}] Sending message {}".format(thname, friendly_data))
-        asyncio.ensure_future(ws_send(self.ws, self.ws_i, data))
-        self.ws_i += 1
+        if self.ws is None:
+            log.info("[REMOTE] [Thread:{}] Queueing message {}".format(thname, friendly_data))
+        else:
+            log.info("[REMOTE] [Thread:{}] Sending message {}".format(thname, friendly_data))
 
-    def plant_capture_photo(self, plant_id: int, image):
-        body = {
-            'type': "PLANT_CAPTURE_PHOTO",
-            'data': {
-                'plant_id': plant_id,
-                'image': image,  # Must be base64 encoded
-            }
-        }
+        # Safe to call from any thread, the sender coroutine picks it up on the remote loop
+        self.__buffer.push(data)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.__wakeup.set)
 
+    def plant_capture_photo(self, plant_id: int, image: bytes):
+        """
+        Queues a photo on the binary upload channel.
+        :param plant_id:    Plant the photo belongs to
+        :param image:       Raw JPEG bytes, see photo_upload.encode_photo
+        """
         log.info("[REMOTE] Sending an image of plant {}".format(str(plant_id)))
-        self.__send(body, friendly=False)
+        self.photos.enqueue(plant_id, image)
 
     def create_log_entry(self, type, message, severity=LogSeverity.INFO,
                          plant_id=None):
@@ -135,27 +231,40 @@ class Remote(object):
 
         self.__send(body)
 
-    def close(self):
-        if hasattr(self, "ws"):
-            self.ws.close()
+    def update_soil_moisture_batch(self, readings):
+        """
+        Reports the soil moisture of several plants at once.
+        :param readings:    List of dictionaries with plant, moisture, samples and timestamp keys
+        """
+        body = {
+            'type': 'UPDATE_SOIL_MOISTURE_BATCH',
+            'data': {
+                'readings': readings
+            }
+        }
 
-    def add_callback(self, type, fn):
-        self.callbacks[type] = fn
+        self.__send(body)
+
+    def close(self):
+        self.__closing = True
+        if self.ws is not None and self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.ws.close(), self.loop)
 
-    def _translate_call(self, type, data, fn):
+    def add_callback(self, type, fn, mode=HandlerMode.INLINE, coalesce=None, max_pending=None):
         """
-        Internal only
+        Registers the callback for an RPC type.
+        :param type:        RPCType to handle
+        :param fn:          Callback, receives the arguments given by RPC_ARGUMENTS
+        :param mode:        HandlerMode.POOL for callbacks that may block, so they don't stall the receive loop
+        :param coalesce:    For HandlerMode.POOL, see RPCDispatcher.register
+        :param max_pending: For HandlerMode.POOL, see RPCDispatcher.register
         """
-        if type == RPCType.MOVE_IN_DIRECTION:
-            fn(data)
-        elif type == RPCType.DEMO_START:
-            fn(data)
-        elif type == RPCType.SETTINGS_PATCH:
-            fn(data["Key"], data["Value"])
-        elif type == RPCType.EVENTS:
-            fn(data)
-        elif type == RPCType.SET_STANDBY:
-            log.info("remote._translate_call('standby', {}, {}".format(data, fn))
-            fn(data)
-        else:
+        if type not in RPC_ARGUMENTS:
             raise UnhandledRPCTranslationException()
+        self.dispatcher.register(type, fn, RPC_ARGUMENTS[type], mode, coalesce, max_pending)
+
+    def rpc_latency(self):
+        """
+        :return:    Per-RPC handler latency histograms, see RPCDispatcher.latency
+        """
+        return self.dispatcher.latency()
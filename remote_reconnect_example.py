@@ -0,0 +1,63 @@
+import asyncio
+import json
+import logging as log
+import sys
+import tempfile
+import threading
+import time
+import websockets
+from remote import Remote, LogType
+
+# Stand-in for the API: accepts the robot stream and hangs up every DROP_EVERY messages
+PORT = 18080
+MESSAGES = 2000
+DROP_EVERY = 300
+
+received = []
+
+
+@asyncio.coroutine
+def standin_server(websocket, path):
+    count = 0
+    while True:
+        message = yield from websocket.recv()
+        received.append(json.loads(message)["data"]["message"])
+        count += 1
+        if count % DROP_EVERY == 0:
+            yield from websocket.close()
+            return
+
+
+def producer(remote):
+    for i in range(MESSAGES):
+        remote.create_log_entry(LogType.UNKNOWN, str(i))
+
+
+def run():
+    log.basicConfig(format="[ %(asctime)s ] [ %(levelname)s ] %(message)s", level=log.WARNING, stream=sys.stdout)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(websockets.serve(standin_server, port=PORT))
+
+    r = Remote("standin", "ws://localhost:{}".format(PORT), buffer_dir=tempfile.mkdtemp(),
+               backoff_initial=0.05, backoff_max=0.5)
+    asyncio.ensure_future(r.connect())
+
+    start = time.time()
+    threading.Thread(target=producer, args=(r,), daemon=True).start()
+
+    while len(set(received)) < MESSAGES and time.time() - start < 60:
+        loop.run_until_complete(asyncio.sleep(0.1))
+    elapsed = time.time() - start
+
+    unique = set(received)
+    print("Sent:       {}".format(MESSAGES))
+    print("Received:   {} ({} duplicates)".format(len(received), len(received) - len(unique)))
+    print("Lost:       {}".format(MESSAGES - len(unique)))
+    print("Reconnects: {}".format(r.reconnects))
+    print("Throughput: {:.1f} msg/s".format(len(unique) / elapsed))
+
+
+if __name__ == "__main__":
+    run()
+    print("Completed!")
@@ -0,0 +1,171 @@
+from collections import deque
+from enum import Enum, unique
+import bisect
+import logging as log
+import threading
+import time
+
+
+@unique
+class HandlerMode(Enum):
+    INLINE = "inline"  # Runs on the websocket thread, only for handlers that return immediately
+    POOL = "pool"      # Runs on a worker thread of its RPC type, one call after another in the order they arrived
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram of handler latencies in milliseconds.
+    """
+    buckets = (1, 5, 10, 50, 100, 500, 1000, 5000, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.buckets)
+        self.total = 0.0
+        self.count = 0
+        self.__lock = threading.Lock()
+
+    def observe(self, ms):
+        with self.__lock:
+            self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+            self.total += ms
+            self.count += 1
+
+    def snapshot(self):
+        """
+        :return:    Dictionary with per-bucket counts keyed by upper bound, plus count and sum
+        """
+        with self.__lock:
+            return {
+                "buckets": dict(zip(self.buckets, self.counts)),
+                "count": self.count,
+                "sum": self.total,
+            }
+
+
+class RPCDispatcher:
+    """
+    Registry based dispatcher for inbound RPCs.
+
+    Each RPC type is registered once with a handler, a translator turning the message payload into handler arguments,
+    and a mode deciding whether it runs inline or on a worker thread. Everything is validated at registration so that
+    dispatching is a single table lookup.
+
+    Calls handled off the receive loop go to a bounded worker pool: one worker thread per RPC type, so calls of one
+    type run in the order they arrived and a brake never overtakes the forward before it, and at most max_pending calls
+    waiting for each. Once a type has max_pending calls waiting, the oldest one that coalesce allows to drop makes room
+    for the new call. Without one the new call is rejected with an error logged, which never loses a brake, as the
+    calls waiting are brakes too then.
+    """
+
+    def __init__(self, max_pending=16):
+        """
+        Constructor for RPCDispatcher class.
+        :param max_pending: Calls of an RPC type waiting for its worker at most
+        """
+        self.max_pending = max_pending
+        self.__table = {}
+        self.__lanes = {}
+        self.histograms = {}
+
+    def register(self, type, fn, translate, mode=HandlerMode.INLINE, coalesce=None, max_pending=None):
+        """
+        Registers the handler for an RPC type, replacing any previous one.
+        :param type:        RPC type, an Enum member
+        :param fn:          Handler
+        :param translate:   Function mapping the message payload to a tuple of handler arguments
+        :param mode:        HandlerMode of the handler
+        :param coalesce:    Function taking the handler arguments of a waiting call, True if a newer call of the type
+                            may take its place. None to keep every call
+        :param max_pending: Calls waiting at most, the dispatcher's max_pending if None
+        :return:
+        """
+        if not isinstance(type, Enum):
+            raise TypeError("RPC type must be an Enum member, got {!r}".format(type))
+        if not callable(fn) or not callable(translate):
+            raise TypeError("Handler and translator for {} must be callable".format(type))
+        if not isinstance(mode, HandlerMode):
+            raise TypeError("Handler mode for {} must be a HandlerMode, got {!r}".format(type, mode))
+
+        self.__table[type] = (fn, translate, mode)
+        self.histograms.setdefault(type, LatencyHistogram())
+        if mode is HandlerMode.POOL:
+            lane = self.__lanes.get(type)
+            if lane is None:
+                lane = self.__lanes[type] = _Lane(type, self.__run)
+            lane.coalesce = coalesce
+            lane.max_pending = max_pending if max_pending is not None else self.max_pending
+
+    def __contains__(self, type):
+        return type in self.__table
+
+    def dispatch(self, type, data):
+        """
+        Runs the handler registered for type with the given payload, or queues it for the type's worker.
+        :param type:    RPC type
+        :param data:    Message payload
+        :return:        False if the call was rejected as its type has max_pending calls waiting already
+        """
+        fn, translate, mode = self.__table[type]
+        args = translate(data)
+        received = time.monotonic()
+
+        if mode is HandlerMode.INLINE:
+            self.__run(type, fn, args, received)
+            return True
+        return self.__lanes[type].put(fn, args, received)
+
+    def __run(self, type, fn, args, received):
+        try:
+            fn(*args)
+        except Exception as e:
+            log.error("[RPC] Handler for {} failed: {}".format(type, e))
+        finally:
+            self.histograms[type].observe((time.monotonic() - received) * 1000)
+
+    def latency(self):
+        """
+        :return:    Latency histogram snapshots keyed by RPC type
+        """
+        return {type: histogram.snapshot() for type, histogram in self.histograms.items()}
+
+
+class _Lane:
+    """
+    Worker thread running the calls of one RPC type in order.
+    """
+
+    def __init__(self, type, run):
+        self.type = type
+        self.coalesce = None
+        self.max_pending = 16
+        self.__run = run
+        self.__waiting = deque()
+        self.__condition = threading.Condition()
+        threading.Thread(target=self.__work, name="rpc-" + type.name.lower(), daemon=True).start()
+
+    def put(self, fn, args, received):
+        """
+        :return:    Whether the call was queued, see RPCDispatcher
+        """
+        with self.__condition:
+            if len(self.__waiting) >= self.max_pending:
+                dropped = None
+                if self.coalesce is not None:
+                    dropped = next((call for call in self.__waiting if self.coalesce(*call[1])), None)
+                if dropped is None:
+                    log.error("[RPC] {} calls of {} waiting, rejecting one with arguments {}".format(
+                        len(self.__waiting), self.type, args))
+                    return False
+                self.__waiting.remove(dropped)
+                log.warning("[RPC] {} calls of {} waiting, dropping one with arguments {} for a newer one".format(
+                    len(self.__waiting) + 1, self.type, dropped[1]))
+            self.__waiting.append((fn, args, received))
+            self.__condition.notify()
+            return True
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__waiting)
+                fn, args, received = self.__waiting.popleft()
+            self.__run(self.type, fn, args, received)
@@ -1,9 +1,9 @@
-import serial
-import asyncio
 import os
 import time
+import threading
 import logging as log
 import sys
+from collections import deque
 
 #ser = serial.Serial('/dev/ttyACM0',115200)
 #s = [0,1]
@@ -11,12 +11,50 @@ import sys
 #print (s[0])
 
 class SerialIO:
-    def __init__(self, address, baudrate, callback):
-        self.ser = serial.Serial(port=address, baudrate=baudrate, timeout=5)
+    """
+    Long-lived reader for the soil moisture sensors.
+
+    A single background thread reads the serial port continuously, splits it into lines and keeps a timestamped ring
+    of readings. Sensors send bursts framed as
+
+        $SM,<plant_id>,<moisture>,<timestamp>[,<plant_id>,<moisture>,<timestamp>...]*<checksum>
+
+    where checksum is the XOR of every byte between "$" and "*" as two hex digits, and timestamp is the sensor's own
+    clock. Bursts with a bad checksum are dropped as a whole. Plain "<moisture>" lines from older sensors are still
+    accepted and attributed to default_plant.
+
+    Every report_interval seconds the readings of the last aggregate_window seconds are averaged per plant and
+    uploaded in a single batch.
+    """
+
+    def __init__(self, address, baudrate, callback, report_interval=3600, aggregate_window=600, history=4096,
+                 default_plant=1, max_line=4096):
+        """
+        Constructor for SerialIO class.
+        :param address:         Serial device
+        :param baudrate:        Baud rate of the serial link
+        :param callback:        RobotController instance, its remote receives the readings
+        :param report_interval: Seconds between two reports to the API
+        :param aggregate_window: Seconds of readings averaged into a report
+        :param history:         Number of readings kept in the ring
+        :param default_plant:   Plant ID used for lines which don't carry one
+        :param max_line:        Bytes kept of a line without its end, more are dropped as noise
+        """
+        # Imported here, the simulation runs without pyserial
+        import serial
+        self.ser = serial.Serial(port=address, baudrate=baudrate, timeout=1)
         self.address = address
         self.baudrate = baudrate
         self.callback = callback
-        self.value_reading = False
+        self.report_interval = report_interval
+        self.aggregate_window = aggregate_window
+        self.default_plant = default_plant
+        self.max_line = max_line
+        self.readings = deque(maxlen=history)  # (received, plant_id, moisture, sensor_timestamp)
+        self.__lock = threading.Lock()
+        self.__partial = b""
+        self.__running = False
+        self.__thread = None
         if os.path.isfile("sensor_read"):
             with open("sensor_read", mode="r") as sensor_read:
                 read = sensor_read.read()
@@ -28,20 +66,139 @@ class SerialIO:
         else:
             self.sensor_last_read = 0
 
-    def read_value(self):
-        self.value_reading = True
+    def start(self):
+        """
+        Starts the reader thread.
+        :return:
+        """
+        if self.__thread is not None:
+            return
+
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name="serial_io", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__running = False
+
+    def __run(self):
+        log.info("[SENSOR] Reading {} at {} baud".format(self.address, self.baudrate))
+        while self.__running:
+            try:
+                for line in self.__read_lines():
+                    self.__handle_line(line)
+            except Exception as e:
+                log.error("[SENSOR] Serial read failed due to exception: {}.".format(str(e)))
+                time.sleep(1)
+
+            if time.time() - self.sensor_last_read > self.report_interval:
+                self.report()
+
+    def __read_lines(self):
+        """
+        Reads whatever is available (waiting at most the port timeout) and returns the complete lines in it.
+        Incomplete trailing data is kept until the rest of the line arrives.
+        """
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if not data:
+            return []
+
+        lines = (self.__partial + data).split(b"\n")
+        self.__partial = lines.pop()
+        if len(self.__partial) > self.max_line:
+            # A noisy line or a wrong baud rate never sends the end of the line
+            log.warning("[SENSOR] No line end in {} bytes, dropping them".format(len(self.__partial)))
+            self.__partial = b""
+        return [line.strip() for line in lines if line.strip()]
+
+    @staticmethod
+    def checksum(payload):
+        """
+        :param payload: Bytes between "$" and "*" of a frame
+        :return:        XOR of all bytes
+        """
+        value = 0
+        for byte in payload:
+            value ^= byte
+        return value
+
+    def parse_line(self, line):
+        """
+        Parses one line from the sensor link.
+        :param line:    Line without its terminator
+        :return:        List of (plant_id, moisture, sensor_timestamp) samples
+        """
+        if not line.startswith(b"$"):
+            return [(self.default_plant, int(line), None)]
+
+        payload, _, checksum = line[1:].partition(b"*")
+        if int(checksum, 16) != self.checksum(payload):
+            raise ValueError("checksum mismatch")
+
+        fields = payload.decode("ascii").split(",")
+        if fields[0] != "SM" or (len(fields) - 1) % 3 != 0:
+            raise ValueError("unknown frame")
+
+        values = fields[1:]
+        return [(int(values[i]), int(values[i + 1]), int(values[i + 2])) for i in range(0, len(values), 3)]
+
+    def __handle_line(self, line):
         try:
-            value = [0,1]
-            value[0] = int(self.ser.readline()) # Attempts to read the sensor
-            asyncio.set_event_loop(asyncio.new_event_loop())
-            self.callback.remote.update_soil_moisture(1, value[0])
-            log.info("[SENSOR] Read sensor {} with value {}".format(self.baudrate, str(value[0])))
-            # Update time read to now
-            with open("sensor_read", mode="w") as sensor_write:
-                sensor_write.write(str(time.time()))
-                sensor_write.close()
-            self.sensor_last_read = time.time()
-        except Exception as e:
-            log.error("[SENSOR] Sensor value not read due to exception: {}.".format(str(e)))
-        finally:
-            self.value_reading = False
+            samples = self.parse_line(line)
+        except ValueError as e:
+            log.warning("[SENSOR] Ignoring malformed line {} ({})".format(line, e))
+            return
+
+        received = time.time()
+        with self.__lock:
+            for plant_id, moisture, sensor_timestamp in samples:
+                self.readings.append((received, plant_id, moisture, sensor_timestamp))
+        log.debug("[SENSOR] Received {} samples".format(len(samples)))
+
+    def aggregate(self, since):
+        """
+        Averages readings per plant.
+        :param since:   Only readings received at or after this time are considered
+        :return:        Dictionary mapping plant ID to (mean moisture, sample count, latest sensor timestamp)
+        """
+        totals = {}
+        with self.__lock:
+            for received, plant_id, moisture, sensor_timestamp in self.readings:
+                if received < since:
+                    continue
+                total, count, _ = totals.get(plant_id, (0, 0, None))
+                totals[plant_id] = (total + moisture, count + 1, sensor_timestamp)
+
+        return {plant_id: (total / count, count, sensor_timestamp)
+                for plant_id, (total, count, sensor_timestamp) in totals.items()}
+
+    def report(self):
+        """
+        Uploads the per-plant average of recent readings to the API in one batch.
+        :return:
+        """
+        remote = getattr(self.callback, "remote", None)
+        now = time.time()
+
+        aggregated = self.aggregate(max(self.sensor_last_read, now - self.aggregate_window))
+        if not aggregated:
+            # Nothing new yet, report as soon as the next reading arrives
+            return
+
+        batch = []
+        for plant_id, (moisture, count, sensor_timestamp) in sorted(aggregated.items()):
+            log.info("[SENSOR] Reporting plant {} with value {} ({} samples)".format(plant_id, moisture, count))
+            batch.append({
+                'plant': plant_id,
+                'moisture': moisture,
+                'samples': count,
+                'timestamp': sensor_timestamp,
+            })
+        if remote is not None:
+            remote.update_soil_moisture_batch(batch)
+
+        # Update time read to now
+        with open("sensor_read", mode="w") as sensor_write:
+            sensor_write.write(str(now))
+            sensor_write.close()
+        self.sensor_last_read = now
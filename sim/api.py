@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the GrowBot API.
+
+FakeAPI records everything the robot reports and sends it RPCs. Robots reach it either in-process through SimRemote,
+which is what the simulator uses, or over websockets like the real API, so a robot can be pointed at it by setting
+API_HOST in config.py to the address printed below.
+
+Usage: python -m sim.api [port] [events.json]
+"""
+import asyncio
+import hashlib
+import json
+import logging as log
+import sys
+import threading
+
+import websockets
+
+from remote import Remote, RPCType, RPC_ARGUMENTS, UnhandledRPCTranslationException
+from rpc_dispatch import HandlerMode
+
+
+class FakeAPI:
+    """
+    Records log entries, soil moisture reports and photos, and fans RPCs out to every connected robot.
+    """
+
+    def __init__(self, clock=None):
+        """
+        Constructor for FakeAPI class.
+        :param clock:   Time source for the records, the time module if None
+        """
+        if clock is None:
+            import time as clock
+        self.clock = clock
+        self.log_entries = []       # (time, data of CREATE_LOG_ENTRY)
+        self.moisture = []          # (time, plant, moisture)
+        self.photos = []            # (time, plant_id, size in bytes)
+        self.on_photo = None        # Called with the plant ID of every completed photo
+        self.on_connect = None      # Called with the send function of every robot connecting
+        self.__streams = []         # Functions sending an RPC message to one robot
+        self.__uploads = {}         # Upload ID to (metadata, received bytes) of photos in flight
+        self.__lock = threading.Lock()
+
+    def attach(self, send):
+        """
+        Connects a robot.
+        :param send:    Called with the RPCType and payload of every RPC
+        :return:
+        """
+        with self.__lock:
+            self.__streams.append(send)
+        if self.on_connect is not None:
+            self.on_connect(send)
+
+    def detach(self, send):
+        with self.__lock:
+            self.__streams.remove(send)
+
+    def rpc(self, type, data):
+        """
+        Sends an RPC to every connected robot.
+        :param type:    RPCType
+        :param data:    Payload
+        :return:        Number of robots it was sent to
+        """
+        with self.__lock:
+            streams = list(self.__streams)
+        for send in streams:
+            send(type, data)
+        return len(streams)
+
+    def receive(self, message):
+        """
+        Records a message from the robot's control stream.
+        :param message: Decoded message with type and data
+        :return:
+        """
+        now = self.clock.time()
+        type, data = message["type"], message.get("data")
+
+        if type == "CREATE_LOG_ENTRY":
+            self.log_entries.append((now, data))
+        elif type == "UPDATE_SOIL_MOISTURE":
+            self.moisture.append((now, data["plant"], data["moisture"]))
+        elif type == "UPDATE_SOIL_MOISTURE_BATCH":
+            for reading in data["readings"]:
+                self.moisture.append((now, reading["plant"], reading["moisture"]))
+        else:
+            log.warning("[API] Unknown message type {}".format(type))
+
+    def receive_photo(self, plant_id, jpeg):
+        """
+        Records a completely uploaded photo.
+        :param plant_id:    Plant the photo belongs to
+        :param jpeg:        Photo bytes
+        :return:
+        """
+        log.info("[API] Photo of plant {} received ({} bytes)".format(plant_id, len(jpeg)))
+        self.photos.append((self.clock.time(), plant_id, len(jpeg)))
+        if self.on_photo is not None:
+            self.on_photo(plant_id)
+
+    def serve(self, host="localhost", port=8080):
+        """
+        Accepts robots on /stream/<id> and /stream-photo/<id> like the real API.
+        :return:    Coroutine starting the server
+        """
+        return websockets.serve(self.__handler, host, port)
+
+    @asyncio.coroutine
+    def __handler(self, websocket, path):
+        if path.startswith("/stream-photo/"):
+            yield from self.__photo_stream(websocket)
+        elif path.startswith("/stream/"):
+            yield from self.__control_stream(websocket)
+        else:
+            log.warning("[API] Rejecting connection to {}".format(path))
+
+    @asyncio.coroutine
+    def __control_stream(self, websocket):
+        loop = asyncio.get_event_loop()
+
+        def send(type, data):
+            message = json.dumps({"type": type.value, "data": data})
+            asyncio.run_coroutine_threadsafe(websocket.send(message), loop)
+
+        self.attach(send)
+        try:
+            while True:
+                self.receive(json.loads((yield from websocket.recv())))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.detach(send)
+
+    @asyncio.coroutine
+    def __photo_stream(self, websocket):
+        # Server side of the PhotoUploader protocol, partial uploads survive reconnects
+        current = None
+        try:
+            while True:
+                message = yield from websocket.recv()
+                if isinstance(message, bytes):
+                    self.__uploads[current][1].extend(message)
+                    continue
+
+                message = json.loads(message)
+                upload_id = message["data"]["upload_id"]
+                if message["type"] == "PHOTO_BEGIN":
+                    current = upload_id
+                    received = self.__uploads.setdefault(upload_id, (message["data"], bytearray()))[1]
+                    yield from websocket.send(json.dumps(
+                        {"type": "PHOTO_RESUME", "data": {"upload_id": upload_id, "offset": len(received)}}))
+                elif message["type"] == "PHOTO_END":
+                    meta, received = self.__uploads.pop(upload_id)
+                    ok = hashlib.sha1(received).hexdigest() == message["data"]["sha1"]
+                    if ok:
+                        self.receive_photo(meta["plant_id"], bytes(received))
+                    yield from websocket.send(json.dumps(
+                        {"type": "PHOTO_ACK", "data": {"upload_id": upload_id, "ok": ok}}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+class SimRemote:
+    """
+    Remote connected to a FakeAPI in-process, for simulation on a LockstepClock. Messages reach the API immediately,
+    and each RPC runs its callback on a simulated thread of its own.
+    """
+
+    def __init__(self, api, clock, id="sim"):
+        """
+        Constructor for SimRemote class.
+        :param api:     FakeAPI to talk to
+        :param clock:   LockstepClock the callbacks run on
+        :param id:      Robot ID
+        """
+        self.api = api
+        self.clock = clock
+        self.id = id
+        self.callbacks = {}
+        api.attach(self.deliver)
+
+    # The message bodies are built by Remote itself, only the transport differs
+    create_log_entry = Remote.create_log_entry
+    update_soil_moisture = Remote.update_soil_moisture
+    update_soil_moisture_batch = Remote.update_soil_moisture_batch
+
+    def _Remote__send(self, data, friendly=True):
+        self.api.receive(json.loads(json.dumps(data)))
+
+    def plant_capture_photo(self, plant_id: int, image: bytes):
+        self.api.receive_photo(plant_id, image)
+
+    def add_callback(self, type, fn, mode=HandlerMode.INLINE, coalesce=None, max_pending=None):
+        if type not in RPC_ARGUMENTS:
+            raise UnhandledRPCTranslationException()
+        self.callbacks[type] = fn
+
+    def deliver(self, type, data):
+        if type not in self.callbacks:
+            log.error("[REMOTE] Uncaught message for type {} with data {}".format(type, data))
+            return
+        self.clock.thread(self.callbacks[type], RPC_ARGUMENTS[type](data), name="rpc")
+
+    def close(self):
+        self.api.detach(self.deliver)
+
+
+def main():
+    log.basicConfig(format="[ %(asctime)s ] [ %(levelname)s ] %(message)s", level=log.INFO, stream=sys.stdout)
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+
+    # Optionally greet every robot with a list of events, e.g. [{"id": 1, "recurrences": [], "ephemeral": true,
+    # "actions": [{"plant_id": 1, "name": "PLANT_CAPTURE_PHOTO"}]}]
+    events = None
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as f:
+            events = json.load(f)
+
+    api = FakeAPI()
+    if events is not None:
+        api.on_connect = lambda send: send(RPCType.EVENTS, events)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(api.serve(port=port))
+    print("Fake API listening, set API_HOST=\"localhost:{}\" and API_SECURE=False".format(port))
+    loop.run_forever()
+
+
+if __name__ == "__main__":
+    main()
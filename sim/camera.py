@@ -0,0 +1,140 @@
+import math
+
+
+def bearing_to(pose, x, y):
+    """
+    :param pose:    Object with x, y and heading attributes
+    :param x:       Target x position
+    :param y:       Target y position
+    :return:        Tuple (distance, bearing) of the target, bearing positive to the left
+    """
+    dx, dy = x - pose.x, y - pose.y
+    bearing = (math.atan2(dy, dx) - pose.heading + math.pi) % (2 * math.pi) - math.pi
+    return math.hypot(dx, dy), bearing
+
+
+class CameraModel:
+    """
+    Pinhole model of the front camera producing predictions in the format Vision hands to RobotController.
+    """
+
+    def __init__(self, width=640, height=480, hfov=62.2, plant_width=0.15, plant_height=0.25, max_range=4.0,
+                 noise=3.0, rng=None):
+        """
+        Constructor for CameraModel class.
+        :param width:           Frame width in pixels
+        :param height:          Frame height in pixels
+        :param hfov:            Horizontal field of view in degrees
+        :param plant_width:     Plant width in metres
+        :param plant_height:    Plant height in metres
+        :param max_range:       Distance in metres beyond which plants are too small to be detected
+        :param noise:           Standard deviation of the bounding box jitter in pixels
+        :param rng:             random.Random instance for the jitter, no jitter if None
+        """
+        self.width = width
+        self.height = height
+        self.half_fov = math.radians(hfov) / 2
+        self.focal = width / 2 / math.tan(self.half_fov)
+        self.plant_width = plant_width
+        self.plant_height = plant_height
+        self.max_range = max_range
+        self.noise = noise
+        self.rng = rng
+
+    def project(self, distance, bearing, label="Plant", confidence=0.9):
+        """
+        Projects an object into the frame.
+        :param distance:    Distance in metres
+        :param bearing:     Bearing in radians, positive to the left
+        :return:            Prediction tuple (label, confidence, ((xmin, ymin), (xmax, ymax))), or None if not visible
+        """
+        if distance > self.max_range or abs(bearing) > self.half_fov:
+            return None
+
+        depth = distance * math.cos(bearing)
+        centre = self.width / 2 - self.focal * math.tan(bearing)
+        half_w = self.focal * self.plant_width / depth / 2
+        half_h = self.focal * self.plant_height / depth / 2
+
+        if self.rng is not None:
+            centre += self.rng.gauss(0, self.noise)
+
+        xmin = int(max(0, centre - half_w))
+        xmax = int(min(self.width, centre + half_w))
+        ymin = int(max(0, self.height / 2 - half_h))
+        ymax = int(min(self.height, self.height / 2 + half_h))
+
+        return label, confidence, ((xmin, ymin), (xmax, ymax))
+
+    def unproject(self, box):
+        """
+        Inverse of project for an unclipped plant bounding box.
+        :param box: ((xmin, ymin), (xmax, ymax))
+        :return:    Tuple (distance, bearing)
+        """
+        ((xmin, _), (xmax, _)) = box
+        bearing = math.atan((self.width / 2 - (xmin + xmax) / 2) / self.focal)
+        depth = self.focal * self.plant_width / max(1, xmax - xmin)
+        return depth / math.cos(bearing), bearing
+
+
+class UltrasonicModel:
+    """
+    Ultrasonic distance sensor with a narrow cone, reporting millimetres like the EV3 sensor.
+    """
+
+    def __init__(self, offset=0.0, cone=15, max_value=2550, mount=0.0):
+        """
+        Constructor for UltrasonicModel class.
+        :param offset:      Direction of the sensor relative to the heading in radians, pi for the back sensor
+        :param cone:        Half opening angle in degrees
+        :param max_value:   Reading when nothing is in range
+        :param mount:       Distance of the sensor from the robot's centre in metres
+        """
+        self.offset = offset
+        self.cone = math.radians(cone)
+        self.max_value = max_value
+        self.mount = mount
+
+    def read(self, pose, objects, bounds=None):
+        """
+        :param pose:    Robot pose
+        :param objects: List of (x, y, radius) tuples
+        :param bounds:  Optional (xmin, ymin, xmax, ymax) walls around the area
+        :return:        Distance to the closest surface in the cone in millimetres
+        """
+        distances = []
+        for x, y, radius in objects:
+            distance, bearing = bearing_to(pose, x, y)
+            bearing = (bearing - self.offset + math.pi) % (2 * math.pi) - math.pi
+            if abs(bearing) <= self.cone:
+                distances.append(distance - radius)
+
+        if bounds is not None:
+            distances.append(self.wall_distance(pose, bounds))
+
+        value = self.max_value
+        for distance in distances:
+            value = min(value, max(0, int((distance - self.mount) * 1000)))
+        return value
+
+    def wall_distance(self, pose, bounds):
+        """
+        :param pose:    Robot pose inside bounds
+        :param bounds:  (xmin, ymin, xmax, ymax)
+        :return:        Distance from the robot's centre to the wall along the sensor axis in metres
+        """
+        xmin, ymin, xmax, ymax = bounds
+        direction = pose.heading + self.offset
+        dx, dy = math.cos(direction), math.sin(direction)
+
+        hits = []
+        if dx > 1e-9:
+            hits.append((xmax - pose.x) / dx)
+        elif dx < -1e-9:
+            hits.append((xmin - pose.x) / dx)
+        if dy > 1e-9:
+            hits.append((ymax - pose.y) / dy)
+        elif dy < -1e-9:
+            hits.append((ymin - pose.y) / dy)
+        return max(0, min(hits))
@@ -0,0 +1,339 @@
+import heapq
+import itertools
+import logging as log
+import sys
+import threading
+import traceback
+import types
+
+
+class VirtualClock:
+    """
+    Stand-in for the time module driven by the simulation instead of the wall clock.
+
+    Modules under simulation get it assigned in place of their time import. sleep() does not block, it advances the
+    clock and lets the world catch up through on_advance, so everything runs faster than real time and is
+    reproducible.
+    """
+
+    def __init__(self, start=0.0, on_advance=None, max_step=0.01):
+        """
+        Constructor for VirtualClock class.
+        :param start:       Initial time in seconds
+        :param on_advance:  Called with the step length in seconds whenever time moves forward
+        :param max_step:    Longest step passed to on_advance, longer sleeps are split up
+        """
+        self.now = start
+        self.on_advance = on_advance
+        self.max_step = max_step
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        remaining = max(0, seconds)
+        while remaining > 0:
+            step = min(remaining, self.max_step)
+            self.now += step
+            remaining -= step
+            if self.on_advance is not None:
+                self.on_advance(step)
+
+
+class SimulationStopped(BaseException):
+    """
+    Raised in threads still parked on a LockstepClock when the simulation ends, so they unwind instead of lingering.
+    Derives from BaseException so the catch-all handlers of the code under simulation don't swallow it.
+    """
+
+
+class _Task:
+    def __init__(self, name):
+        self.name = name
+        self.resume = threading.Event()
+        self.ticket = 0
+
+
+class LockstepClock(VirtualClock):
+    """
+    VirtualClock for code running on several threads.
+
+    Threads taking part in the simulation are started through thread() or the Thread of threading_module() and run
+    one at a time: each one runs until it sleeps, waits on an Event of this clock or returns, then the clock hands over
+    to whichever thread is due next, moving time forward when none is due yet. The interleaving only depends on
+    virtual time, so multi-threaded code behaves the same on every run. A thread blocking on anything else, like a
+    real lock held by a parked thread, stalls the simulation.
+    """
+
+    def __init__(self, start=0.0, on_advance=None, max_step=0.01, spin_step=0.005):
+        """
+        Constructor for LockstepClock class.
+        :param start:       Initial time in seconds
+        :param on_advance:  Called with the step length in seconds whenever time moves forward
+        :param max_step:    Longest step passed to on_advance, longer sleeps are split up
+        :param spin_step:   Time passing on every reading of the spinning() view, see there
+        """
+        super().__init__(start, on_advance, max_step)
+        self.spin_step = spin_step
+        self.stopped = False
+        self.__lock = threading.Lock()
+        self.__due = []                     # Heap of (wake time, order, ticket, task)
+        self.__order = itertools.count()
+        self.__tasks = {}                   # Thread ident to task
+        self.__live = set()                 # Tasks of threads which haven't returned yet
+
+    def run(self, target, *args):
+        """
+        Runs target on the calling thread as the first simulated thread and stops the simulation once it returns.
+        :param target:  Function to run
+        :return:        Whatever target returns
+        """
+        task = _Task("main")
+        self.__tasks[threading.get_ident()] = task
+        try:
+            return target(*args)
+        finally:
+            self.stop()
+            del self.__tasks[threading.get_ident()]
+
+    def stop(self):
+        """
+        Ends the simulation. Parked threads are released and unwind with SimulationStopped.
+        :return:
+        """
+        with self.__lock:
+            self.stopped = True
+            self.__due = []
+            parked = [task for task in self.__live if task is not self.current()]
+        for task in parked:
+            task.resume.set()
+
+    def thread(self, target, args=(), kwargs=None, name=None):
+        """
+        Starts a simulated thread. It first runs once the current one yields.
+        :param target:  Function run by the thread
+        :param args:    Positional arguments of target
+        :param kwargs:  Keyword arguments of target
+        :param name:    Thread name
+        :return:        The underlying threading.Thread
+        """
+        task = _Task(name or "sim-{}".format(next(self.__order)))
+        kwargs = kwargs or {}
+        self.__live.add(task)
+
+        def bootstrap():
+            self.__tasks[threading.get_ident()] = task
+            try:
+                task.resume.wait()
+                task.resume.clear()
+                if not self.stopped:
+                    target(*args, **kwargs)
+            except (SimulationStopped, SystemExit):
+                pass
+            except Exception:
+                # Reported like threading does for an uncaught exception
+                print("Exception in simulated thread {}:".format(task.name), file=sys.stderr)
+                traceback.print_exc()
+            finally:
+                del self.__tasks[threading.get_ident()]
+                self.__live.discard(task)
+                if not self.stopped:
+                    self.__switch(task, None)
+
+        thread = threading.Thread(target=bootstrap, name=task.name, daemon=True)
+        self._wake(task)
+        thread.start()
+        return thread
+
+    def current(self):
+        """
+        :return:    Task of the calling thread, None if it isn't simulated
+        """
+        return self.__tasks.get(threading.get_ident())
+
+    def sleep(self, seconds):
+        self._park(self.now + max(0, seconds))
+
+    def spin(self):
+        """
+        Lets spin_step pass for the calling thread, see spinning().
+        :return:
+        """
+        self._park(self.now + self.spin_step)
+
+    def spinning(self):
+        """
+        Time module stand-in for code polling the clock in busy loops. Every reading lets spin_step pass, so such
+        loops make progress in virtual time and give the other threads a turn.
+        :return:    Object with time, monotonic, perf_counter and sleep
+        """
+        clock = self
+
+        class Spinning:
+            @staticmethod
+            def time():
+                clock.spin()
+                return clock.now
+
+            monotonic = perf_counter = time
+            sleep = staticmethod(clock.sleep)
+
+        return Spinning
+
+    def Event(self):
+        """
+        :return:    threading.Event replacement whose wait parks the simulated thread
+        """
+        return _Event(self)
+
+    def threading_module(self):
+        """
+        Stand-in for the threading module in modules under simulation. Threads and events go through this clock,
+        everything else is the real module.
+        :return:    Module-like object
+        """
+        clock = self
+
+        class Thread:
+            def __init__(self, group=None, target=None, name=None, args=(), kwargs=None, daemon=None):
+                self.name = name
+                self.daemon = daemon
+                self._target = target
+                self._args = args
+                self._kwargs = kwargs or {}
+                self._finished = clock.Event()
+                self._thread = None
+
+            def start(self):
+                self._thread = clock.thread(self.__run, name=self.name)
+
+            def __run(self):
+                try:
+                    self.run()
+                finally:
+                    self._finished.set()
+
+            def run(self):
+                if self._target is not None:
+                    self._target(*self._args, **self._kwargs)
+
+            def join(self, timeout=None):
+                self._finished.wait(timeout)
+
+            def is_alive(self):
+                return self._thread is not None and not self._finished.is_set()
+
+            def setDaemon(self, daemonic):
+                self.daemon = daemonic
+
+        module = types.SimpleNamespace(**{name: getattr(threading, name) for name in dir(threading)
+                                          if not name.startswith("__")})
+        module.Thread = Thread
+        module.Event = self.Event
+        return module
+
+    def _park(self, wake):
+        """
+        Yields the calling simulated thread until wake, or until _wake is called for it.
+        :param wake:    Virtual time to resume at, None to wait for _wake only
+        :return:
+        """
+        task = self.current()
+        if task is None:
+            raise RuntimeError("{} is not a simulated thread".format(threading.current_thread().name))
+        if self.stopped:
+            raise SimulationStopped()
+
+        self.__schedule(task, wake)
+        self.__switch(task, task)
+
+    def _wake(self, task):
+        """
+        Makes a parked task due now.
+        :param task:    Task to resume
+        :return:
+        """
+        self.__schedule(task, self.now)
+
+    def __schedule(self, task, wake):
+        with self.__lock:
+            task.ticket += 1
+            if wake is not None:
+                heapq.heappush(self.__due, (wake, next(self.__order), task.ticket, task))
+
+    def __switch(self, task, waiting):
+        """
+        Hands over to the next due task, advancing time up to its wake time.
+        :param task:    Task giving up its turn
+        :param waiting: task if it wants its turn back later, None if it finished
+        :return:
+        """
+        with self.__lock:
+            # Entries of tasks rescheduled since they were pushed are stale
+            while self.__due and self.__due[0][2] != self.__due[0][3].ticket:
+                heapq.heappop(self.__due)
+            entry = heapq.heappop(self.__due) if self.__due else None
+
+        if entry is None:
+            if waiting is None:
+                return
+            log.error("[SIM] Every simulated thread is waiting on an event, stopping")
+            self.stop()
+            raise SimulationStopped()
+
+        wake, _, _, following = entry
+        if wake > self.now:
+            VirtualClock.sleep(self, wake - self.now)
+            self.now = wake
+        if following is task:
+            return
+
+        following.resume.set()
+        if waiting is None:
+            return
+        task.resume.wait()
+        task.resume.clear()
+        if self.stopped:
+            raise SimulationStopped()
+
+
+class _Event:
+    """
+    threading.Event replacement for LockstepClock.
+    """
+
+    def __init__(self, clock):
+        self.__clock = clock
+        self.__flag = False
+        self.__waiters = []
+
+    def is_set(self):
+        return self.__flag
+
+    isSet = is_set
+
+    def set(self):
+        self.__flag = True
+        waiters, self.__waiters = self.__waiters, []
+        for task in waiters:
+            self.__clock._wake(task)
+
+    def clear(self):
+        self.__flag = False
+
+    def wait(self, timeout=None):
+        if self.__flag:
+            return True
+
+        task = self.__clock.current()
+        self.__waiters.append(task)
+        self.__clock._park(None if timeout is None else self.__clock.now + timeout)
+        if task in self.__waiters:
+            self.__waiters.remove(task)
+        return self.__flag
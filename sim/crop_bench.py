@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Compares how far away plants are detected with crops batched alongside the frame against the single full-frame pass.
+
+Plants are projected into the frame with CameraModel, then a detector model scores them in the frame and in every
+crop planned by crops.plan the way Vision does. SSD300's smallest default boxes are 30 input pixels, and the model
+assumes its confidence falls off below about half that: it is a logistic function of the plant's size in network
+input pixels, 0.5 at MIN_SIZE. The detections are collected with crops.collect, so the mapping from crops back into
+the frame and the merging are the code Vision runs. Each distance is scored on the second frame, once the first one
+had a chance to find candidates to crop around.
+
+Inference time grows with the batch, the MYRIAD runs the images of a batch one after another. Per-frame latency is
+reported as the VPU time assuming per_image_ms per image, plus the measured host time planning the crops and
+collecting the detections of a full 200 rows per image output. Measure per_image_ms on the robot as the mean of
+growbot_vision_inference_ms with VISION_CROPS=0.
+
+Usage: python -m sim.crop_bench [per_image_ms]
+"""
+import math
+import random
+import sys
+import time
+
+import crops
+from sim.camera import CameraModel
+
+WIDTH, HEIGHT = 640, 480
+INPUT_SIZE = 300
+MIN_SIZE = 15               # Input pixels at which the detector model is 50% confident
+SIZE_SCALE = 3              # Input pixels over which its confidence goes from 27% to 73%
+CONFIDENCE_INTERVAL = 0.5   # As given to Vision by RobotController
+CANDIDATE_INTERVAL = 0.2    # Vision's default
+ROWS_PER_IMAGE = 200        # Detections the SSD300 outputs per image
+PLANT = 16
+
+BEARINGS = (0, -15, 20)
+MODES = [
+    ("single pass", 0),
+    ("1 crop", 1),
+    ("2 crops", 2),
+    ("4 crops", 4),
+]
+
+
+def confidence(box, image):
+    """
+    :param box:     ((xmin, ymin), (xmax, ymax)) of the plant in the frame
+    :param image:   Crop the detector looks at
+    :return:        Confidence of the detector model, 0 if the plant isn't wholly in the image
+    """
+    ((xmin, ymin), (xmax, ymax)) = box
+    if xmin < image.xmin or ymin < image.ymin or xmax > image.xmax or ymax > image.ymax:
+        return 0.0
+    width = (xmax - xmin) * INPUT_SIZE / (image.xmax - image.xmin)
+    height = (ymax - ymin) * INPUT_SIZE / (image.ymax - image.ymin)
+    return 0.95 / (1 + math.exp(-(math.sqrt(width * height) - MIN_SIZE) / SIZE_SCALE))
+
+
+def detector_output(box, images, rng):
+    """
+    :param box:     Plant in the frame, None for an empty scene
+    :param images:  Frame followed by the crops of the batch
+    :return:        Output rows as the SSD300 produces them, padded with low confidence clutter
+    """
+    rows = []
+    for image_id, image in enumerate(images):
+        score = confidence(box, image) if box is not None else 0.0
+        if score > 0:
+            crop_w, crop_h = image.xmax - image.xmin, image.ymax - image.ymin
+            ((xmin, ymin), (xmax, ymax)) = box
+            rows.append([image_id, PLANT, score,
+                         (xmin - image.xmin) / crop_w, (ymin - image.ymin) / crop_h,
+                         (xmax - image.xmin) / crop_w, (ymax - image.ymin) / crop_h])
+        while len(rows) < (image_id + 1) * ROWS_PER_IMAGE:
+            x, y = rng.random() * 0.9, rng.random() * 0.9
+            rows.append([image_id, rng.choice((PLANT, 5)), rng.random() * 0.05, x, y, x + 0.1, y + 0.1])
+    rows.append([-1, 0, 0, 0, 0, 0, 0])
+    return rows
+
+
+def detect(camera, distance, bearing, crop_count, tiles, rng):
+    """
+    Runs two frames of a plant through the detector model the way Vision does.
+    :return:    Tuple (whether the plant was detected on the second frame, host seconds spent per frame)
+    """
+    box = camera.project(distance, bearing)
+    box = box[2] if box is not None else None
+    frame = crops.Crop(0, 0, WIDTH, HEIGHT)
+
+    regions = []
+    detected = False
+    host = 0.0
+    for _ in range(2):
+        started = time.perf_counter()
+        planned = crops.plan(WIDTH, HEIGHT, regions, crop_count, tiles)
+        host += time.perf_counter() - started
+
+        rows = detector_output(box, [frame] + planned, rng)
+
+        started = time.perf_counter()
+        if planned:
+            rows = crops.collect(rows, planned, WIDTH, HEIGHT, CANDIDATE_INTERVAL)
+        plants = [row for row in rows if int(row[1]) == PLANT and row[2] > CANDIDATE_INTERVAL]
+        regions = [((row[3] * WIDTH, row[4] * HEIGHT), (row[5] * WIDTH, row[6] * HEIGHT)) for row in plants]
+        detected = any(row[2] > CONFIDENCE_INTERVAL for row in plants)
+        host += time.perf_counter() - started
+
+    return detected, host / 2
+
+
+def detection_range(camera, bearing, crop_count, tiles, rng, step=0.1):
+    """
+    :return:    Tuple (largest distance in metres the plant is detected at, mean host seconds per frame)
+    """
+    farthest = 0.0
+    hosts = []
+    for i in range(1, int(15 / step)):
+        distance = i * step
+        detected, host = detect(camera, distance, math.radians(bearing), crop_count, tiles, rng)
+        hosts.append(host)
+        if detected:
+            farthest = distance
+    return farthest, sum(hosts) / len(hosts)
+
+
+def main():
+    per_image_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    camera = CameraModel(WIDTH, HEIGHT, max_range=float("inf"))
+    tiles = crops.tile_grid(WIDTH, HEIGHT)
+    rng = random.Random(0)
+
+    print("{:12} | {} | {:>9} {:>9} {:>10}".format(
+        "mode", " ".join("{:>8}".format("{}°".format(b)) for b in BEARINGS), "VPU", "host", "latency"))
+    for name, crop_count in MODES:
+        ranges = []
+        hosts = []
+        for bearing in BEARINGS:
+            farthest, host = detection_range(camera, bearing, crop_count, tiles, rng)
+            ranges.append(farthest)
+            hosts.append(host)
+        vpu = per_image_ms * (1 + crop_count)
+        host = sum(hosts) / len(hosts) * 1000
+        print("{:12} | {} | {:>7.0f}ms {:>7.2f}ms {:>8.1f}ms".format(
+            name, " ".join("{:>7.1f}m".format(r) for r in ranges), vpu, host, vpu + host))
+    print("Detection range per bearing. VPU time assumes {:.0f}ms per image, the host time is measured".format(
+        per_image_ms))
+
+
+if __name__ == "__main__":
+    main()
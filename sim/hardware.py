@@ -0,0 +1,108 @@
+import math
+
+from sim.camera import UltrasonicModel
+
+
+class SimMotor:
+    """
+    Tacho motor following the commands the firmware sends, with the same attributes it reads from ev3dev motors.
+    Speeds take effect instantly.
+    """
+    connected = True
+    count_per_rot = 360
+
+    def __init__(self, clock, name):
+        self.clock = clock
+        self.name = name
+        self._start_position = 0
+        self._start_time = clock.time()
+        self._speed = 0
+        self._duration = 0  # Seconds until the command ends, None for forever
+
+    def __elapsed(self):
+        elapsed = self.clock.time() - self._start_time
+        if self._duration is not None:
+            elapsed = min(elapsed, self._duration)
+        return elapsed
+
+    @property
+    def position(self):
+        return int(self._start_position + self._speed * self.__elapsed())
+
+    @property
+    def is_running(self):
+        return self._duration is None or self.clock.time() - self._start_time < self._duration
+
+    @property
+    def speed(self):
+        return self._speed if self.is_running else 0
+
+    @property
+    def state(self):
+        return ["running"] if self.is_running else []
+
+    def _command(self, speed_sp, duration):
+        self._start_position = self._start_position + self._speed * self.__elapsed()
+        self._start_time = self.clock.time()
+        self._speed = speed_sp
+        self._duration = duration
+
+    def run_forever(self, speed_sp=0):
+        self._command(speed_sp, None)
+
+    def run_timed(self, speed_sp=0, time_sp=0):
+        self._command(speed_sp, time_sp / 1000)
+
+    def run_to_rel_pos(self, position_sp=0, speed_sp=0, stop_action="hold"):
+        speed = abs(speed_sp) if position_sp >= 0 else -abs(speed_sp)
+        self._command(speed, abs(position_sp / speed_sp) if speed_sp else 0)
+
+    def stop(self, stop_action="brake"):
+        self._command(0, 0)
+
+
+class SimUltrasonicSensor:
+    connected = True
+
+    def __init__(self, world, model):
+        self.world = world
+        self.model = model
+
+    def value(self):
+        return self.model.read(self.world.robot, self.world.circles(), self.world.bounds)
+
+
+class SimEV3:
+    """
+    Stand-in for the ev3dev module used by firmware.GrowBot. Ports are wired like the robot: the wheels on outA and
+    outB, the arm on outC, the front and back ultrasonic sensors on in1 and in2.
+    """
+
+    def __init__(self, world, clock):
+        """
+        Constructor for SimEV3 class.
+        :param world:   World the sensors look at and the wheels drive
+        :param clock:   Clock the motors run on
+        """
+        self.world = world
+        self.motors = {port: SimMotor(clock, port) for port in ("outA", "outB", "outC", "outD")}
+        mount = world.robot_radius
+        self.sensors = {
+            "in1": SimUltrasonicSensor(world, UltrasonicModel(mount=mount)),
+            "in2": SimUltrasonicSensor(world, UltrasonicModel(offset=math.pi, mount=mount)),
+        }
+
+    def LargeMotor(self, port):
+        return self.motors[port]
+
+    MediumMotor = LargeMotor
+
+    def UltrasonicSensor(self, port):
+        return self.sensors[port]
+
+    def update(self):
+        """
+        Hands the current wheel speeds to the robot model. The firmware drives forwards with negative speeds.
+        :return:
+        """
+        self.world.robot.set_speeds(-self.motors["outA"].speed, -self.motors["outB"].speed)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""
+Compares running capture and inference in the RobotController's process against running them in an InferenceProcess,
+with the rest of the robot keeping the parent process busy.
+
+The vision side is Vision's own per-frame host code: prepare_input resizing the frame for the network, parse_output
+decoding a MobileNet-SSD output blob, drawing the predictions and the state, and JPEG and base64 encoding the frame
+for the live stream. The camera delivers 640x480 frames at 30 fps and the VPU is a wait of per_image_ms per frame,
+overlapped with the host work of the frame before as with Vision's two inference requests. The parent stands in for
+the rest of the robot: process_visual_data spends NAV_MS of pure Python on every frame like the Navigator, and
+BACKGROUND threads do pure Python work units, like the websocket loops, the scheduler and the serial reads.
+
+Reported per mode: frames handed to process_visual_data per second, the mean and 95th percentile age of a frame when
+handed over, the background work units done per second, and the cores used by each process and by the whole system.
+Frame ages compare time.monotonic() across processes, which is one clock system wide on Linux. Per-core use is read
+from /proc/stat.
+
+Usage: python -m sim.inference_bench [per_image_ms]
+    DURATION (seconds per mode, default 10), NAV_MS (default 4) and BACKGROUND (default 3) in the environment.
+"""
+import base64
+import functools
+import logging as log
+import os
+import struct
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from detectors import SSDAdapter, DecodePlan, label_map
+from inference_process import InferenceProcess
+from sim.postprocess_bench import make_blob
+from vision import Vision
+
+WIDTH, HEIGHT = 640, 480
+CAMERA_FPS = 30
+_STAMP = struct.Struct("<d")
+
+
+class _Camera:
+    def __init__(self):
+        self.width, self.height = WIDTH, HEIGHT
+        self.regions = []
+        self.tiles = []
+
+
+class BenchVision:
+    """
+    Vision's per-frame host work around a simulated camera and VPU.
+    """
+
+    def __init__(self, robot_controller, per_image_ms):
+        self.robot_controller = robot_controller
+        self.per_image_ms = per_image_ms
+        self.n, self.c, self.h, self.w = 1, 3, 300, 300
+        self.adapter = SSDAdapter()
+        self.plan = DecodePlan("data", (1, 3, 300, 300), ("detection_out",), label_map(21, 16), (16,), ())
+        self.confidence_interval = 0.5
+        self.candidate_interval = 0.2
+        self.draw_alignment_info = True
+        self.camera = _Camera()
+        self.running = True
+
+        rng = np.random.default_rng(0)
+        self.blob = make_blob(100, rng)
+        # Smooth enough for JPEG to compress it like a camera image
+        self.scene = cv2.GaussianBlur(rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8), (15, 15), 0)
+
+    def start(self):
+        next_capture = time.monotonic()
+        inferred = 0.0
+        previous = None
+        while self.running:
+            # The newest frame, waiting for the camera if the last one was taken already
+            now = time.monotonic()
+            if now < next_capture:
+                time.sleep(next_capture - now)
+            captured = time.monotonic()
+            next_capture = captured + 1 / CAMERA_FPS
+            frame = self.scene.copy()
+            # The capture time travels in the frame, process_visual_data takes nothing else
+            frame.reshape(-1)[:_STAMP.size] = np.frombuffer(_STAMP.pack(captured), dtype=np.uint8)
+
+            Vision.prepare_input(self, frame, self.camera)
+            started = time.monotonic()
+
+            if previous is not None:
+                # The previous frame's detections are parsed while this one infers
+                time.sleep(max(0.0, inferred - time.monotonic()))
+                self.hand_over(previous)
+            inferred = started + self.per_image_ms / 1000
+            previous = frame
+
+    def hand_over(self, frame):
+        predictions = Vision.parse_output(self, {"detection_out": self.blob}, [], self.camera)
+        Vision.log_predictions(predictions)
+        self.robot_controller.process_visual_data(predictions, frame, "front")
+        for label, prob, pred_boxpts in predictions:
+            Vision.visualise_prediction(self, frame, pred_boxpts, label, prob)
+        Vision.draw_info(self, frame)
+        base64.b64encode(cv2.imencode(".jpg", frame)[1])
+
+    def cleanup(self):
+        self.running = False
+
+
+class BenchController:
+    """
+    The rest of the robot, keeping the GIL of the parent process busy.
+    """
+
+    def __init__(self, nav_ms, background):
+        self.nav_ms = nav_ms
+        self.ages = []
+        self.units = 0
+        self.running = True
+        for i in range(background):
+            threading.Thread(target=self.__background, name="background-{}".format(i), daemon=True).start()
+
+    def __background(self):
+        while self.running:
+            sum(i * i for i in range(2000))
+            self.units += 1
+
+    def process_visual_data(self, predictions, frame, camera="front"):
+        captured = _STAMP.unpack(frame.reshape(-1)[:_STAMP.size].tobytes())[0]
+        self.ages.append((time.monotonic() - captured) * 1000)
+        end = time.perf_counter() + self.nav_ms / 1000
+        x = 0
+        while time.perf_counter() < end:
+            x += 1
+
+    def is_still(self):
+        return False
+
+    def detections_needed(self):
+        return True
+
+    def get_state(self):
+        return "Random Search Mode"
+
+
+def cpu_times():
+    """
+    :return:    List of (busy, total) jiffies of every core
+    """
+    times = []
+    with open("/proc/stat") as f:
+        for line in f:
+            if line.startswith("cpu") and line[3].isdigit():
+                values = [int(v) for v in line.split()[1:]]
+                idle = values[3] + values[4]
+                times.append((sum(values) - idle, sum(values)))
+    return times
+
+
+def process_cpu(pid):
+    """
+    :return:    CPU seconds the process used so far
+    """
+    with open("/proc/{}/stat".format(pid)) as f:
+        # Fields after the command, which may hold spaces
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def run(mode, per_image_ms, nav_ms, background, duration):
+    controller = BenchController(nav_ms, background)
+    if mode == "in process":
+        vision = BenchVision(controller, per_image_ms)
+        stop = vision.cleanup
+    else:
+        vision = InferenceProcess(functools.partial(BenchVision, per_image_ms=per_image_ms), controller)
+        stop = vision.stop
+    thread = threading.Thread(target=vision.start, name="vision")
+
+    # Measured once the vision loop runs
+    thread.start()
+    time.sleep(1)
+    del controller.ages[:]
+    units = controller.units
+    cores = cpu_times()
+    parent = time.process_time()
+    worker = process_cpu(vision.process.pid) if mode != "in process" else 0.0
+    started = time.monotonic()
+    time.sleep(duration)
+    elapsed = time.monotonic() - started
+    frames = len(controller.ages)
+    ages = sorted(controller.ages)
+    units = controller.units - units
+    parent = time.process_time() - parent
+    worker = process_cpu(vision.process.pid) - worker if mode != "in process" else 0.0
+    cores = [(b1 - b0) / max(1, t1 - t0) for (b0, t0), (b1, t1) in zip(cores, cpu_times())]
+
+    stop()
+    thread.join()
+    controller.running = False
+
+    return (frames / elapsed, sum(ages) / max(1, len(ages)), ages[int(len(ages) * 0.95)] if ages else 0,
+            units / elapsed, parent / elapsed, worker / elapsed, sum(cores), cores)
+
+
+def main():
+    per_image_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    duration = float(os.getenv("DURATION", 10))
+    nav_ms = float(os.getenv("NAV_MS", 4))
+    background = int(os.getenv("BACKGROUND", 3))
+    log.basicConfig(level=log.WARNING)
+
+    print("{:18} | {:>6} {:>8} {:>8} {:>10} | {:>7} {:>7} {:>7} | per core".format(
+        "mode", "fps", "age", "p95 age", "background", "parent", "worker", "system"))
+    for mode in ("in process", "inference process"):
+        fps, age, p95, units, parent, worker, system, cores = run(mode, per_image_ms, nav_ms, background, duration)
+        print("{:18} | {:>6.1f} {:>6.1f}ms {:>6.1f}ms {:>8.0f}/s | {:>7.2f} {:>7.2f} {:>7.2f} | {}".format(
+            mode, fps, age, p95, units, parent, worker, system, " ".join("{:.0%}".format(c) for c in cores[:8])))
+    print("Cores used by each process and the whole system, VPU {:.0f}ms per frame, {:.0f}ms of Navigator per frame, "
+          "{} background threads".format(per_image_ms, nav_ms, background))
+
+
+if __name__ == "__main__":
+    main()
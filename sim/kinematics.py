@@ -0,0 +1,70 @@
+import math
+
+
+class DifferentialDrive:
+    """
+    Kinematic model of the robot's two driven wheels.
+
+    Wheel speeds are given in tacho counts per second like the EV3 motors, positive meaning forwards. The pose is
+    (x, y) in metres and heading in radians, counter-clockwise from the x axis.
+    """
+
+    def __init__(self, x=0.0, y=0.0, heading=0.0, wheel_radius=0.028, track_width=0.15, counts_per_rot=360):
+        """
+        Constructor for DifferentialDrive class.
+        :param x:               Initial x position in metres
+        :param y:               Initial y position in metres
+        :param heading:         Initial heading in radians
+        :param wheel_radius:    Wheel radius in metres
+        :param track_width:     Distance between the wheels in metres
+        :param counts_per_rot:  Tacho counts per wheel revolution
+        """
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.wheel_radius = wheel_radius
+        self.track_width = track_width
+        self.counts_per_rot = counts_per_rot
+        self.left_speed = 0
+        self.right_speed = 0
+        self.left_position = 0.0
+        self.right_position = 0.0
+
+    def set_speeds(self, left, right):
+        self.left_speed = left
+        self.right_speed = right
+
+    def wheel_velocity(self, speed):
+        """
+        :param speed:   Wheel speed in tacho counts per second
+        :return:        Ground speed of the wheel in metres per second
+        """
+        return speed / self.counts_per_rot * 2 * math.pi * self.wheel_radius
+
+    def spin_speed(self, angular_velocity):
+        """
+        :param angular_velocity:    Turn rate in radians per second for a spin in place
+        :return:                    Wheel speed in tacho counts per second needed for it
+        """
+        return angular_velocity * self.track_width / 2 / (2 * math.pi * self.wheel_radius) * self.counts_per_rot
+
+    def turning_constant(self):
+        """
+        :return:    GrowBot.turning_constant of this robot, what calibrate_turning_constant would find by pivoting
+                    about the held left wheel
+        """
+        # Pivoting, the outer wheel travels turning_constant / 2 / pi counts per degree, twice its share of a spin
+        return 2 * self.spin_speed(math.radians(1)) * 2 * math.pi
+
+    def step(self, dt):
+        v_left = self.wheel_velocity(self.left_speed)
+        v_right = self.wheel_velocity(self.right_speed)
+
+        v = (v_left + v_right) / 2
+        w = (v_right - v_left) / self.track_width
+
+        self.x += v * math.cos(self.heading) * dt
+        self.y += v * math.sin(self.heading) * dt
+        self.heading = (self.heading + w * dt + math.pi) % (2 * math.pi) - math.pi
+        self.left_position += self.left_speed * dt
+        self.right_position += self.right_speed * dt
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Measures what logging costs Navigator per frame.
+
+The plant following scenarios of sim.steering_bench run once per logging set up, with every record written to
+/dev/null (or a temporary file for the JSON lines sink) so the terminal doesn't skew the numbers. The wall clock time
+spent in Navigator.on_new_frame is reported per frame, next to the same without any logging.
+
+Usage: python -m sim.log_bench [repeats]
+"""
+import logging as log
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import log_setup
+from Navigator import Navigator
+from sim.steering_bench import run_scenario
+
+SCENARIOS = [(d, math.radians(b)) for d in (1.0, 2.0, 3.0) for b in (-25, 0, 25)]
+
+
+def basic(level):
+    def set_up(devnull, _):
+        root = log.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        log.basicConfig(format=log_setup.DEFAULT_FORMAT, level=level, stream=devnull)
+    return set_up
+
+
+def background(level, sample=None, json=False):
+    def set_up(devnull, json_path):
+        log_setup.configure(level=level, stream=devnull, sample=sample, json_path=json_path if json else None)
+    return set_up
+
+
+# The scenarios run far faster than real time, so a per-second rate limit would drop nearly everything. Sampling one
+# in four records per call site is what LOG_RATE=2 amounts to at 8 fps
+SET_UPS = [
+    ("DEBUG, synchronous (main before)", basic(log.DEBUG)),
+    ("DEBUG, background", background(log.DEBUG)),
+    ("DEBUG, background, 1 in 4 per site", background(log.DEBUG, sample=4)),
+    ("INFO, 1 in 4 per site (default)", background(log.INFO, sample=4)),
+    ("INFO, 1 in 4 per site, JSON lines", background(log.INFO, sample=4, json=True)),
+    ("WARNING", background(log.WARNING)),
+    ("no logging", basic(log.CRITICAL + 1)),
+]
+
+
+def measure(repeats):
+    """
+    :return:    List of wall clock seconds spent in Navigator.on_new_frame, one per frame
+    """
+    durations = []
+    on_new_frame = Navigator.on_new_frame
+
+    def timed(self, predictions):
+        start = time.perf_counter()
+        on_new_frame(self, predictions)
+        durations.append(time.perf_counter() - start)
+
+    Navigator.on_new_frame = timed
+    try:
+        for _ in range(repeats):
+            for seed, (distance, bearing) in enumerate(SCENARIOS):
+                for mode in ("discrete", "continuous"):
+                    run_scenario(mode, distance, bearing, seed=seed)
+    finally:
+        Navigator.on_new_frame = on_new_frame
+    return durations
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    baseline = None
+
+    print("{:36} {:>8} {:>10} {:>10} {:>10}".format("logging", "frames", "mean", "p99", "saved"))
+    with open(os.devnull, "w") as devnull, tempfile.TemporaryDirectory() as tmp:
+        for name, set_up in SET_UPS:
+            set_up(devnull, os.path.join(tmp, "log.jsonl"))
+            durations = sorted(measure(repeats))
+            mean = statistics.mean(durations) * 1000
+            if baseline is None:
+                baseline = mean
+            print("{:36} {:>8} {:>8.3f}ms {:>8.3f}ms {:>8.3f}ms".format(
+                name, len(durations), mean, durations[int(len(durations) * 0.99) - 1] * 1000, baseline - mean))
+
+    root = log.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+
+if __name__ == "__main__":
+    main()
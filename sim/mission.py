@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""
+Runs the whole robot in a simulated world and reports how many missions it completes per hour.
+
+RobotController, Navigator and RemoteMotorController run as on the Pi, EV3_Client and GrowBot as on the EV3, linked
+in-process instead of over websockets. Motors, ultrasonic sensors, camera and QR reader are models of a World, FakeAPI
+plays the cloud. Everything shares one LockstepClock, so an hour of operation takes seconds and a seed always gives
+the same run.
+
+A mission is an ephemeral event asking for a plant to be watered and photographed. It is complete when the photo
+reaches the API, the next one is sent straight away.
+
+Usage: python -m sim.mission, configured through the environment:
+    HOURS       Simulated hours per run (default 1)
+    RUNS        Number of runs with consecutive seeds (default 3)
+    SEED        Seed of the first run (default 0)
+    PLANTS      Plants per world (default 4)
+    OBSTACLES   Obstacles per world (default 3)
+    TIMEOUT     Seconds after which a mission is abandoned (default 900)
+    VERBOSE     Log level of the robot code, e.g. INFO (default CRITICAL)
+    TRACE       Path to write a Chrome trace of the last run to, latency histograms are printed too (default off)
+    RECORD      Path to record the last run to for sim.replay (default off)
+"""
+import contextlib
+import importlib
+import io
+import json
+import logging as log
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+import Navigator as navigator_module
+import tracing as tracing_module
+import recording as recording_module
+import RemoteMotorController as motor_controller_module
+import RobotController as robot_controller_module
+from offload import OffloadPool
+from remote import RPCType
+from scheduler import Scheduler
+from sim.api import FakeAPI, SimRemote
+from sim.clock import LockstepClock
+from sim.hardware import SimEV3
+from sim.perception import SimQRReader, SimVision
+from sim.world import World
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ev3"))
+import firmware as firmware_module
+import motion as motion_module
+
+ev3_client_module = importlib.import_module("ev3-client")
+
+
+@contextlib.contextmanager
+def patched(module, **attributes):
+    """
+    Replaces module attributes for the duration of the block.
+    """
+    previous = {name: getattr(module, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(module, name, value)
+
+
+class IdleSerialIO:
+    """
+    The simulated world has no soil moisture probes.
+    """
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class Simulation:
+    """
+    One robot in one world for a fixed amount of virtual time.
+    """
+
+    def __init__(self, world, seed=0, fps=8, link_period=0.01, mission_timeout=900, record=None):
+        """
+        Constructor for Simulation class.
+        :param world:           World to run in
+        :param seed:            Seed of every random choice made in the run
+        :param fps:             Camera frame rate
+        :param link_period:     Seconds between two polls of the Pi to EV3 link
+        :param mission_timeout: Seconds after which a mission is abandoned
+        :param record:          File to record the run to, see recording.py, None for none
+        """
+        self.world = world
+        self.seed = seed
+        self.fps = fps
+        self.link_period = link_period
+        self.mission_timeout = mission_timeout
+        self.record = record
+        self.clock = LockstepClock(on_advance=self.__advance)
+        self.hardware = SimEV3(world, self.clock)
+        self.api = FakeAPI(self.clock)
+        self.missions = []          # (plant_id, started, finished or None)
+        self.commands = 0
+        self.robot_controller = None
+        self.ev3 = None
+
+    def __advance(self, dt):
+        self.hardware.update()
+        self.world.step(dt)
+
+    def run(self, duration):
+        """
+        :param duration:    Virtual seconds to run for
+        :return:            self, with missions and the world's counters filled in
+        """
+        clock = self.clock
+        threading = clock.threading_module()
+        rng = random.Random(self.seed)
+
+        with contextlib.ExitStack() as stack, tempfile.TemporaryDirectory() as data_dir:
+            stack.enter_context(patched(firmware_module, ev3=self.hardware, time=clock))
+            stack.enter_context(patched(motion_module, time=clock, threading=threading))
+            stack.enter_context(patched(ev3_client_module, time=clock.spinning(), threading=threading,
+                                        random=random.Random(rng.random())))
+            stack.enter_context(patched(navigator_module, time=clock, threading=threading))
+            stack.enter_context(patched(motor_controller_module, time=clock))
+            # Jobs run on the simulated thread submitting them, the pool's own threads would run outside the clock
+            stack.enter_context(patched(robot_controller_module, threading=threading, offload=OffloadPool(workers=0)))
+            stack.enter_context(patched(tracing_module, time=clock))
+            stack.enter_context(patched(recording_module, time=clock))
+
+            if self.record is not None:
+                recording_module.recorder.open(self.record)
+                stack.callback(recording_module.recorder.close)
+            clock.run(self.__main, duration, rng, data_dir)
+
+        return self
+
+    def __main(self, duration, rng, data_dir):
+        clock = self.clock
+        self.ev3 = ev3_client_module.EV3_Client()
+        # The simulated robot's wheels aren't the real one's, its firmware is calibrated for them
+        self.ev3.firmware.turning_constant = self.world.robot.turning_constant()
+
+        vision = SimVision(self.world, clock, fps=self.fps, rng=random.Random(rng.random()))
+        self.robot_controller = robot_controller_module.RobotController(
+            vision=vision,
+            qr_reader=SimQRReader(self.world),
+            serial_io=IdleSerialIO(),
+            remote=SimRemote(self.api, clock),
+            scheduler=Scheduler(os.path.join(data_dir, "rules.pickle.bin")),
+            connect_ev3=False)
+        vision.robot_controller = self.robot_controller
+
+        motor_controller = self.robot_controller.navigator.remote_motor_controller
+        clock.thread(self.__pi_to_ev3, (motor_controller,), name="ws_sender")
+        clock.thread(self.__ev3_to_pi, (motor_controller,), name="ws_receiver")
+
+        photographed = clock.Event()
+        current = []
+
+        def on_photo(plant_id):
+            if plant_id in current:
+                photographed.set()
+
+        self.api.on_photo = on_photo
+
+        while clock.time() < duration:
+            plant_id = rng.choice(self.world.plants).plant_id
+            current[:] = [plant_id]
+            started = clock.time()
+            photographed.clear()
+            log.info("[SIM] Mission {} for plant {}".format(len(self.missions), plant_id))
+            self.api.rpc(RPCType.EVENTS, [{
+                "id": len(self.missions),
+                "recurrences": [],
+                "ephemeral": True,
+                "actions": [
+                    {"plant_id": plant_id, "name": "PLANT_WATER"},
+                    {"plant_id": plant_id, "name": "PLANT_CAPTURE_PHOTO"},
+                ],
+            }])
+
+            done = photographed.wait(min(self.mission_timeout, duration - started))
+            if not done and clock.time() >= duration:
+                # Cut short by the end of the run rather than failed
+                break
+            self.missions.append((plant_id, started, clock.time() if done else None))
+            if not done:
+                # Start over with a clean slate, like an operator cancelling the task
+                self.robot_controller.cancel_actions(plant_id)
+
+    def __pi_to_ev3(self, motor_controller):
+        # Each command is processed on a thread of its own, like EV3_Client.setup_receiver does
+        while True:
+            message = motor_controller.take_message()
+            if message is not None:
+                self.commands += 1
+                self.clock.thread(self.ev3.message_process, (message,), name="message_process")
+            self.clock.sleep(self.link_period)
+
+    def __ev3_to_pi(self, motor_controller):
+        # Same loop as EV3_Client.setup_sender, delivering straight to the Pi
+        while True:
+            for package in self.ev3.pending_messages():
+                motor_controller.process_message(json.dumps(package))
+            self.ev3.send_now.wait(0.5)
+            self.ev3.send_now.clear()
+
+    def completed(self):
+        return [finished - started for _, started, finished in self.missions if finished is not None]
+
+
+def main():
+    hours = float(os.getenv("HOURS", "1"))
+    runs = int(os.getenv("RUNS", "3"))
+    seed = int(os.getenv("SEED", "0"))
+    plants = int(os.getenv("PLANTS", "4"))
+    obstacles = int(os.getenv("OBSTACLES", "3"))
+    timeout = float(os.getenv("TIMEOUT", "900"))
+    trace = os.getenv("TRACE")
+    record = os.getenv("RECORD")
+    log.basicConfig(format="[ %(levelname)s ] %(message)s", level=os.getenv("VERBOSE", "CRITICAL"), stream=sys.stdout)
+    # Every run starts without a schedule on disk on purpose
+    warnings.filterwarnings("ignore", message="No events on disk")
+
+    print("{:>5} | {:>8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>8} | {:>8}".format(
+        "seed", "missions", "failed", "per hour", "mean time", "distance", "contact", "commands", "speedup"))
+    rates = []
+    for run_seed in range(seed, seed + runs):
+        if trace:
+            # Pi and EV3 share the process here, so one tracer sees the whole pipeline
+            tracing_module.tracer.enable("sim")
+            tracing_module.tracer.clear()
+        world = World.generate(random.Random(run_seed), plants=plants, obstacles=obstacles)
+        start = time.perf_counter()
+        # The EV3 code prints as it goes, keep that out of the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim = Simulation(world, seed=run_seed, mission_timeout=timeout,
+                             record=record if run_seed == seed + runs - 1 else None).run(hours * 3600)
+        elapsed = time.perf_counter() - start
+
+        completed = sim.completed()
+        rates.append(len(completed) / hours)
+        print("{:>5} | {:>8} {:>8} {:>10.1f} {:>10} {:>9.0f}m {:>9.0f}s {:>8} | {:>7.0f}x".format(
+            run_seed, len(completed), len(sim.missions) - len(completed), len(completed) / hours,
+            "{:.0f}s".format(statistics.mean(completed)) if completed else "-",
+            world.distance, world.contact_time, sim.commands, hours * 3600 / elapsed))
+
+    print("Missions per hour: mean {:.1f}, min {:.1f}, max {:.1f}".format(
+        statistics.mean(rates), min(rates), max(rates)))
+
+    if trace:
+        tracing_module.tracer.dump(trace)
+        print(tracing_module.format_histograms(tracing_module.tracer.histograms()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+"""
+Replays a scripted scene through Navigator at several frame rates and checks that it navigates the same way.
+
+A scene is a list of segments, each showing one plant or none for a while. The plant is described by its horizontal
+offset from the image centre in pixels and its distance in metres. The robot reacts to Navigator's commands: a turn
+centres the plant once the EV3 would report it complete, driving forward brings the plant closer, and the ultrasonic
+sensor reports the distance ten times a second whatever the frame rate.
+
+Navigator's transition log is recorded for every frame rate. The run passes if every rate goes through the same
+states, and every state left on its timeout lasted that long give or take a sensor period. Other transitions follow
+the scene and are shown for comparison. The exit status is 1 otherwise, so it can guard changes to the vision
+pipeline or the navigator.
+
+Usage: python -m sim.nav_replay [scene.json]
+    scene.json is a JSON list of segments like {"duration": 5, "plant": {"offset": 150, "distance": 1.5},
+    "turn_time": 0.5}. A null plant means none in view, a null turn_time that turns never complete.
+"""
+import json
+import logging as log
+import sys
+
+import Navigator as navigator_module
+from Navigator import Navigator
+from sim.clock import VirtualClock
+from state_machine import TIMEOUT
+
+FRAME_RATES = (4, 8, 15, 30)
+SENSOR_PERIOD = 0.1
+FORWARD_SPEED = 0.2     # Metres per second
+
+SCENE = [
+    {"duration": 3, "plant": None},
+    {"duration": 9, "plant": {"offset": 150, "distance": 1.5}, "turn_time": 0.5},
+    {"duration": 18, "plant": None},
+    {"duration": 4, "plant": {"offset": -200, "distance": 1.0}, "turn_time": None},
+    {"duration": 6, "plant": None},
+]
+
+
+class ReplayRobotController:
+    """
+    The parts of RobotController Navigator calls, none of which matter to navigation.
+    """
+    approach_complete = True
+    retrying_approach = False
+
+    def read_qr_code(self):
+        pass
+
+    def on_plant_seen(self):
+        pass
+
+    def on_plant_found(self):
+        pass
+
+
+class ReplayMotorController:
+    """
+    Plays the EV3 and the scene. Commands return immediately.
+    """
+
+    def __init__(self, clock, scene):
+        self.clock = clock
+        self.scene = scene
+        self.navigator = None
+        self.front_sensor_value = None
+        self.back_sensor_value = None
+        self.commands = []
+        self.plant = None           # Dictionary with offset and distance of the plant in view, None if there is none
+        self.turn_time = 0.5
+        self.turn_done = None       # Time the current turn completes at
+        self.driving = False
+        self.__segment = -1
+        self.__segment_end = 0.0
+        self.__last = 0.0
+
+    def advance(self):
+        """
+        Moves the scene on to the current time.
+        :return:    False once the scene is over
+        """
+        now = self.clock.time()
+        if self.driving and self.plant is not None:
+            self.plant["distance"] = max(0.1, self.plant["distance"] - FORWARD_SPEED * (now - self.__last))
+        self.__last = now
+
+        while now >= self.__segment_end:
+            self.__segment += 1
+            if self.__segment >= len(self.scene):
+                return False
+            segment = self.scene[self.__segment]
+            self.__segment_end += segment["duration"]
+            self.plant = dict(segment["plant"]) if segment.get("plant") else None
+            self.turn_time = segment.get("turn_time", 0.5)
+            self.turn_done = None
+
+        if self.turn_done is not None and now >= self.turn_done:
+            self.turn_done = None
+            if self.plant is not None:
+                self.plant["offset"] = 0
+            self.navigator.on_turn_complete("done")
+        return True
+
+    def read_sensors(self):
+        distance = self.plant["distance"] * 1000 if self.plant is not None else 2550
+        self.front_sensor_value = [distance] * 4
+        self.back_sensor_value = [2550] * 4
+
+    def predictions(self):
+        if self.plant is None:
+            return []
+        size = 200 / self.plant["distance"]
+        x = 320 + self.plant["offset"]
+        return [("Plant", 0.9, ((x - size / 2, 240 - size / 2), (x + size / 2, 240 + size / 2)))]
+
+    def __command(self, name, driving=False):
+        self.commands.append((self.clock.time(), name))
+        self.driving = driving
+
+    def __turn(self, name):
+        self.__command(name)
+        if self.turn_time is not None:
+            self.turn_done = self.clock.time() + self.turn_time
+
+    def turn_left(self, deg):
+        self.__turn("left")
+
+    def turn_right(self, deg):
+        self.__turn("right")
+
+    def go_forward(self, forward_time=-1):
+        self.__command("forward", driving=True)
+
+    def set_speed(self, left, right):
+        self.__command("set_speed", driving=left > 0 and right > 0)
+
+    def stop(self):
+        self.__command("stop")
+
+    def random_walk(self):
+        self.__command("random")
+
+    def retry_approach(self):
+        self.__command("retry_approach")
+
+
+def replay(scene, fps):
+    """
+    :param scene:   List of segments
+    :param fps:     Frame rate
+    :return:        Tuple of Navigator's transition log, a list of TransitionRecord, and its state timeouts
+    """
+    clock = VirtualClock()
+    motors = ReplayMotorController(clock, [dict(segment) for segment in scene])
+
+    real_time = navigator_module.time
+    navigator_module.time = clock
+    try:
+        navigator = Navigator(ReplayRobotController(), remote_motor_controller=motors)
+        motors.navigator = navigator
+
+        next_frame = 0.0
+        next_sensor = 0.0
+        while motors.advance():
+            now = clock.time()
+            if now >= next_sensor - 1e-9:
+                next_sensor += SENSOR_PERIOD
+                motors.read_sensors()
+                navigator.on_sensor_data()
+            if now >= next_frame - 1e-9:
+                next_frame += 1 / fps
+                navigator.on_new_frame(motors.predictions())
+            clock.sleep(max(0.0, min(next_frame, next_sensor, motors.turn_done or next_frame) - clock.time()))
+    finally:
+        navigator_module.time = real_time
+
+    return navigator.transition_log(), navigator.machine.timeouts
+
+
+def compare(logs, timeouts):
+    """
+    :param logs:        Dictionary of frame rate to transition log
+    :param timeouts:    Dictionary of state to timeout in seconds
+    :return:            List of problems, empty if every rate navigated the same way
+    """
+    problems = []
+    reference_fps = min(logs)
+    reference = [(r.source, r.target) for r in logs[reference_fps]]
+
+    for fps, records in sorted(logs.items()):
+        if [(r.source, r.target) for r in records] != reference:
+            problems.append("{} fps goes through different states than {} fps".format(fps, reference_fps))
+            continue
+        entered = 0.0
+        for record in records:
+            spent, entered = record.time - entered, record.time
+            if record.event == TIMEOUT and not -1e-6 <= spent - timeouts[record.source] <= SENSOR_PERIOD + 1e-6:
+                problems.append("{} fps spends {:.2f}s in {}, its timeout is {}s".format(
+                    fps, spent, record.source, timeouts[record.source]))
+    return problems
+
+
+def main():
+    log.basicConfig(level=log.WARNING)
+
+    scene = SCENE
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            scene = json.load(f)
+
+    logs = {}
+    for fps in FRAME_RATES:
+        logs[fps], timeouts = replay(scene, fps)
+
+    print("{:>18} | {}".format("transition", " ".join("{:>7}".format("{} fps".format(fps)) for fps in FRAME_RATES)))
+    for i in range(max(len(records) for records in logs.values())):
+        names = {"{} > {}".format(r[i].source, r[i].target) for r in logs.values() if i < len(r)}
+        times = ["{:>6.2f}s".format(r[i].time) if i < len(r) else "{:>7}".format("-") for r in logs.values()]
+        print("{:>18} | {}".format(" / ".join(sorted(names)), " ".join(times)))
+
+    problems = compare(logs, timeouts)
+    for problem in problems:
+        print(problem)
+    print("FAIL" if problems else "OK, navigation does not depend on the frame rate")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import logging as log
+
+import numpy as np
+
+from sim.camera import CameraModel
+from tracing import tracer
+
+
+class SimVision:
+    """
+    Stand-in for Vision. Every frame it detects what the robot faces in the world with CameraModel and hands the
+    predictions to the RobotController like the VPU pipeline, including its inference delay and missed detections.
+    """
+
+    def __init__(self, world, clock, camera=None, fps=8, inference_time=0.08, miss_rate=0.05, rng=None):
+        """
+        Constructor for SimVision class.
+        :param world:           World to look at
+        :param clock:           Clock of the simulation
+        :param camera:          CameraModel, a default one if None
+        :param fps:             Camera frame rate
+        :param inference_time:  Seconds from capturing a frame to its predictions being ready
+        :param miss_rate:       Probability of an object in view not being detected in a frame
+        :param rng:             random.Random for the misses and the box jitter, neither happens if None
+        """
+        self.world = world
+        self.clock = clock
+        self.camera = camera if camera is not None else CameraModel(rng=rng)
+        self.fps = fps
+        self.inference_time = inference_time
+        self.miss_rate = miss_rate
+        self.rng = rng
+        self.robot_controller = None
+        self.frames = 0
+        # Photos are taken of whatever frame was seen last, a blank one serves well enough
+        self.frame = np.zeros((self.camera.height, self.camera.width, 3), np.uint8)
+
+    def detect(self):
+        """
+        :return:    Predictions for the current pose, (label, confidence, ((xmin, ymin), (xmax, ymax))) each
+        """
+        predictions = []
+        for thing, distance, bearing in self.world.visible(self.camera.max_range, self.camera.half_fov):
+            if self.rng is not None and self.rng.random() < self.miss_rate:
+                continue
+            label = "Plant" if hasattr(thing, "plant_id") else "Obstacle"
+            prediction = self.camera.project(distance, bearing, label)
+            if prediction is not None:
+                predictions.append(prediction)
+        return predictions
+
+    def start(self):
+        log.info("[SIM] Camera running at {} fps".format(self.fps))
+        period = 1 / self.fps
+        while True:
+            started = self.clock.time()
+            trace_id = tracer.new_id()
+            predictions = self.detect()
+            self.clock.sleep(self.inference_time)
+            tracer.record("inference", started, self.clock.time(), trace_id)
+
+            if self.robot_controller is not None:
+                with tracer.context(trace_id):
+                    self.robot_controller.process_visual_data(predictions, self.frame)
+            self.frames += 1
+
+            # Like the real pipeline, frames arriving while the controller was busy are dropped
+            self.clock.sleep(max(0, period - (self.clock.time() - started)))
+
+
+class SimQRReader:
+    """
+    Stand-in for QRReader reading the QR code of the nearest plant close enough in front of the robot.
+    """
+
+    def __init__(self, world, max_range=0.8, half_fov=0.3):
+        """
+        Constructor for SimQRReader class.
+        :param world:       World to look at
+        :param max_range:   Distance in metres up to which a code can be decoded
+        :param half_fov:    Bearing in radians up to which a code is straight enough in view to be decoded
+        """
+        self.world = world
+        self.max_range = max_range
+        self.half_fov = half_fov
+
+    def identify(self, frame):
+        for thing, _, _ in self.world.visible(self.max_range, self.half_fov):
+            if hasattr(thing, "plant_id"):
+                return {"gbpl:{}".format(thing.plant_id)}
+        return set()
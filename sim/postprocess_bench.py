@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Measures the per-frame post-processing of the SSD output blob, from the blob to the predictions handed to
+RobotController, the way Vision did it row by row before and the way it does it on the whole array now.
+
+The blob is made up like a MobileNet-SSD DetectionOutput: rows valid detections, two plants and an obstacle above the
+confidence interval, a NaN, the rest low confidence clutter, then the -1 terminator and padding. Before, drawing and
+logging were part of parsing every frame. Now drawing is a separate pass only run on frames shown, streamed or saved,
+so the new way is timed both with and without it.
+
+Usage: python -m sim.postprocess_bench [rows]
+"""
+import logging as log
+import math
+import sys
+import time
+
+import numpy as np
+
+from detectors import SSDAdapter, DecodePlan, label_map, to_predictions
+from vision import Vision
+
+WIDTH, HEIGHT = 640, 480
+CONFIDENCE_INTERVAL = 0.5
+KEEP_TOP_K = 200
+FRAMES = 5000
+
+
+def make_blob(rows, rng):
+    """
+    :param rows:    Valid detections in the blob
+    :return:        1 x 1 x KEEP_TOP_K x 7 output blob
+    """
+    blob = np.zeros((1, 1, KEEP_TOP_K, 7), dtype=np.float32)
+    xy = rng.uniform(0, 0.8, (rows, 2))
+    blob[0, 0, :rows, 1] = rng.integers(1, 21, rows)
+    blob[0, 0, :rows, 2] = rng.uniform(0.01, 0.3, rows)
+    blob[0, 0, :rows, 3:5] = xy
+    blob[0, 0, :rows, 5:7] = xy + rng.uniform(0.05, 0.2, (rows, 2))
+    blob[0, 0, :3, 1:3] = [[16, 0.9], [16, 0.7], [5, 0.8]]
+    blob[0, 0, 3, 2] = np.nan
+    blob[0, 0, rows:, 0] = -1
+    return blob
+
+
+class Before:
+    """
+    Vision's post-processing before it worked on the whole array, row by row with drawing and logging.
+    """
+
+    def __init__(self):
+        self.initial_w, self.initial_h = WIDTH, HEIGHT
+        self.confidence_interval = CONFIDENCE_INTERVAL
+        self.draw_alignment_info = True
+
+    def parse(self, frame, res):
+        return [self.process_prediction(frame, pred) for pred in res[0][0] if self.check_threshold(pred[2])]
+
+    def process_prediction(self, frame, prediction):
+        pred_boxpts = ((int(prediction[3] * self.initial_w),
+                        int(prediction[4] * self.initial_h)),
+                       (int(prediction[5] * self.initial_w),
+                        int(prediction[6] * self.initial_h)))
+        label = 'Plant' if int(prediction[1]) == 16 else 'Obstacle'
+        if label == 'Plant':
+            log.info("Prediction: {0}, confidence={1:.10f}, boxpoints={2}".format(label, round(prediction[2], 4),
+                                                                                 pred_boxpts))
+        Vision.visualise_prediction(self, frame, pred_boxpts, label, prediction[2])
+        return label, prediction[2], pred_boxpts
+
+    def check_threshold(self, probability):
+        return (not math.isnan(probability)) and 1 >= probability > self.confidence_interval
+
+
+class After:
+    """
+    Vision's post-processing now, decoding the blob as an array, with drawing as a separate pass.
+    """
+
+    def __init__(self, draw):
+        self.adapter = SSDAdapter()
+        self.plan = DecodePlan("data", (1, 3, 300, 300), ("detection_out",), label_map(21, 16), (16,), ())
+        self.draw_alignment_info = True
+        self.draw = draw
+
+    def parse(self, frame, res):
+        rows = self.adapter.decode(self.plan, {"detection_out": res}, CONFIDENCE_INTERVAL)
+        predictions = to_predictions(self.plan, rows[rows[:, 0] == 0], WIDTH, HEIGHT)
+        Vision.log_predictions(predictions)
+        if self.draw:
+            for label, prob, pred_boxpts in predictions:
+                Vision.visualise_prediction(self, frame, pred_boxpts, label, prob)
+        return predictions
+
+
+def measure(parser, blob):
+    """
+    :return:    Mean milliseconds per frame
+    """
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    started = time.perf_counter()
+    for _ in range(FRAMES):
+        parser.parse(frame, blob)
+    return (time.perf_counter() - started) / FRAMES * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    # Records are made and dropped, as the queue handler of log_setup passes them on without formatting
+    log.basicConfig(level=log.INFO, handlers=[log.NullHandler()])
+    blob = make_blob(rows, np.random.default_rng(0))
+
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    before = Before().parse(frame, blob)
+    after = After(draw=False).parse(frame, blob)
+    assert [(l, round(float(p), 4), b) for l, p, b in before] == [(l, round(p, 4), b) for l, p, b in after]
+
+    print("{} valid rows of {}, {} predictions".format(rows, KEEP_TOP_K, len(after)))
+    print("{:18} {:>8.3f}ms".format("before", measure(Before(), blob)))
+    print("{:18} {:>8.3f}ms".format("after, drawn", measure(After(draw=True), blob)))
+    print("{:18} {:>8.3f}ms".format("after, not drawn", measure(After(draw=False), blob)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""
+Replays a recording through RobotController and compares the commands it sends with the recorded ones.
+
+The recorded detections go to RobotController.process_visual_data and the recorded EV3 messages to
+RemoteMotorController.process_message at the times they were recorded, together with the last recorded frame and QR
+codes, and the recorded API calls are made again. Recordings without any run out of standby as if an operator had
+started the robot. Whatever the Pi code sends in response is recorded again and compared with the original, so a
+change to Navigator or to the perception pipeline can be checked against real runs. The replay is open loop: the
+EV3's messages are those of the original run whatever the commands.
+
+The records are fed on the threads they were recorded on by the robot: detections and frames on the vision thread,
+EV3 messages on the websocket receiver's thread and API calls on a thread of their own each. At speed 0 the replay runs on a LockstepClock like the simulation: every thread sleeps on its own and time
+only moves once none is due, so a run replays as fast as the Pi code can handle it, and the same way every time. Any
+other speed scales the wall clock, 1 being real time.
+
+Usage: python -m sim.replay run.rec [speed] [replayed.rec]
+    Replays run.rec at the given speed (default 0), recording to replayed.rec (default a temporary file), and prints
+    the commands that differ. Exits with status 1 if there are any.
+"""
+import contextlib
+import logging as log
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import Navigator as navigator_module
+import RemoteMotorController as motor_controller_module
+import RobotController as robot_controller_module
+import recording as recording_module
+import tracing as tracing_module
+from offload import OffloadPool
+from recording import Recording, CALL, CAMERA_DETECTIONS, DETECTIONS, FRAME, MESSAGE, QR, diff_commands
+from scheduler import Scheduler
+from sim.clock import LockstepClock
+from sim.mission import IdleSerialIO, patched
+
+
+class ReplayClock:
+    """
+    Stand-in for the time module following the recording's timeline at a multiple of the wall clock. Threads and
+    events are real, see LockstepClock for the same interface at speed 0.
+    """
+
+    def __init__(self, start, speed=1):
+        """
+        Constructor for ReplayClock class.
+        :param start:   Recording time to start at
+        :param speed:   Recording seconds per wall clock second
+        """
+        self.speed = speed
+        self.__start = start
+        self.__wall = time.monotonic()
+
+    def time(self):
+        return self.__start + (time.monotonic() - self.__wall) * self.speed
+
+    monotonic = time
+    perf_counter = time
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def thread(self, target, args=(), name=None):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def run(self, target, *args):
+        return target(*args)
+
+    Event = threading.Event
+
+    def threading_module(self):
+        return threading
+
+
+class ReplayRemote:
+    """
+    The API is not needed to replay a run, anything sent to it is dropped.
+    """
+
+    def add_callback(self, *args, **kwargs):
+        pass
+
+    def create_log_entry(self, *args, **kwargs):
+        pass
+
+    def plant_capture_photo(self, plant_id, image):
+        log.info("[REPLAY] Photo of plant {} taken".format(plant_id))
+
+
+class ReplayQRReader:
+    """
+    Reads the QR codes recorded last before the current time.
+    """
+
+    def __init__(self, recording, clock):
+        self.clock = clock
+        self.__reads = [(record.time, set(record.value)) for record in recording.records(kinds=(QR,))]
+
+    def identify(self, frame):
+        now = self.clock.time()
+        codes = set()
+        for read, read_codes in self.__reads:
+            if read > now:
+                break
+            codes = read_codes
+        return codes
+
+
+class ReplayVision:
+    """
+    Stand-in for Vision feeding the recorded records to the robot in time order.
+    """
+
+    def __init__(self, recording, clock, width=640, height=480):
+        self.recording = recording
+        self.clock = clock
+        self.robot_controller = None
+        self.go = clock.Event()             # Set once robot_controller is assigned, which is after start() runs
+        self.done = clock.Event()
+        # Photos are taken of whatever frame was seen last, a blank one serves if none were recorded
+        self.frame = np.zeros((height, width, 3), np.uint8)
+
+    def start(self):
+        self.go.wait()
+        try:
+            # The EV3's messages arrived on the websocket receiver's thread and the API's calls on threads of their
+            # own, whatever they sleep in must not hold up the detections
+            fed = [self.clock.Event(), self.clock.Event()]
+            self.clock.thread(self.__feed, ((MESSAGE,), self.__message, fed[0]), name="ws_receiver")
+            self.clock.thread(self.__feed, ((CALL,), self.__call, fed[1]), name="remote")
+            self.__feed((DETECTIONS, CAMERA_DETECTIONS, FRAME), self.__detections)
+            for event in fed:
+                event.wait()
+        finally:
+            self.done.set()
+
+    def __feed(self, kinds, handle, fed=None):
+        """
+        Hands records to handle at the time they were recorded, or as soon as handle returns if it took longer.
+        :param kinds:   Kinds of the records
+        :param handle:  Function taking a record
+        :param fed:     Event to set once every record was handled
+        :return:
+        """
+        try:
+            for record in self.recording.records(kinds=kinds):
+                self.clock.sleep(record.time - self.clock.time())
+                handle(record)
+        finally:
+            if fed is not None:
+                fed.set()
+
+    def __detections(self, record):
+        if record.kind == FRAME:
+            import cv2
+            self.frame = cv2.imdecode(np.frombuffer(record.value, np.uint8), cv2.IMREAD_COLOR)
+        elif record.kind == DETECTIONS:
+            self.robot_controller.process_visual_data(record.value, self.frame)
+        else:
+            camera, predictions = record.value
+            self.robot_controller.process_visual_data(predictions, self.frame, camera)
+
+    def __message(self, record):
+        self.robot_controller.navigator.remote_motor_controller.process_message(record.value)
+
+    def __call(self, record):
+        name, args = record.value
+        self.clock.thread(getattr(self.robot_controller, name), args, name="rpc")
+
+
+def replay(path, out_path, speed=0):
+    """
+    :param path:        Recording to replay
+    :param out_path:    File to record the replay to
+    :param speed:       Recording seconds per wall clock second, 0 to run on a LockstepClock instead
+    :return:
+    """
+    with Recording(path) as recording, contextlib.ExitStack() as stack, tempfile.TemporaryDirectory() as data_dir:
+        clock = ReplayClock(recording.start, speed) if speed else LockstepClock(start=recording.start)
+        threading_module = clock.threading_module()
+        stack.enter_context(patched(navigator_module, time=clock, threading=threading_module))
+        stack.enter_context(patched(motor_controller_module, time=clock))
+        stack.enter_context(patched(recording_module, time=clock))
+        stack.enter_context(patched(tracing_module, time=clock))
+        # Photos are encoded and sent in the order they were recorded
+        stack.enter_context(patched(robot_controller_module, threading=threading_module,
+                                    offload=OffloadPool(workers=0)))
+
+        def run():
+            vision = ReplayVision(recording, clock)
+            robot_controller = robot_controller_module.RobotController(
+                vision=vision,
+                qr_reader=ReplayQRReader(recording, clock),
+                serial_io=IdleSerialIO(),
+                remote=ReplayRemote(),
+                scheduler=Scheduler(os.path.join(data_dir, "rules.pickle.bin")),
+                connect_ev3=False)
+            vision.robot_controller = robot_controller
+            if not any(True for _ in recording.records(kinds=(CALL,))):
+                robot_controller.set_standby(False)
+            vision.go.set()
+            vision.done.wait()
+
+        recorder = recording_module.recorder
+        recorder.open(out_path)
+        try:
+            clock.run(run)
+        finally:
+            recorder.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.split("Usage:")[1])
+        sys.exit(2)
+    log.basicConfig(format="[ %(levelname)s ] %(message)s", level=os.getenv("VERBOSE", "CRITICAL"), stream=sys.stdout)
+
+    path = sys.argv[1]
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = sys.argv[3] if len(sys.argv) > 3 else os.path.join(tmp, "replayed.rec")
+        started = time.perf_counter()
+        replay(path, out_path, speed)
+        elapsed = time.perf_counter() - started
+
+        with Recording(path) as original, Recording(out_path) as replayed:
+            print("Replayed {:.1f}s in {:.1f}s".format(original.duration(), elapsed))
+            lines = diff_commands(original, replayed)
+    print("\n".join(lines) if lines else "Same commands")
+    sys.exit(1 if lines else 0)
+
+
+if __name__ == "__main__":
+    main()
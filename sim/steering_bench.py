@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""
+Compares the discrete (turn, then drive) and continuous (streamed wheel speeds) plant following modes of Navigator.
+
+Each scenario places a plant in front of the robot, either from the built-in grid or from a detection trace, a JSON
+lines file of plant bounding boxes ((xmin, ymin), (xmax, ymax)) as produced by Vision. The real Navigator then drives
+a kinematic robot model in virtual time until it reports the plant as found. Time-to-approach and the rate of motor
+commands sent are reported per mode.
+
+Usage: python -m sim.steering_bench [trace.jsonl]
+"""
+import json
+import logging as log
+import math
+import random
+import statistics
+import sys
+
+import Navigator as navigator_module
+from Navigator import Navigator
+from sim.camera import CameraModel, UltrasonicModel, bearing_to
+from sim.clock import VirtualClock
+from sim.kinematics import DifferentialDrive
+
+DISTANCES = (1.0, 2.0, 3.0)
+BEARINGS = (-25, -10, 0, 10, 25)
+PLANT_RADIUS = 0.075
+
+
+class BenchRobotController:
+    """
+    The parts of RobotController Navigator calls while following a plant.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.approach_complete = True
+        self.retrying_approach = False
+        self.found_at = None
+
+    def read_qr_code(self):
+        pass
+
+    def on_plant_seen(self):
+        pass
+
+    def on_plant_found(self):
+        self.found_at = self.clock.time()
+
+
+class BenchMotorController:
+    """
+    Executes RemoteMotorController commands on the kinematic model the way the EV3 would. Discrete commands block
+    the caller for command_delay seconds like RemoteMotorController does.
+    """
+
+    def __init__(self, robot, robot_controller, clock, command_delay=1.0, turn_speed=75, forward_speed=100,
+                 sensor_period=0.5):
+        self.robot = robot
+        self.robot_controller = robot_controller
+        self.clock = clock
+        self.command_delay = command_delay
+        self.turn_speed = turn_speed
+        self.forward_speed = forward_speed
+        self.sensor_period = sensor_period
+        self.navigator = None
+        self.plants = []
+        self.front_sensor = UltrasonicModel()
+        self.back_sensor = UltrasonicModel(offset=math.pi)
+        self.front_sensor_value = None
+        self.back_sensor_value = None
+        self.commands = 0
+        self.__until = None       # Time at which the current timed motion ends
+        self.__on_done = None     # Called when it does
+        self.__next_sample = 0
+
+    def advance(self, dt):
+        self.robot.step(dt)
+
+        if self.__until is not None and self.clock.time() >= self.__until:
+            self.__until = None
+            self.robot.set_speeds(0, 0)
+            on_done, self.__on_done = self.__on_done, None
+            if on_done is not None:
+                on_done()
+
+        if self.clock.time() >= self.__next_sample:
+            self.__next_sample = self.clock.time() + self.sensor_period
+            front = self.front_sensor.read(self.robot, self.plants)
+            back = self.back_sensor.read(self.robot, self.plants)
+            self.front_sensor_value = (self.front_sensor_value or [2550] * 4)[1:] + [front]
+            self.back_sensor_value = (self.back_sensor_value or [2550] * 4)[1:] + [back]
+
+    def __command(self, left, right, duration=None, on_done=None, delay=True):
+        self.commands += 1
+        self.robot.set_speeds(left, right)
+        self.__until = None if duration is None else self.clock.time() + duration
+        self.__on_done = on_done
+        if delay:
+            self.clock.sleep(self.command_delay)
+
+    def __turn(self, deg, direction):
+        if deg < 0:
+            self.__command(-direction * self.turn_speed, direction * self.turn_speed)
+            return
+        rate = 2 * self.robot.wheel_velocity(self.turn_speed) / self.robot.track_width
+        self.__command(-direction * self.turn_speed, direction * self.turn_speed, math.radians(int(deg)) / rate,
+                       lambda: self.navigator.on_turn_complete("done"))
+
+    def turn_left(self, deg):
+        self.__turn(deg, 1)
+
+    def turn_right(self, deg):
+        self.__turn(deg, -1)
+
+    def go_forward(self, forward_time=-1):
+        self.__command(self.forward_speed, self.forward_speed)
+
+    def go_backward(self, backup_time=-1):
+        self.__command(-self.forward_speed, -self.forward_speed)
+
+    def set_speed(self, left, right):
+        self.__command(left, right, delay=False)
+
+    def stop(self):
+        self.__command(0, 0)
+
+    def random_walk(self):
+        self.__command(-50, 50)
+
+    random = random_walk
+
+    def retry_approach(self):
+        self.robot_controller.retrying_approach = True
+
+        def done():
+            self.robot_controller.retrying_approach = False
+
+        self.__command(-self.forward_speed, -self.forward_speed, 2, done)
+
+
+def run_scenario(mode, distance, bearing, fps=8, timeout=60, seed=0):
+    """
+    Follows a single plant until it is found or the timeout expires.
+    :param mode:        Navigator steering mode
+    :param distance:    Initial distance to the plant in metres
+    :param bearing:     Initial bearing of the plant in radians, positive to the left
+    :param fps:         Vision frame rate
+    :param timeout:     Virtual seconds after which the scenario counts as failed
+    :param seed:        Seed of the detection jitter
+    :return:            Tuple (time_to_approach or None, command rate in commands per second)
+    """
+    clock = VirtualClock()
+    robot = DifferentialDrive()
+    robot_controller = BenchRobotController(clock)
+    motors = BenchMotorController(robot, robot_controller, clock)
+    motors.plants = [(distance * math.cos(bearing), distance * math.sin(bearing), PLANT_RADIUS)]
+    camera = CameraModel(rng=random.Random(seed))
+    clock.on_advance = motors.advance
+
+    real_time = navigator_module.time
+    navigator_module.time = clock
+    try:
+        navigator = Navigator(robot_controller, steering_mode=mode, remote_motor_controller=motors)
+        motors.navigator = navigator
+        clock.sleep(motors.sensor_period)
+
+        while robot_controller.found_at is None and clock.time() < timeout:
+            predictions = []
+            for x, y, _ in motors.plants:
+                prediction = camera.project(*bearing_to(robot, x, y))
+                if prediction is not None:
+                    predictions.append(prediction)
+
+            navigator.on_new_frame(predictions)
+            clock.sleep(1 / fps)
+    finally:
+        navigator_module.time = real_time
+
+    return robot_controller.found_at, motors.commands / clock.time()
+
+
+def load_trace(path):
+    """
+    :param path:    JSON lines file of plant bounding boxes
+    :return:        List of (distance, bearing) scenarios
+    """
+    camera = CameraModel()
+    with open(path) as f:
+        return [camera.unproject(json.loads(line)) for line in f if line.strip()]
+
+
+def main():
+    log.basicConfig(level=log.WARNING)
+
+    if len(sys.argv) > 1:
+        scenarios = load_trace(sys.argv[1])
+    else:
+        scenarios = [(d, math.radians(b)) for d in DISTANCES for b in BEARINGS]
+
+    print("{:>8} {:>8} | {:>18} | {:>18}".format("dist", "bearing", "discrete", "continuous"))
+    results = {"discrete": [], "continuous": []}
+    for seed, (distance, bearing) in enumerate(scenarios):
+        row = []
+        for mode in ("discrete", "continuous"):
+            found_at, rate = run_scenario(mode, distance, bearing, seed=seed)
+            results[mode].append((found_at, rate))
+            row.append("{:>7} {:>5.2f} cmd/s".format("-" if found_at is None else "{:.1f}s".format(found_at), rate))
+        print("{:>7.2f}m {:>7.1f}° | {} | {}".format(distance, math.degrees(bearing), *row))
+
+    for mode, runs in results.items():
+        times = [t for t, _ in runs if t is not None]
+        print("{}: {}/{} approached, mean time-to-approach {}, mean command rate {:.2f} cmd/s".format(
+            mode, len(times), len(runs),
+            "{:.1f}s".format(statistics.mean(times)) if times else "-",
+            statistics.mean(rate for _, rate in runs)))
+
+
+if __name__ == "__main__":
+    main()
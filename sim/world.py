@@ -0,0 +1,112 @@
+import math
+from collections import namedtuple
+
+from sim.camera import bearing_to
+from sim.kinematics import DifferentialDrive
+
+Plant = namedtuple("Plant", ["plant_id", "x", "y", "radius"])
+Obstacle = namedtuple("Obstacle", ["x", "y", "radius"])
+
+
+class World:
+    """
+    Rectangular 2D area with plants carrying QR codes, round obstacles and the robot.
+
+    The robot is a circle which cannot pass through plants, obstacles or the walls. A motion ending inside one is
+    cancelled, the wheels keep turning against it, like the real robot stalling against a pot.
+    """
+
+    def __init__(self, width=4.0, height=4.0, plants=(), obstacles=(), robot=None, robot_radius=0.1):
+        """
+        Constructor for World class.
+        :param width:           Extent along x in metres, the area starts at the origin
+        :param height:          Extent along y in metres
+        :param plants:          List of Plant
+        :param obstacles:       List of Obstacle
+        :param robot:           DifferentialDrive, one in the centre of the area if None
+        :param robot_radius:    Collision radius of the robot in metres
+        """
+        self.width = width
+        self.height = height
+        self.plants = list(plants)
+        self.obstacles = list(obstacles)
+        self.robot = robot if robot is not None else DifferentialDrive(width / 2, height / 2)
+        self.robot_radius = robot_radius
+        self.bounds = (0.0, 0.0, width, height)
+        self.collisions = 0         # Number of times the robot ran into something
+        self.contact_time = 0.0     # Seconds spent pushing against something
+        self.distance = 0.0         # Metres travelled
+        self.__touching = False
+
+    @staticmethod
+    def generate(rng, plants=4, obstacles=3, width=4.0, height=4.0, clearance=0.5):
+        """
+        Builds a random world.
+        :param rng:         random.Random used for placement
+        :param plants:      Number of plants, numbered from 1
+        :param obstacles:   Number of obstacles
+        :param width:       Extent along x in metres
+        :param height:      Extent along y in metres
+        :param clearance:   Minimum free space between any two objects, the robot and the walls in metres
+        :return:            World
+        """
+        world = World(width, height)
+        taken = [(world.robot.x, world.robot.y, world.robot_radius)]
+
+        def place(radius):
+            for _ in range(1000):
+                x = rng.uniform(clearance + radius, width - clearance - radius)
+                y = rng.uniform(clearance + radius, height - clearance - radius)
+                if all(math.hypot(x - ox, y - oy) >= radius + r + clearance for ox, oy, r in taken):
+                    taken.append((x, y, radius))
+                    return x, y
+            raise ValueError("Not enough room for {} plants and {} obstacles".format(plants, obstacles))
+
+        for plant_id in range(1, plants + 1):
+            world.plants.append(Plant(plant_id, *place(0.075), 0.075))
+        for _ in range(obstacles):
+            radius = rng.uniform(0.1, 0.2)
+            world.obstacles.append(Obstacle(*place(radius), radius))
+
+        world.robot.heading = rng.uniform(-math.pi, math.pi)
+        return world
+
+    def circles(self):
+        """
+        :return:    List of (x, y, radius) of everything the robot can bump into
+        """
+        return [(p.x, p.y, p.radius) for p in self.plants] + [(o.x, o.y, o.radius) for o in self.obstacles]
+
+    def visible(self, max_range, half_fov):
+        """
+        :param max_range:   Distance in metres
+        :param half_fov:    Half the field of view in radians
+        :return:            List of (object, distance, bearing) in view of the robot, nearest first
+        """
+        seen = []
+        for thing in self.plants + self.obstacles:
+            distance, bearing = bearing_to(self.robot, thing.x, thing.y)
+            if distance <= max_range and abs(bearing) <= half_fov:
+                seen.append((thing, distance, bearing))
+        return sorted(seen, key=lambda s: s[1])
+
+    def collides(self, x, y):
+        r = self.robot_radius
+        if not (r <= x <= self.width - r and r <= y <= self.height - r):
+            return True
+        return any(math.hypot(x - cx, y - cy) < r + cr for cx, cy, cr in self.circles())
+
+    def step(self, dt):
+        robot = self.robot
+        x, y = robot.x, robot.y
+        robot.step(dt)
+
+        if self.collides(robot.x, robot.y):
+            robot.x, robot.y = x, y
+            self.contact_time += dt
+            if not self.__touching:
+                self.collisions += 1
+            self.__touching = True
+        else:
+            self.__touching = False
+            self.distance += math.hypot(robot.x - x, robot.y - y)
@@ -0,0 +1,183 @@
+"""
+Concurrent start up of subsystems with explicit dependencies.
+
+Every subsystem is built on a thread of its own as soon as the subsystems it depends on are ready, so loading the
+network onto the VPU, opening the serial port and starting the EV3 websocket servers overlap instead of adding up.
+Each subsystem has a readiness event, code that needs one waits on it rather than polling for an attribute:
+
+    startup = Startup()
+    startup.add("navigator", build_navigator)
+    startup.add("vision", build_vision)
+    startup.add("driving", start_vision_loop, depends=("navigator", "vision"))
+    startup.start()
+    startup.wait("navigator")           # Blocks until built, raises StartupError if it failed
+    startup.join()                      # Waits for every subsystem and logs the timeline
+
+A subsystem whose build raises fails, and so do the subsystems depending on it, without being built.
+"""
+import logging as log
+import threading
+import time
+
+from metrics import registry
+
+
+class StartupError(Exception):
+    """
+    Raised when waiting on a subsystem that failed to start.
+    """
+
+
+class Subsystem:
+    """
+    A subsystem started by Startup.
+    """
+
+    def __init__(self, name, build, depends):
+        """
+        Constructor for Subsystem class.
+        :param name:    Name of the subsystem
+        :param build:   Function building it, its return value is the subsystem's value
+        :param depends: Names of the subsystems to be ready before it is built
+        """
+        self.name = name
+        self.build = build
+        self.depends = tuple(depends)
+        self.ready = threading.Event()  # Set once built or failed
+        self.value = None
+        self.error = None
+        self.started = None             # Seconds after Startup.start when the build began
+        self.finished = None            # Seconds after Startup.start when it ended
+
+
+class Startup:
+    """
+    Builds subsystems concurrently in dependency order.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        """
+        Constructor for Startup class.
+        :param clock:   Function returning monotonic seconds
+        """
+        self.clock = clock
+        self.subsystems = {}
+        self.__start = None
+
+    def add(self, name, build, depends=()):
+        """
+        :param name:    Name of the subsystem
+        :param build:   Function building it, its return value is the subsystem's value
+        :param depends: Names of the subsystems to be ready before it is built, added before or after it
+        :return:        self
+        """
+        if name in self.subsystems:
+            raise ValueError("Subsystem {} added twice".format(name))
+        self.subsystems[name] = Subsystem(name, build, depends)
+        return self
+
+    def start(self):
+        """
+        Starts building every subsystem added.
+        :return:    self
+        """
+        for subsystem in self.subsystems.values():
+            missing = [name for name in subsystem.depends if name not in self.subsystems]
+            if missing:
+                raise ValueError("Subsystem {} depends on unknown {}".format(subsystem.name, ", ".join(missing)))
+            # Subsystems depending on each other would wait for each other forever
+            self.__check_cycle(subsystem.name, [])
+
+        self.__start = self.clock()
+        for subsystem in self.subsystems.values():
+            threading.Thread(target=self.__run, args=(subsystem,), name="startup-" + subsystem.name,
+                             daemon=True).start()
+        return self
+
+    def __check_cycle(self, name, path):
+        if name in path:
+            raise ValueError("Subsystems depend on each other: {}".format(" > ".join(path + [name])))
+        for dependency in self.subsystems[name].depends:
+            self.__check_cycle(dependency, path + [name])
+
+    def __run(self, subsystem):
+        try:
+            for name in subsystem.depends:
+                dependency = self.subsystems[name]
+                dependency.ready.wait()
+                if dependency.error is not None:
+                    raise StartupError("{} failed to start".format(name))
+
+            subsystem.started = self.clock() - self.__start
+            log.debug("[STARTUP] Starting %s", subsystem.name)
+            subsystem.value = subsystem.build()
+        except Exception as e:
+            subsystem.error = e
+            if isinstance(e, StartupError):
+                log.error("[STARTUP] %s not started: %s", subsystem.name, e)
+            else:
+                log.exception("[STARTUP] %s failed to start", subsystem.name)
+        finally:
+            subsystem.finished = self.clock() - self.__start
+            if subsystem.error is None:
+                registry.gauge("growbot_startup_seconds", "Time from start up to a subsystem being ready",
+                               subsystem=subsystem.name).set(subsystem.finished)
+            subsystem.ready.set()
+
+    def ready(self, name):
+        """
+        :param name:    Name of a subsystem
+        :return:        threading.Event set once it is built or failed
+        """
+        return self.subsystems[name].ready
+
+    def is_ready(self, name):
+        """
+        :param name:    Name of a subsystem
+        :return:        True if it was built successfully
+        """
+        subsystem = self.subsystems[name]
+        return subsystem.ready.is_set() and subsystem.error is None
+
+    def wait(self, name, timeout=None):
+        """
+        :param name:    Name of a subsystem
+        :param timeout: Seconds to wait at most, None to wait until it is ready
+        :return:        Its value
+        """
+        subsystem = self.subsystems[name]
+        if not subsystem.ready.wait(timeout):
+            raise StartupError("{} not ready within {}s".format(name, timeout))
+        if subsystem.error is not None:
+            raise StartupError("{} failed to start".format(name)) from subsystem.error
+        return subsystem.value
+
+    def join(self, timeout=None):
+        """
+        Waits for every subsystem to be ready or failed, then logs the timeline.
+        :param timeout: Seconds to wait at most, None to wait until all are
+        :return:        True if every subsystem started
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        for subsystem in self.subsystems.values():
+            remaining = None if deadline is None else max(0, deadline - self.clock())
+            if not subsystem.ready.wait(remaining):
+                log.warning("[STARTUP] %s not ready within %ss", subsystem.name, timeout)
+                return False
+        self.log_timeline()
+        return all(subsystem.error is None for subsystem in self.subsystems.values())
+
+    def log_timeline(self):
+        """
+        Logs when each subsystem started and was ready, relative to start, earliest first.
+        :return:
+        """
+        done = [subsystem for subsystem in self.subsystems.values() if subsystem.finished is not None]
+        for subsystem in sorted(done, key=lambda s: (s.started if s.started is not None else s.finished, s.finished)):
+            if subsystem.error is not None:
+                log.info("[STARTUP] %-12s failed at %6.2fs", subsystem.name, subsystem.finished)
+            else:
+                log.info("[STARTUP] %-12s %6.2fs to %6.2fs (%.2fs)", subsystem.name, subsystem.started,
+                         subsystem.finished, subsystem.finished - subsystem.started)
+        if done:
+            log.info("[STARTUP] Done after %.2fs", max(subsystem.finished for subsystem in done))
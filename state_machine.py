@@ -0,0 +1,109 @@
+"""
+Table driven finite state machine with timeouts, used by Navigator.
+
+Transitions are declared up front as (source, event, target, guard, action). Handling an event runs the action of
+the first transition from the current state whose guard accepts the event's arguments. States may have a timeout,
+which fires a "timeout" event once the machine has been in the state that long. Timeouts are checked on a monotonic
+clock whenever an event is handled or poll() is called, so no thread is needed to fire them and the behaviour doesn't
+depend on how often events arrive.
+"""
+import logging as log
+import time
+from collections import deque, namedtuple
+
+ANY = "*"
+TIMEOUT = "timeout"
+
+Transition = namedtuple("Transition", ["source", "event", "target", "guard", "action"])
+Transition.__new__.__defaults__ = (None, None)
+Transition.__doc__ = """
+Transition of a StateMachine.
+:param source:  State the transition leaves, a tuple of states, or ANY
+:param event:   Event name triggering it
+:param target:  State entered, None to stay in the current state without re-entering it
+:param guard:   Function of the event arguments returning whether the transition applies, always if None
+:param action:  Function of the event arguments run when the transition is taken
+"""
+
+TransitionRecord = namedtuple("TransitionRecord", ["time", "source", "event", "target"])
+
+
+class StateMachine:
+    """
+    Finite state machine over a fixed transition table. Not thread safe, events must be handled by one thread at a
+    time.
+    """
+
+    def __init__(self, initial, transitions, timeouts=None, clock=None, history=256, on_transition=None, name="fsm"):
+        """
+        Constructor for StateMachine class.
+        :param initial:         Initial state
+        :param transitions:     Iterable of Transition, tried in order
+        :param timeouts:        Dictionary of state to seconds after which a TIMEOUT event is handled in it
+        :param clock:           Function returning monotonic seconds, time.monotonic if None
+        :param history:         Number of state changes kept in log
+        :param on_transition:   Called with the TransitionRecord of every state change
+        :param name:            Name used in log messages
+        """
+        self.transitions = list(transitions)
+        self.timeouts = dict(timeouts or {})
+        self.clock = clock if clock is not None else time.monotonic
+        self.on_transition = on_transition
+        self.name = name
+        self.log = deque(maxlen=history)
+        self.state = initial
+        self.previous = None        # State left by the last transition taken, available to its action
+        self.entered = self.clock()
+        self.__table = {}
+        for transition in self.transitions:
+            sources = transition.source if isinstance(transition.source, tuple) else (transition.source,)
+            for source in sources:
+                self.__table.setdefault((source, transition.event), []).append(transition)
+
+    def elapsed(self):
+        """
+        :return:    Seconds spent in the current state
+        """
+        return self.clock() - self.entered
+
+    def poll(self):
+        """
+        Fires the timeout of the current state if it expired.
+        :return:    True if a transition was taken
+        """
+        timeout = self.timeouts.get(self.state)
+        if timeout is None or self.clock() - self.entered < timeout:
+            return False
+        return self.__dispatch(TIMEOUT, ())
+
+    def handle(self, event, *args):
+        """
+        Handles an event after firing any expired timeout.
+        :param event:   Event name
+        :param args:    Passed to guards and actions
+        :return:        True if a transition was taken, False if the event was ignored in the current state
+        """
+        self.poll()
+        return self.__dispatch(event, args)
+
+    def __dispatch(self, event, args):
+        candidates = self.__table.get((self.state, event), []) + self.__table.get((ANY, event), [])
+        for transition in candidates:
+            if transition.guard is not None and not transition.guard(*args):
+                continue
+
+            source = self.previous = self.state
+            if transition.target is not None and transition.target != source:
+                self.state = transition.target
+                self.entered = self.clock()
+                record = TransitionRecord(self.entered, source, event, transition.target)
+                self.log.append(record)
+                log.info("[%s] %s -(%s)-> %s", self.name, source, event, transition.target)
+                if self.on_transition is not None:
+                    self.on_transition(record)
+
+            if transition.action is not None:
+                transition.action(*args)
+            return True
+
+        return False
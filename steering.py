@@ -0,0 +1,77 @@
+import logging as log
+
+
+class SteeringController:
+    """
+    Proportional-integral-derivative steering for continuous plant following.
+
+    Every frame the horizontal offset of the plant from the frame centre becomes a differential between the wheel
+    speeds, while the forward speed is reduced as the plant's bounding box grows, so the robot curves onto the plant
+    and slows down on approach instead of alternating between turning and driving.
+    """
+
+    def __init__(self,
+                 kp=250,
+                 ki=0,
+                 kd=40,
+                 base_speed=150,
+                 min_speed=40,
+                 max_speed=300,
+                 slowdown_area=0.3,
+                 integral_limit=0.5):
+        """
+        Constructor for SteeringController class.
+        :param kp:              Proportional gain, wheel speed difference per unit of normalised error
+        :param ki:              Integral gain
+        :param kd:              Derivative gain
+        :param base_speed:      Forward speed with a distant plant, in tacho counts per second
+        :param min_speed:       Lowest forward speed while following
+        :param max_speed:       Wheel speed limit
+        :param slowdown_area:   Bounding box to frame area ratio at which the forward speed reaches min_speed
+        :param integral_limit:  Anti-windup bound of the error integral
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.base_speed = base_speed
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.slowdown_area = slowdown_area
+        self.integral_limit = integral_limit
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the controller history, call when the followed plant changes or following stops.
+        :return:
+        """
+        self.last_error = None
+        self.last_time = None
+        self.integral = 0
+
+    def update(self, error, area_ratio, now):
+        """
+        Computes wheel speeds for a new observation.
+        :param error:       Plant midpoint offset from the frame centre, normalised to [-1, 1], positive to the right
+        :param area_ratio:  Bounding box area divided by frame area
+        :param now:         Observation time in seconds
+        :return:            Tuple (left_speed, right_speed) in tacho counts per second, positive is forwards
+        """
+        derivative = 0
+        if self.last_time is not None and now > self.last_time:
+            dt = now - self.last_time
+            derivative = (error - self.last_error) / dt
+            self.integral = max(-self.integral_limit, min(self.integral_limit, self.integral + error * dt))
+        self.last_error = error
+        self.last_time = now
+
+        turn = self.kp * error + self.ki * self.integral + self.kd * derivative
+        forward = max(self.min_speed, self.base_speed * (1 - area_ratio / self.slowdown_area))
+
+        left = max(-self.max_speed, min(self.max_speed, forward + turn))
+        right = max(-self.max_speed, min(self.max_speed, forward - turn))
+
+        log.debug("[SteeringController] error={:.3f} area={:.3f} left={:.0f} right={:.0f}".format(
+            error, area_ratio, left, right))
+
+        return int(left), int(right)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+"""
+Latency tracing from camera capture to motor actuation.
+
+Every frame gets a trace ID when it is captured. The ID is bound to the thread handling the frame, stamped on any
+command the frame causes, and bound again on the EV3 while the command executes, so each stage can record a span
+under it without passing the ID around. Spans go to a fixed-size ring buffer and are exported on demand as Chrome
+trace JSON (chrome://tracing or ui.perfetto.dev) or as per-stage latency histograms.
+
+Tracing is off unless enabled, and then every call returns right away.
+
+Spans are stamped with each device's wall clock, so stages running on the Pi and on the EV3 only line up if both
+clocks are in sync. Run NTP on both, e.g. with the EV3 syncing to the Pi, before merging their dumps: whatever the
+clocks are apart goes straight into the end-to-end latency.
+
+Usage: python tracing.py trace.json [more.json ...]
+    Merges trace dumps, e.g. of the Pi and the EV3, and prints per-stage and end-to-end latency histograms.
+"""
+import functools
+import itertools
+import json
+import logging as log
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from rpc_dispatch import LatencyHistogram
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "stage", "trace_id", "start")
+
+    def __init__(self, tracer, stage, trace_id):
+        self.tracer = tracer
+        self.stage = stage
+        self.trace_id = trace_id
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.stage, self.start, time.time(), self.trace_id)
+        return False
+
+
+class _Context:
+    __slots__ = ("local", "trace_id", "previous")
+
+    def __init__(self, local, trace_id):
+        self.local = local
+        self.trace_id = trace_id
+
+    def __enter__(self):
+        self.previous = getattr(self.local, "trace_id", None)
+        self.local.trace_id = self.trace_id
+        return self
+
+    def __exit__(self, *exc):
+        self.local.trace_id = self.previous
+        return False
+
+
+class Tracer:
+    """
+    Records spans (stage, start, end, trace ID, thread) into a ring buffer.
+    """
+
+    def __init__(self, process="pi", capacity=2**16, enabled=False):
+        """
+        Constructor for Tracer class.
+        :param process:     Name of this process in exported traces
+        :param capacity:    Number of spans kept, older ones are overwritten
+        :param enabled:     Whether spans are recorded
+        """
+        self.process = process
+        self.enabled = enabled
+        # Appending to a bounded deque is atomic, so recording needs no lock
+        self.__spans = deque(maxlen=capacity)
+        self.__ids = itertools.count(1)
+        self.__local = threading.local()
+
+    def enable(self, process=None):
+        if process is not None:
+            self.process = process
+        self.enabled = True
+
+    def new_id(self):
+        """
+        :return:    Fresh trace ID, None while disabled
+        """
+        if not self.enabled:
+            return None
+        # Qualified with the process so IDs stay unique when traces of several processes are merged
+        return "{}:{}".format(self.process, next(self.__ids))
+
+    def current(self):
+        """
+        :return:    Trace ID bound to the calling thread, None if there is none
+        """
+        if not self.enabled:
+            return None
+        return getattr(self.__local, "trace_id", None)
+
+    def context(self, trace_id):
+        """
+        Binds a trace ID to the calling thread for the duration of a with block.
+        :param trace_id:    Trace ID, None binds nothing
+        """
+        if not self.enabled or trace_id is None:
+            return _NO_SPAN
+        return _Context(self.__local, trace_id)
+
+    def span(self, stage, trace_id=None):
+        """
+        Records the duration of a with block as a stage.
+        :param stage:       Stage name
+        :param trace_id:    Trace ID, the one bound to the thread if None
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, stage, trace_id if trace_id is not None else self.current())
+
+    def traced(self, stage):
+        """
+        Decorator recording every call of a function as a stage.
+        :param stage:   Stage name
+        """
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.span(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def record(self, stage, start, end, trace_id=None):
+        """
+        Records a span measured elsewhere.
+        :param stage:       Stage name
+        :param start:       Start as time.time()
+        :param end:         End as time.time()
+        :param trace_id:    Trace ID, the one bound to the thread if None
+        """
+        if not self.enabled:
+            return
+        if trace_id is None:
+            trace_id = self.current()
+        thread = threading.current_thread()
+        self.__spans.append((stage, start, end, trace_id, thread.ident, thread.name))
+
+    def clear(self):
+        self.__spans.clear()
+
+    def spans(self):
+        """
+        :return:    Recorded spans, oldest first
+        """
+        return list(self.__spans)
+
+    def chrome_trace(self):
+        """
+        :return:    Recorded spans in the Chrome trace event format
+        """
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.process}}]
+        threads = {}
+
+        for stage, start, end, trace_id, tid, thread_name in self.spans():
+            threads[tid] = thread_name
+            events.append({
+                "name": stage,
+                "cat": "pipeline",
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": {"trace_id": trace_id},
+            })
+
+        for tid, thread_name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path=None):
+        """
+        Writes the Chrome trace of the recorded spans to a file.
+        :param path:    Output file, trace-<process>-<time>.json if None
+        :return:        Path written
+        """
+        if path is None:
+            path = "trace-{}-{}.json".format(self.process, int(time.time()))
+        with open(path, mode="w") as f:
+            json.dump(self.chrome_trace(), f)
+        log.info("[TRACE] Wrote {} spans to {}".format(len(self.__spans), path))
+        return path
+
+    def histograms(self):
+        """
+        :return:    Dictionary of stage name to LatencyHistogram, see histograms_from_events
+        """
+        return histograms_from_events(self.chrome_trace()["traceEvents"])
+
+
+def histograms_from_events(events):
+    """
+    Builds latency histograms from Chrome trace events.
+    :param events:  Chrome trace events as produced by Tracer.chrome_trace
+    :return:        Dictionary of stage name to LatencyHistogram, plus "capture_to_actuation" from the first start of
+                    every trace ID that reached the motors, in the process that issued the ID, to the start of its first
+                    firmware stage. With dumps of the Pi and the EV3 merged this spans two clocks, which have to be in
+                    sync, see the module docstring
+    """
+    histograms = {}
+    starts = {}
+    actuations = {}
+    processes = {event["pid"]: event["args"]["name"] for event in events
+                 if event.get("ph") == "M" and event["name"] == "process_name"}
+
+    for event in events:
+        if event.get("ph") != "X":
+            continue
+        histograms.setdefault(event["name"], LatencyHistogram()).observe(event["dur"] / 1000)
+
+        trace_id = event["args"].get("trace_id")
+        if trace_id is None:
+            continue
+        if event["name"].startswith("firmware:"):
+            actuations[trace_id] = min(actuations.get(trace_id, event["ts"]), event["ts"])
+        elif processes.get(event.get("pid"), trace_id.split(":")[0]) == trace_id.split(":")[0]:
+            # Started by stages of the process whose frame it is, on that device's clock
+            starts[trace_id] = min(starts.get(trace_id, event["ts"]), event["ts"])
+
+    end_to_end = histograms["capture_to_actuation"] = LatencyHistogram()
+    early = 0
+    for trace_id, actuated in actuations.items():
+        if trace_id not in starts:
+            continue
+        early += actuated < starts[trace_id]
+        end_to_end.observe((actuated - starts[trace_id]) / 1000)
+    if early:
+        log.warning("[TRACE] %d of %d traces reached the motors before their capture, are the clocks of the Pi and "
+                    "the EV3 in sync?", early, len(actuations))
+
+    return histograms
+
+
+def format_histograms(histograms):
+    """
+    :param histograms:  Dictionary of name to LatencyHistogram
+    :return:            Human readable table, one line per histogram
+    """
+    lines = []
+    for name, histogram in sorted(histograms.items()):
+        snapshot = histogram.snapshot()
+        if snapshot["count"] == 0:
+            continue
+        buckets = " ".join("<={}:{}".format(bound, count)
+                           for bound, count in snapshot["buckets"].items() if count)
+        lines.append("{:32} n={:<6} mean={:8.2f}ms  {}".format(
+            name, snapshot["count"], snapshot["sum"] / snapshot["count"], buckets))
+    return "\n".join(lines)
+
+
+def install_dump_signal(tracer, signum=None):
+    """
+    Dumps the Chrome trace and logs the histograms whenever the process receives signum, SIGUSR1 by default.
+    Call from the main thread.
+    :param tracer:  Tracer to dump
+    :param signum:  Signal number
+    :return:
+    """
+    import signal
+
+    def handler(*_):
+        tracer.dump()
+        log.info("[TRACE] Latencies:\n{}".format(format_histograms(tracer.histograms())))
+
+    signal.signal(signum if signum is not None else signal.SIGUSR1, handler)
+
+
+# Shared by every module of a process, enabled from config.TRACE
+tracer = Tracer()
+
+
+def main():
+    events = []
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            events.extend(json.load(f)["traceEvents"])
+
+    print(format_histograms(histograms_from_events(events)))
+
+
+if __name__ == "__main__":
+    main()
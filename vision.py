@@ -0,0 +1,588 @@
+"""
+Detector runtime shared by every model: grabs frames, runs them through the network on the MYRIAD X VPU two inference
+requests at a time, and hands the detections to the RobotController. What is specific to a model, reading its output
+blobs, is left to an adapter from detectors.py.
+
+Frames can come from several named cameras, e.g. "front" and "rear". They share the two inference requests, taking
+turns by weighted round robin, and their detections are handed over tagged with the camera's name.
+"""
+import cv2
+import time
+import logging as log
+import sys
+import threading
+import datetime
+import numpy as np
+import asyncio
+import copy
+from collections import namedtuple
+
+
+import crops
+from detectors import SSDAdapter, to_predictions
+from frame_source import FrameSource
+from metrics import registry
+from network_cache import NetworkCache
+from offload import offload, encode_stream, PoolFull, STREAM, DEBUG
+from tracing import tracer
+from recording import recorder
+
+
+InferenceRequest = namedtuple("InferenceRequest", ["request_id", "camera", "captured", "trace_id", "inf_start",
+                                                   "inferred", "planned"])
+InferenceRequest.__doc__ = """
+A frame on its way through one of the inference requests.
+:param request_id:  Inference request it went to
+:param camera:      Camera it comes from
+:param captured:    Frame as read from the camera's FrameSource
+:param trace_id:    Trace identifier following it through the pipeline
+:param inf_start:   time.time() when its inference started
+:param inferred:    Whether it was run through the detector, False if MotionGate skipped it
+:param planned:     Crops inferred on after the frame
+"""
+
+
+class Camera:
+    """
+    A frame source Vision infers on, with what Vision keeps per camera.
+    """
+
+    def __init__(self, name, source, weight=1, motion_gate=None):
+        """
+        Constructor for Camera class.
+        :param name:        Name the camera's detections are tagged with, e.g. "front" or "rear"
+        :param source:      FrameSource of the camera, not started yet
+        :param weight:      Turns the camera gets on the inference requests relative to the others
+        :param motion_gate: MotionGate of its own deciding which of its frames to run inference on, every frame if None
+        """
+        self.name = name
+        self.source = source
+        self.weight = weight
+        self.motion_gate = motion_gate
+        self.credit = 0                 # Weighted round robin state, see Vision.next_camera
+        self.width = None
+        self.height = None
+        self.tiles = []
+        self.regions = []               # Plants, and plant candidates, of the last frame parsed to crop around
+        self.last_predictions = []      # Stand in for frames not run through the detector
+
+        self.frames = registry.counter("growbot_vision_camera_frames_total", "Frames run through the detector",
+                                       camera=name)
+        self.skipped = registry.counter("growbot_vision_frames_skipped_total",
+                                        "Frames not run through the detector because the scene was static",
+                                        camera=name)
+        self.latency_ms = registry.histogram("growbot_vision_latency_ms",
+                                             "Time from a frame being grabbed to its detections being handed over "
+                                             "in ms", camera=name)
+
+
+class Vision:
+    def __init__(self,
+                model_xml,
+                model_bin,
+                robot_controller,
+                is_headless = True,
+                live_stream = True,
+                confidence_interval = 0.5,
+                draw_alignment_info = True,
+                save_video = True,
+                frame_source = None,
+                motion_gate = None,
+                crop_count = 0,
+                crop_tiles = (2, 2),
+                candidate_interval = 0.2,
+                adapter = None,
+                camera_weights = None,
+                network_cache = None):
+        """
+        Vision class constructor.
+        :param model_xml:           Network topology
+        :param model_bin:           Network weights
+        :param robot_controller:    RobotController handed the detections of every frame, None to only log plants
+        :param is_headless:         Headless mode flag, if set to true, frames will not be displayed
+        :param live_stream:         Live streaming flag, if set to true, frames will be send through websocket
+        :param confidence_interval: Confidence interval for predictions. Only predictions above this value will be
+                                    processed
+        :param frame_source:        FrameSource to read frames from, one on camera 0 if None, or a dict of
+                                    FrameSources by camera name. The first is the main camera, the only one whose
+                                    frames are shown, streamed, saved and recorded. Started here
+        :param motion_gate:         MotionGate deciding which frames to run inference on, every frame if None. Copied
+                                    for every camera after the first
+        :param crop_count:          Crops of the frame inferred on in the same batch as the frame, see crops.py
+        :param crop_tiles:          (columns, rows) of the tiles filling batch slots not needed around plants
+        :param candidate_interval:  Confidence above which plants not confident enough to be processed get a crop
+        :param adapter:             Adapter decoding the network's output, see detectors.py. SSDAdapter if None
+        :param camera_weights:      Dict of the turns each camera gets on the inference requests by name, 1 each if
+                                    None. {"front": 3, "rear": 1} infers on three front frames for every rear one
+        :param network_cache:       Directory of compiled networks, see network_cache.py. None to compile the network
+                                    on every start
+        """
+        # log.basicConfig(format="[ %(asctime)s ] [ %(levelname)s ] %(message)s", level=log.INFO, stream=sys.stdout)
+        log.info("Instantiating Vision class...")
+        self.started = time.monotonic()
+        self.first_inference = None     # Seconds from the start to the first detections handed over
+
+        # Websocket endpoint for live streaming
+        ws_endpoint = "wss://api.growbot.tardis.ed.ac.uk/stream-video/35ae6830-d961-4a9c-937f-8aa5bc61d6a3"
+
+        self.is_headless = is_headless
+        self.confidence_interval = confidence_interval
+        self.live_stream = live_stream
+        self.robot_controller = robot_controller
+        self.draw_alignment_info = draw_alignment_info
+        self.save_video = save_video
+        # Predictions are only drawn on frames leaving the process
+        self.annotate = not is_headless or live_stream or save_video
+        self.candidate_interval = candidate_interval
+        self.adapter = adapter if adapter is not None else SSDAdapter()
+
+        self.frame_counter = 0
+
+        # The Pi's runtime is imported here, the simulation and the benchmarks use Vision's methods without it
+        from openvino.inference_engine import IENetwork, IEPlugin
+        try:
+            from openvino.inference_engine import IECore
+        except ImportError:
+            # Before OpenVINO 2019 R3 networks can't be exported, they are compiled on every start
+            IECore = None
+        from imutils.video import FPS
+
+        # Initialize network
+        log.info("Reading Intermediate Representation...")
+        self.net = IENetwork(model=model_xml, weights=model_bin)
+
+        # Crops are batched with the frame, which takes a fixed batch size on the MYRIAD
+        if crop_count:
+            self.net.batch_size = 1 + crop_count
+
+        if network_cache is not None and IECore is not None:
+            # Import the network compiled on an earlier start
+            log.info("Loading Intermediate Representation through the network cache...")
+            self.exec_net = NetworkCache(network_cache).load(IECore(), self.net, model_xml, model_bin, "MYRIAD",
+                                                             num_requests=2)
+        else:
+            # Initialize plugin
+            log.info("Initializing plugin for MYRIAD X VPU...")
+            self.plugin = IEPlugin(device='MYRIAD')
+
+            # Load network into IE plugin
+            log.info("Loading Intermediate Representation to the plugin...")
+            load_start = time.monotonic()
+            self.exec_net = self.plugin.load(network=self.net, num_requests=2)
+            registry.gauge("growbot_vision_network_load_seconds", "Time the network took to load onto the device",
+                           source="compiled").set(time.monotonic() - load_start)
+
+        # Everything about the network decoding its output needs, the per-frame work is left with the arithmetic
+        self.plan = self.adapter.plan(self.net)
+        self.input_blob = self.plan.input_blob
+        self.n, self.c, self.h, self.w = self.plan.input_shape
+
+        # Start grabbing frames, the first read waits for the camera to warm up
+        if frame_source is None:
+            frame_source = FrameSource()
+        sources = frame_source if isinstance(frame_source, dict) else {"front": frame_source}
+        weights = camera_weights if camera_weights is not None else {}
+        self.cameras = []
+        for name, source in sources.items():
+            gate = motion_gate if not self.cameras or motion_gate is None else copy.copy(motion_gate)
+            camera = Camera(name, source.start(), weights.get(name, 1), gate)
+            # Get capture dimensions
+            camera.width, camera.height = source.width, source.height
+            camera.tiles = crops.tile_grid(int(camera.width), int(camera.height), *crop_tiles)
+            self.cameras.append(camera)
+        self.source = self.cameras[0].source
+
+        # Initialize FPS counter
+        self.fps = FPS()
+
+        # Get capture dimensions of the main camera
+        self.initial_w = self.source.width
+        self.initial_h = self.source.height
+
+        # Used to provide OpenCV rendering time
+        self.render_time = 0
+
+        # Future of the frame being encoded for the live stream
+        self.streaming = None
+
+        # Initialize websocket
+        if self.live_stream:
+            from websocket import create_connection
+            log.info("Connecting to websocket...")
+            self.ws = create_connection(ws_endpoint)
+
+    def start(self):
+        """
+        Starts video capture and performs inference using MYRIAD X VPU. Frames of every camera take turns on the two
+        inference requests, one inferring while the other's detections are parsed
+        :return:
+        """
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.fps.start()
+
+        log.info("Starting video stream. Press ESC to stop.")
+
+        cameras = list(self.cameras)
+
+        # The request whose detections are handed over next, None before the first frame
+        cur = None
+        next_request_id = 0
+
+        frames = registry.counter("growbot_vision_frames_total", "Frames run through the detector")
+        fps = registry.gauge("growbot_vision_fps", "Detector frame rate of every camera together, smoothed over about "
+                                                   "ten frames")
+        inference_ms = registry.histogram("growbot_vision_inference_ms", "Wait for an inference request in ms")
+        parse_ms = registry.histogram("growbot_vision_parse_ms", "Parsing of detector output in ms")
+        last_frame = None
+        frame_interval = None
+
+        while cameras:
+            try:
+                self.fps.update()
+
+                # Read the newest frame of the camera whose turn it is
+                camera = self.next_camera(cameras)
+                captured = camera.source.read()
+
+                # Drop a camera that failed to read, stop once none is left
+                if captured is None:
+                    log.error("No frame from the %s camera, dropping it", camera.name)
+                    cameras.remove(camera)
+                    continue
+                next_trace_id = tracer.new_id()
+                # From the camera handing the frame over to it being read, in wall clock time like every span
+                now = time.time()
+                tracer.record("capture", now - (time.monotonic() - captured.timestamp), now, next_trace_id)
+
+                # Skip inference on frames that can't change what the robot does
+                next_inferred = (camera.motion_gate is None or self.robot_controller is None
+                                 or camera.motion_gate.should_infer(captured.image,
+                                                                    still=self.robot_controller.is_still(),
+                                                                    needed=self.robot_controller.detections_needed()))
+
+                # Main synchronization point. Start the next inference request,
+                # while waiting for the current one to complete.
+                inf_start = time.time()
+
+                planned = []
+                if next_inferred:
+                    # Resize, change layout, reshape to fit network input size and start asynchronous inference
+                    in_frame, planned = self.prepare_input(captured.image, camera)
+                    self.exec_net.start_async(request_id=next_request_id, inputs={self.input_blob: in_frame})
+                else:
+                    camera.skipped.inc()
+                nxt = InferenceRequest(next_request_id, camera, captured, next_trace_id, inf_start, next_inferred,
+                                       planned)
+
+                if cur is not None:
+                    if cur.inferred:
+                        if self.exec_net.requests[cur.request_id].wait(-1) == 0:
+                            # Capture inference time
+                            inf_end = time.time()
+                            det_time = inf_end - inf_start
+                            inference_ms.observe(det_time * 1000)
+                        tracer.record("inference", cur.inf_start, time.time(), cur.trace_id)
+                    self.hand_over(cur, parse_ms)
+
+                    if cur.inferred:
+                        frames.inc()
+                        cur.camera.frames.inc()
+                        now = time.time()
+                        if last_frame is not None:
+                            interval = now - last_frame
+                            frame_interval = (interval if frame_interval is None
+                                              else 0.9 * frame_interval + 0.1 * interval)
+                            if frame_interval > 0:
+                                fps.set(1 / frame_interval)
+                        last_frame = now
+
+                # Swap async request identifiers
+                next_request_id = cur.request_id if cur is not None else 1
+                cur = nxt
+
+                # Enable key detection in output window
+                key = cv2.waitKey(1)
+
+                # Check if ESC has been pressed
+                if key == 27:
+                    self.cleanup()
+                    break
+
+            # Catch ctrl+c while in headless mode
+            except KeyboardInterrupt:
+                self.cleanup()
+                break
+
+    def hand_over(self, request, parse_ms):
+        """
+        Parses the detections of a request and hands them to the RobotController, then shows, streams or saves the
+        frame if it is the main camera's.
+        :param request:     InferenceRequest whose frame is handed over, its inference complete
+        :param parse_ms:    Histogram of the parsing time
+        :return:
+        """
+        camera = request.camera
+        frame = request.captured.image
+        main = camera is self.cameras[0]
+
+        # Before predictions are drawn on it
+        if main:
+            recorder.frame(frame)
+
+        with tracer.context(request.trace_id):
+            if request.inferred:
+                # Parse detection results of the request
+                with tracer.span("parse"):
+                    parse_start = time.time()
+                    outputs = self.exec_net.requests[request.request_id].outputs
+                    predictions = self.parse_output(outputs, request.planned, camera)
+                    parse_ms.observe((time.time() - parse_start) * 1000)
+                self.log_predictions(predictions)
+                camera.last_predictions = predictions
+                if self.first_inference is None:
+                    self.first_inference = time.monotonic() - self.started
+                    log.info("[VISION] First inference %.2fs after start", self.first_inference)
+                    registry.gauge("growbot_vision_startup_seconds",
+                                   "Time from Vision starting up to the first detections handed over"
+                                   ).set(self.first_inference)
+            else:
+                predictions = camera.last_predictions
+            if self.robot_controller is not None:
+                self.robot_controller.process_visual_data(predictions, frame, camera.name)
+        camera.latency_ms.observe((time.monotonic() - request.captured.timestamp) * 1000)
+
+        # Display frame
+        if main and self.annotate:
+            for label, prob, pred_boxpts in predictions:
+                self.visualise_prediction(frame, pred_boxpts, label, prob)
+            self.process_frame(frame)
+            # TODO: Fix live stream
+            #threading.Thread(target=self.process_frame, args=(frame,)).start()
+
+    @staticmethod
+    def next_camera(cameras):
+        """
+        Smooth weighted round robin, every camera gets turns in proportion to its weight, spread out evenly.
+        :param cameras: Cameras taking turns
+        :return:        Camera whose turn it is
+        """
+        total = 0
+        chosen = None
+        for camera in cameras:
+            camera.credit += camera.weight
+            total += camera.weight
+            if chosen is None or camera.credit > chosen.credit:
+                chosen = camera
+        chosen.credit -= total
+        return chosen
+
+    def prepare_input(self, frame, camera):
+        """
+        Builds the network input for a frame, followed by its crops if the batch has room for them.
+        :param frame:   Frame to be inferred on
+        :param camera:  Camera it comes from
+        :return:        Tuple of the input blob and the list of Crop after the frame in it
+        """
+        planned = crops.plan(int(camera.width), int(camera.height), camera.regions, self.n - 1, camera.tiles)
+        images = [frame] + [frame[crop.ymin:crop.ymax, crop.xmin:crop.xmax] for crop in planned]
+        # Slots no crop is planned for get the frame again, the batch size is fixed
+        images += [frame] * (self.n - len(images))
+
+        # Change data layout from HWC to CHW
+        in_frame = np.stack([cv2.resize(image, (self.w, self.h)).transpose((2, 0, 1)) for image in images])
+        return in_frame, planned
+
+    def parse_output(self, outputs, planned, camera):
+        """
+        :param outputs: Output blobs of a request by name
+        :param planned: Crops inferred on after the frame
+        :param camera:  Camera the frame comes from
+        :return:        Predictions in frame coordinates, list of (label, confidence, ((xmin, ymin), (xmax, ymax)))
+                        with the box in pixels
+        """
+        if not planned:
+            rows = self.adapter.decode(self.plan, outputs, self.confidence_interval)
+            # Only the frame's own detections, the rest of the batch is padding
+            return to_predictions(self.plan, rows[rows[:, 0] == 0], camera.width, camera.height)
+
+        rows = self.adapter.decode(self.plan, outputs, self.candidate_interval)
+        rows = crops.collect(rows, planned, camera.width, camera.height, self.candidate_interval)
+        rows = np.array(rows, dtype=float).reshape(-1, 7)
+
+        # Plants, even those too uncertain to act on, get a closer look in the frame after next. Small ones first, as
+        # they gain the most
+        plants = rows[self.plan.is_plant(rows)]
+        plants = plants[np.argsort((plants[:, 5] - plants[:, 3]) * (plants[:, 6] - plants[:, 4]), kind="stable")]
+        boxes = (plants[:, 3:7] * (camera.width, camera.height, camera.width, camera.height)).tolist()
+        camera.regions = [((box[0], box[1]), (box[2], box[3])) for box in boxes]
+
+        return to_predictions(self.plan, rows[rows[:, 2] > self.confidence_interval], camera.width, camera.height)
+
+    def get_frame(self):
+        """
+        Returns single frame from video capture.
+        :return:    Single frame
+        """
+        frame = self.source.read().image
+
+        try:
+            return offload.submit(STREAM, encode_stream, frame).result()
+        except PoolFull:
+            # Asked for once, unlike the stream which just skips a frame
+            log.warning("[VISION] Stream lane full, encoding the frame inline")
+            return encode_stream(frame)
+
+    def process_frame(self, frame):
+        """
+        Based on constructor parameters, displays and/or sends frame through websocket.
+        :param frame:   Frame to be processed
+        :return:
+        """
+        self.draw_info(frame)
+
+        # Send frame if specified
+        if self.live_stream:
+            self.stream_frame(frame)
+
+        # Display frame if specified
+        if not self.is_headless:
+            render_start = time.time()
+
+            cv2.imshow("Detection Results", frame)
+
+            render_end = time.time()
+            self.render_time = render_end - render_start
+
+        if self.save_video:
+            n = str(self.frame_counter).zfill(10)
+            # Frames the offload pool has no room for aren't saved
+            offload.submit(DEBUG, cv2.imwrite, "/home/student/capture/frame_"+n+".jpg", frame)
+            self.frame_counter = self.frame_counter + 1
+
+    def stream_frame(self, frame):
+        """
+        Sends the frame the offload pool encoded last, and hands it this one. The stream runs a frame behind, and
+        skips frames while the pool is still encoding, so the loop never waits for JPEG encoding.
+        :param frame:   Frame to be streamed, not drawn on any more
+        :return:
+        """
+        if self.streaming is not None:
+            if not self.streaming.done():
+                return
+            try:
+                data = self.streaming.result()
+            except Exception as e:
+                log.warning("[VISION] Could not encode a frame for the stream: %s", e)
+            else:
+                log.info("Sending frame...")
+                self.ws.send(data)
+        self.streaming = offload.submit(STREAM, encode_stream, frame)
+
+    def draw_info(self, frame):
+        now = datetime.datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+        state = self.robot_controller.get_state() if self.robot_controller is not None else ""
+
+        # Draw title/logo
+        cv2.putText(frame,
+                    "GrowBot Vision System",
+                    (25, 25),
+                    cv2.FONT_HERSHEY_DUPLEX,
+                    .75,
+                    (0, 150, 0),
+                    1,
+                    cv2.LINE_AA)
+
+        # Draw current date
+        cv2.putText(frame,
+                    now,
+                    (25, 50),
+                    cv2.FONT_HERSHEY_DUPLEX,
+                    .5,
+                    (0, 150, 0),
+                    1,
+                    cv2.LINE_AA)
+
+        # Draw state
+        cv2.putText(frame,
+                    state,
+                    (25, 75),
+                    cv2.FONT_HERSHEY_DUPLEX,
+                    .5,
+                    (0, 150, 0),
+                    1,
+                    cv2.LINE_AA)
+
+
+    def visualise_prediction(self, frame, pred_boxpts, label, prob):
+        """
+        Draws bounding box and class probability around prediction.
+        :param frame:       Frame that contains prediction
+        :param pred_boxpts: Bounding box coordinates
+        :param label:       Class label
+        :param prob:        Class probability
+        :return:
+        """
+        # Draw bounding box and class label
+        color = (0, 255, 0) if label == "Plant" else (0, 0, 255)
+        cv2.rectangle(frame, pred_boxpts[0], pred_boxpts[1], color, 2)
+        cv2.putText(frame,
+                    label + ' ' + str(round(prob * 100, 1)) + ' %',
+                    (pred_boxpts[0][0], pred_boxpts[0][1] - 7),
+                    cv2.FONT_HERSHEY_DUPLEX,
+                    0.5,
+                    color,
+                    1)
+
+        if self.draw_alignment_info:
+            # Draw triangle in the centre of the frame.
+            frame_centre = 320
+
+            pts_centre = np.array([[frame_centre - 10, 480],
+                                    [frame_centre, 430],
+                                    [frame_centre + 10, 480]],
+                                    np.int32).reshape((-1, 1, 2))
+            cv2.polylines(frame,[pts_centre],True,(255,0,0))
+
+            if label == "Plant":
+                # Draw triangle indicating midpoint of the bounding box.
+                ((xmin, ymin), (xmax, ymax)) = pred_boxpts
+
+                midpoint = (xmax + xmin) / 2
+
+                pts_bb_midpoint = np.array([[midpoint - 10, 480],
+                                            [midpoint, 430],
+                                            [midpoint + 10, 480]],
+                                            np.int32).reshape((-1, 1, 2))
+                cv2.polylines(frame,[pts_bb_midpoint],True,(0,255,0))
+
+                # Draw centre acceptance interval.
+                delta = min(120, int(6 / (((xmax - xmin) * (ymax - ymin)) / (640*480))))
+                cv2.rectangle(frame, (320-delta, 0), (320+delta, 480), (153,255,255), 1)
+
+
+    @staticmethod
+    def log_predictions(predictions):
+        """
+        Logs the plants among the predictions of a frame.
+        :param predictions: Predictions as returned by parse_output
+        :return:
+        """
+        for label, prob, pred_boxpts in predictions:
+            if label == "Plant":
+                log.info("Prediction: %s, confidence=%.4f, boxpoints=%s", label, prob, pred_boxpts)
+
+    def cleanup(self):
+        """
+        Performs cleanup before termination.
+        :return:
+        """
+        for camera in self.cameras:
+            camera.source.stop()
+
+        if self.live_stream:
+            self.ws.close()
+
+        if not self.is_headless:
+            cv2.destroyAllWindows()
+
+        self.fps.stop()